@@ -1,159 +1,78 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from flask_cors import CORS
 import sqlite3
-import hashlib
+import atexit
+import io
+import math
 import secrets
 from datetime import datetime
 import os
 
+import catalog
+import catalog_cache
+import db
+import facets
+import import_products
+import instrumentation
+import migrate_db
+import orders
+import passwords
+import rate_limit
+import replica
+import responses
+import rollups
+import seed
+import write_behind
+from db import get_db
+
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
+# Every worker process must sign sessions with the same key
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
 CORS(app)
 
-# Database initialization
-def init_db():
-    conn = sqlite3.connect('music_store.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        is_admin INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    # Products table
-    c.execute('''CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        category TEXT NOT NULL,
-        brand TEXT NOT NULL,
-        price REAL NOT NULL,
-        description TEXT,
-        specifications TEXT,
-        image_url TEXT,
-        rating REAL DEFAULT 5.0,
-        stock INTEGER DEFAULT 10,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    # Orders table
-    c.execute('''CREATE TABLE IF NOT EXISTS orders (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        total_amount REAL,
-        status TEXT DEFAULT 'pending',
-        payment_method TEXT,
-        delivery_address TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )''')
-    
-    # Order items table
-    c.execute('''CREATE TABLE IF NOT EXISTS order_items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        order_id INTEGER,
-        product_id INTEGER,
-        quantity INTEGER,
-        price REAL,
-        FOREIGN KEY (order_id) REFERENCES orders (id),
-        FOREIGN KEY (product_id) REFERENCES products (id)
-    )''')
-    
-    # Sales tracking table
-    c.execute('''CREATE TABLE IF NOT EXISTS sales_tracking (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER,
-        quantity_sold INTEGER DEFAULT 0,
-        total_revenue REAL DEFAULT 0,
-        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (product_id) REFERENCES products (id),
-        UNIQUE(product_id)
-    )''')
-    
-    # Add missing columns to orders table if they don't exist
+# Database bootstrap
+def bootstrap():
+    """
+    Bring the database schema up to date. On a current database this is a
+    schema version check and nothing else, so worker start stays cheap;
+    sample data lives in seed.py.
+    """
+    conn = db.connect()
     try:
-        c.execute("PRAGMA table_info(orders)")
-        columns = [col[1] for col in c.fetchall()]
+        # Schema lives in versioned migrations; this is a no-op once current
+        migrate_db.migrate(conn)
         
-        if 'payment_method' not in columns:
-            c.execute('ALTER TABLE orders ADD COLUMN payment_method TEXT DEFAULT "cash_on_delivery"')
+        # Replay sales bookkeeping a crashed write-behind worker never applied
+        write_behind.catch_up(conn)
         
-        if 'delivery_address' not in columns:
-            c.execute('ALTER TABLE orders ADD COLUMN delivery_address TEXT DEFAULT ""')
-    except Exception as e:
-        print(f"Column migration note: {e}")
-    
-    # Create admin user
-    admin_password = hashlib.sha256('admin123'.encode()).hexdigest()
-    try:
-        c.execute('INSERT INTO users (username, email, password, is_admin) VALUES (?, ?, ?, ?)',
-                  ('admin', 'admin@musicstore.com', admin_password, 1))
-    except sqlite3.IntegrityError:
-        pass
-    
-    # Sample products
-    sample_products = [
-        ('Fender Stratocaster Electric Guitar', 'Guitars', 'Fender', 1299.99, 
-         'Iconic electric guitar with versatile tone', 'Alder body, Maple neck, 3 single-coil pickups', 
-         'https://images.unsplash.com/photo-1564186763535-ebb21ef5277f?w=500', 4.8, 15),
-        ('Yamaha P-125 Digital Piano', 'Pianos & Keyboards', 'Yamaha', 649.99,
-         'Portable digital piano with authentic piano touch', '88 weighted keys, 24 voices, USB connectivity',
-         'https://images.unsplash.com/photo-1520523839897-bd0b52f945a0?w=500', 4.7, 8),
-        ('Pearl Export Drum Kit', 'Drums', 'Pearl', 899.99,
-         'Complete 5-piece drum set for beginners and pros', '5 drums, hardware included, birch shells',
-         'https://images.unsplash.com/photo-1519892300165-cb5542fb47c7?w=500', 4.6, 5),
-        ('Stentor Violin Student II', 'Violins', 'Stentor', 299.99,
-         'Quality student violin with bow and case', 'Solid carved top, ebony fittings, includes case',
-         'https://images.unsplash.com/photo-1612225330812-0e9e10f03a83?w=500', 4.5, 12),
-        ('Yamaha YFL-222 Flute', 'Flutes', 'Yamaha', 549.99,
-         'Professional student flute with excellent tone', 'Nickel silver, offset G, E mechanism',
-         'https://images.unsplash.com/photo-1598030886674-c92be74e237b?w=500', 4.9, 7),
-        ('Pioneer DJ DDJ-400', 'DJ Equipment', 'Pioneer', 249.99,
-         '2-channel DJ controller for beginners', 'Rekordbox compatible, built-in sound card',
-         'https://images.unsplash.com/photo-1598653222000-6b7b7a552625?w=500', 4.7, 10),
-        ('Shure SM58 Microphone', 'Accessories', 'Shure', 99.99,
-         'Legendary vocal microphone', 'Dynamic, cardioid, rugged construction',
-         'https://images.unsplash.com/photo-1590602847861-f357a9332bbc?w=500', 5.0, 25),
-        ('Boss Katana-50 Amplifier', 'Accessories', 'Boss', 229.99,
-         '50-watt guitar amplifier with effects', '5 amp characters, built-in effects, USB',
-         'https://images.unsplash.com/photo-1514320291840-2e0a9bf2a9ae?w=500', 4.8, 6),
-        ('Gibson Les Paul Standard', 'Guitars', 'Gibson', 2499.99,
-         'Legendary electric guitar with premium tone', 'Mahogany body, AAA maple top, humbuckers',
-         'https://images.unsplash.com/photo-1516924962500-2b4b3b99ea02?w=500', 4.9, 3),
-        ('Roland TD-17KVX V-Drums', 'Drums', 'Roland', 1699.99,
-         'Electronic drum kit with mesh heads', 'Premium sound module, bluetooth audio',
-         'https://images.unsplash.com/photo-1571327073757-71d13c24de30?w=500', 4.8, 4),
-        ('Korg SV-2 Stage Piano', 'Pianos & Keyboards', 'Korg', 1999.99,
-         '88-key stage piano with vintage sounds', 'Weighted hammer action, tube-driven preamp',
-         'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=500', 4.7, 5),
-        ('D\'Addario Guitar Strings Pack', 'Accessories', 'D\'Addario', 19.99,
-         '3-pack of premium guitar strings', 'Nickel wound, 10-46 gauge, long life',
-         'https://images.unsplash.com/photo-1556449895-a33c9dba33dd?w=500', 4.6, 50)
-    ]
-    
-    for product in sample_products:
-        try:
-            c.execute('''INSERT INTO products 
-                (name, category, brand, price, description, specifications, image_url, rating, stock)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', product)
-        except sqlite3.IntegrityError:
-            pass
-    
-    conn.commit()
-    conn.close()
+        # Migration 3 leaves the search index out on SQLite builds without
+        # FTS5; add it once this build has FTS5
+        if not catalog.has_search_index(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                catalog.ensure_search_index(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+
+# Runs once per process; under serve.py or gunicorn's preload, once in the master
+bootstrap()
+
+# Connections come from the pool in db.py and are returned on teardown
+db.init_app(app)
 
-# Initialize database on startup
-init_db()
+# Opt-in request profiling: Server-Timing headers, /metrics, slow-query log
+instrumentation.init_app(app)
 
-# Helper function to get db connection
-def get_db():
-    conn = sqlite3.connect('music_store.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# Flush pending write-behind sales bookkeeping on a clean shutdown
+if write_behind.ENABLED:
+    atexit.register(write_behind.queue.stop)
+
+# Stop the password hashing processes with the server process
+atexit.register(passwords.pool.shutdown)
 
 # Routes
 @app.route('/')
@@ -199,48 +118,110 @@ def profile():
     return render_template('profile.html')
 
 # API Routes
+def product_listing(args):
+    """
+    Response cache key and builder for a product listing request. Shared
+    with the async catalog handlers in asgi.py.
+    """
+    # category and brand may repeat: ?brand=Fender&brand=Gibson matches either
+    filters = {
+        'category': catalog.filter_values(args.getlist('category')),
+        'brand': catalog.filter_values(args.getlist('brand')),
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'min_rating': args.get('min_rating', type=float),
+        'in_stock': args.get('in_stock', '').lower() in ('1', 'true', 'yes'),
+        'search': args.get('search', ''),
+    }
+    sort = args.get('sort')
+    fields = args.get('fields')
+    limit = args.get('limit', type=int)
+    cursor = args.get('cursor')
+    with_facets = args.get('facets', '').lower() in ('1', 'true', 'yes')
+    
+    # Paginated callers get an envelope; a bare call keeps the full list
+    paginate = limit is not None or cursor is not None or with_facets
+    if paginate and limit is None:
+        limit = catalog.DEFAULT_PAGE_SIZE
+    
+    # Served from the catalog cache; SQLite is only hit on a miss
+    key = catalog_cache.listing_key(filters, sort, fields, limit, cursor)
+    
+    def build():
+        products, next_cursor = catalog_cache.cache.get_listing(
+            key, lambda: catalog.list_products(
+                get_db(), filters, sort=sort, fields=fields, limit=limit, cursor=cursor))
+        if not paginate:
+            return products
+        result = {'products': products, 'next_cursor': next_cursor}
+        if with_facets:
+            # Counts over every matching product, not just this page
+            result['facets'] = facets.index.counts(get_db(), filters)
+        return result
+    
+    return ('products', key, with_facets), build
+
+def product_detail(product_id):
+    """Response cache key and builder for one product; the builder returns None if it is gone"""
+    def build():
+        return catalog_cache.cache.get_product(
+            product_id, lambda pid: catalog.get_product(get_db(), pid))
+    
+    return ('product', product_id), build
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    conn = get_db()
-    category = request.args.get('category')
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    search = request.args.get('search', '')
-    
-    query = 'SELECT * FROM products WHERE 1=1'
-    params = []
-    
-    if category and category != 'all':
-        query += ' AND category = ?'
-        params.append(category)
-    
-    if min_price:
-        query += ' AND price >= ?'
-        params.append(min_price)
-    
-    if max_price:
-        query += ' AND price <= ?'
-        params.append(max_price)
-    
-    if search:
-        query += ' AND (name LIKE ? OR brand LIKE ?)'
-        params.extend([f'%{search}%', f'%{search}%'])
-    
-    products = conn.execute(query, params).fetchall()
-    conn.close()
-    
-    return jsonify([dict(p) for p in products])
+    key, build = product_listing(request.args)
+    try:
+        return responses.cached_json(key, catalog_cache.cache.version, build)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
-    conn = get_db()
-    product = conn.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
-    conn.close()
+    key, build = product_detail(product_id)
+    response = responses.cached_json(key, catalog_cache.cache.version, build)
     
-    if product:
-        return jsonify(dict(product))
+    if response:
+        return response
     return jsonify({'error': 'Product not found'}), 404
 
+@app.route('/api/products/batch', methods=['POST'])
+def get_products_batch():
+    # Current price and stock for a cart's items in one round trip
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if (not isinstance(ids, list)
+            or not all(isinstance(pid, int) and not isinstance(pid, bool) for pid in ids)):
+        return jsonify({'error': 'ids must be a list of product ids'}), 400
+    if len(ids) > catalog.MAX_LOOKUP_IDS:
+        return jsonify({'error': f'At most {catalog.MAX_LOOKUP_IDS} ids per request'}), 400
+    
+    ids = list(dict.fromkeys(ids))
+    found = catalog_cache.cache.get_products(
+        ids, lambda missing: catalog.get_products(get_db(), missing))
+    products = []
+    for pid in ids:
+        if pid in found:
+            product = {field: found[pid][field] for field in catalog.LOOKUP_FIELDS}
+            product['available'] = (product['stock'] or 0) > 0
+            products.append(product)
+    
+    return jsonify({
+        'products': products,
+        'missing': [pid for pid in ids if pid not in found]
+    })
+
+def too_many_attempts(wait):
+    response = jsonify({'error': 'Too many attempts, try again later'})
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response, 429
+
+def hashing_busy():
+    response = jsonify({'error': 'Server busy, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.json
@@ -248,17 +229,22 @@ def register():
     email = data.get('email')
     password = data.get('password')
     
-    if not all([username, email, password]):
+    if not all(isinstance(value, str) and value for value in (username, email, password)):
         return jsonify({'error': 'All fields required'}), 400
     
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
+    wait = rate_limit.auth_by_ip.take(request.remote_addr)
+    if wait:
+        return too_many_attempts(wait)
+    try:
+        hashed_password = passwords.create(password)
+    except passwords.Busy:
+        return hashing_busy()
     
     try:
         conn = get_db()
         conn.execute('INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
                     (username, email, hashed_password))
         conn.commit()
-        conn.close()
         return jsonify({'message': 'Registration successful'}), 201
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Username or email already exists'}), 400
@@ -269,17 +255,31 @@ def api_login():
     username = data.get('username')
     password = data.get('password')
     
-    if not all([username, password]):
+    if not all(isinstance(value, str) and value for value in (username, password)):
         return jsonify({'error': 'All fields required'}), 400
     
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
+    # Refuse bursts before doing any hashing work. The username bucket is
+    # per client IP too, so nobody can lock an account out from elsewhere
+    account = (username.lower(), request.remote_addr)
+    wait = (rate_limit.auth_by_ip.take(request.remote_addr)
+            or rate_limit.login_by_username.take(account))
+    if wait:
+        return too_many_attempts(wait)
     
     conn = get_db()
-    user = conn.execute('SELECT * FROM users WHERE username = ? AND password = ?',
-                       (username, hashed_password)).fetchone()
-    conn.close()
-    
-    if user:
+    user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+    try:
+        valid, new_hash = passwords.verify(user['password'] if user else None, password)
+    except passwords.Busy:
+        return hashing_busy()
+    
+    if valid:
+        if new_hash:
+            # Move the account off its outdated hash now that we know the password
+            conn.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                         (new_hash, user['id'], user['password']))
+            conn.commit()
+        rate_limit.login_by_username.reset(account)
         session['user_id'] = user['id']
         session['username'] = user['username']
         session['is_admin'] = user['is_admin']
@@ -323,50 +323,27 @@ def create_order():
     
     try:
         conn = get_db()
+        order_id, total_amount = orders.place_order(
+            conn, user_id, items, payment_method, delivery_address,
+            track_sales=not write_behind.ENABLED)
+        if write_behind.ENABLED:
+            write_behind.queue.notify(order_id)
         
-        # Calculate total
-        total_amount = sum(item['price'] * item['quantity'] for item in items)
-        
-        # Create order
-        cursor = conn.cursor()
-        cursor.execute('''INSERT INTO orders (user_id, total_amount, payment_method, delivery_address, status)
-                         VALUES (?, ?, ?, ?, ?)''',
-                       (user_id, total_amount, payment_method, delivery_address, 'pending'))
-        order_id = cursor.lastrowid
-        
-        # Add order items and update inventory
-        for item in items:
-            product_id = item['id']
-            quantity = item['quantity']
-            price = item['price']
-            
-            # Add to order items
-            cursor.execute('''INSERT INTO order_items (order_id, product_id, quantity, price)
-                             VALUES (?, ?, ?, ?)''',
-                           (order_id, product_id, quantity, price))
-            
-            # Update product stock
-            cursor.execute('UPDATE products SET stock = stock - ? WHERE id = ?',
-                          (quantity, product_id))
-            
-            # Update sales tracking
-            cursor.execute('''INSERT INTO sales_tracking (product_id, quantity_sold, total_revenue)
-                             VALUES (?, ?, ?)
-                             ON CONFLICT(product_id) DO UPDATE SET
-                             quantity_sold = quantity_sold + ?,
-                             total_revenue = total_revenue + ?,
-                             last_updated = CURRENT_TIMESTAMP''',
-                          (product_id, quantity, price * quantity, quantity, price * quantity))
-        
-        conn.commit()
-        conn.close()
+        # Stock moved; which filters a product matches only changes when
+        # it sold out, dropping it from in-stock listings and counts
+        product_ids = list(orders.normalize_items(items))
+        sold_out = facets.index.refresh(conn, product_ids)
+        catalog_cache.cache.invalidate(product_ids, membership_changed=bool(sold_out))
         
         return jsonify({
             'message': 'Order created successfully',
             'order_id': order_id,
+            'total_amount': total_amount,
             'status': 'pending'
         }), 201
     
+    except orders.OrderError as e:
+        return jsonify({'error': str(e), 'items': e.details}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -385,7 +362,6 @@ def get_order(order_id):
     items = conn.execute('''SELECT oi.*, p.name, p.image_url FROM order_items oi
                             JOIN products p ON oi.product_id = p.id
                             WHERE oi.order_id = ?''', (order_id,)).fetchall()
-    conn.close()
     
     return jsonify({
         'order': dict(order),
@@ -398,12 +374,30 @@ def get_user_orders():
         return jsonify({'error': 'Not logged in'}), 401
     
     conn = get_db()
-    orders = conn.execute('''SELECT * FROM orders WHERE user_id = ? 
-                             ORDER BY created_at DESC''',
-                         (session['user_id'],)).fetchall()
-    conn.close()
+    user_orders = conn.execute('''SELECT * FROM orders WHERE user_id = ? 
+                                  ORDER BY created_at DESC''',
+                              (session['user_id'],)).fetchall()
+    
+    return jsonify([dict(order) for order in user_orders])
+
+@app.route('/api/user/orders/history', methods=['GET'])
+def get_order_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
     
-    return jsonify([dict(order) for order in orders])
+    conn = get_db()
+    try:
+        history, next_cursor = orders.order_history(
+            conn, session['user_id'],
+            status=request.args.get('status'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            limit=request.args.get('limit', orders.DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'orders': history, 'next_cursor': next_cursor})
 
 @app.route('/api/user/orders/<int:order_id>/items', methods=['GET'])
 def get_order_items(order_id):
@@ -422,38 +416,152 @@ def get_order_items(order_id):
     items = conn.execute('''SELECT oi.*, p.name, p.image_url, p.brand FROM order_items oi
                             JOIN products p ON oi.product_id = p.id
                             WHERE oi.order_id = ?''', (order_id,)).fetchall()
-    conn.close()
     
     return jsonify([dict(item) for item in items])
 
+def report_version():
+    """Cache version for report responses: catalog writes and replica refreshes change it"""
+    return (catalog_cache.cache.version, db.reporting_version(),
+            write_behind.queue.generation)
+
 @app.route('/api/admin/sales-data', methods=['GET'])
 def get_sales_data():
     if 'user_id' not in session or not session.get('is_admin'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    conn = get_db()
-    sales = conn.execute('''SELECT st.*, p.name, p.category FROM sales_tracking st
-                            JOIN products p ON st.product_id = p.id
-                            ORDER BY st.quantity_sold DESC''').fetchall()
-    conn.close()
+    def build():
+        sales = db.get_report_db().execute('''SELECT st.*, p.name, p.category FROM sales_tracking st
+                                    JOIN products p ON st.product_id = p.id
+                                    ORDER BY st.quantity_sold DESC''').fetchall()
+        return [dict(row) for row in sales]
     
-    return jsonify([dict(row) for row in sales])
+    # Sales only move with checkout and product edits, which bump the
+    # version, or with a replica refresh when reports read the replica
+    return responses.cached_json('sales-data', report_version(), build,
+                                 responses.ADMIN_CACHE_CONTROL)
 
 @app.route('/api/admin/inventory', methods=['GET'])
 def get_inventory():
     if 'user_id' not in session or not session.get('is_admin'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    conn = get_db()
-    products = conn.execute('''SELECT p.id, p.name, p.category, p.stock, p.price,
-                              COALESCE(st.quantity_sold, 0) as sold,
-                              COALESCE(st.total_revenue, 0) as revenue
-                              FROM products p
-                              LEFT JOIN sales_tracking st ON p.id = st.product_id
-                              ORDER BY p.name''').fetchall()
-    conn.close()
+    def build():
+        products = db.get_report_db().execute('''SELECT p.id, p.name, p.category, p.stock, p.price,
+                                      COALESCE(st.quantity_sold, 0) as sold,
+                                      COALESCE(st.total_revenue, 0) as revenue
+                                      FROM products p
+                                      LEFT JOIN sales_tracking st ON p.id = st.product_id
+                                      ORDER BY p.name''').fetchall()
+        return [dict(row) for row in products]
+    
+    return responses.cached_json('inventory', report_version(), build,
+                                 responses.ADMIN_CACHE_CONTROL)
+
+@app.route('/api/admin/sales-summary', methods=['GET'])
+def get_sales_summary():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    return jsonify([dict(row) for row in products])
+    try:
+        date_from = orders.parse_date(request.args.get('from'))
+        date_to = orders.parse_date(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    date_from = date_from and date_from[:10]
+    date_to = date_to and date_to[:10]
+    category = request.args.get('category')
+    
+    def build():
+        conn = db.get_report_db()
+        return {
+            'totals': rollups.totals(conn),
+            'daily': rollups.daily_series(conn, date_from, date_to, category),
+            'categories': rollups.category_totals(conn, date_from, date_to),
+        }
+    
+    # Reads O(days) rollup rows; checkout bumps the version, so no staleness
+    key = ('sales-summary', date_from, date_to, category)
+    return responses.cached_json(key, report_version(), build,
+                                 responses.ADMIN_CACHE_CONTROL)
+
+@app.route('/api/admin/analytics', methods=['GET'])
+def get_analytics():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    args = request.args
+    try:
+        start = orders.parse_date(args.get('from'))
+        end = orders.parse_date(args.get('to'), end_of_day=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    top = args.get('top', rollups.DEFAULT_TOP)
+    if not str(top).isdigit():
+        return jsonify({'error': f'Invalid top: {top}'}), 400
+    top = int(top)
+    bucket = args.get('bucket', 'day')
+    group_by = args.get('group_by') or None
+    metric = args.get('metric', 'revenue')
+    
+    def build():
+        result = rollups.analytics(db.get_report_db(), bucket, start, end, group_by, metric, top)
+        result.update({'bucket': bucket, 'group_by': group_by, 'metric': metric,
+                       'from': args.get('from'), 'to': args.get('to')})
+        return result
+    
+    key = ('analytics', bucket, start, end, group_by, metric, top)
+    try:
+        return responses.cached_json(key, report_version(), build,
+                                     responses.ADMIN_CACHE_CONTROL)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/admin/db-stats', methods=['GET'])
+def get_db_stats():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(db.pool.stats())
+
+@app.route('/api/admin/replica-stats', methods=['GET'])
+def get_replica_stats():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(replica.status())
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+def get_cache_stats():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    stats = catalog_cache.cache.stats()
+    stats['responses'] = responses.cache.stats()
+    stats['write_behind'] = write_behind.queue.stats()
+    stats['facets'] = facets.index.stats()
+    stats['password_hashing'] = passwords.pool.stats()
+    stats['rate_limits'] = {'auth_by_ip': rate_limit.auth_by_ip.stats(),
+                            'login_by_username': rate_limit.login_by_username.stats()}
+    return jsonify(stats)
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+def get_slow_queries():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'enabled': instrumentation.ENABLED,
+        'threshold_ms': instrumentation.SLOW_QUERY_MS,
+        'queries': instrumentation.metrics.slow_queries()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus scrape target; only served while instrumentation is on
+    if not instrumentation.ENABLED:
+        return jsonify({'error': 'Instrumentation is off; set MUSIC_STORE_INSTRUMENT=1'}), 404
+    
+    return Response(instrumentation.metrics.render(), content_type=instrumentation.CONTENT_TYPE)
 
 # Admin API Routes
 @app.route('/api/admin/products', methods=['POST'])
@@ -468,14 +576,19 @@ def add_product():
         return jsonify({'error': 'Missing required fields'}), 400
     
     conn = get_db()
-    conn.execute('''INSERT INTO products 
-        (name, category, brand, price, description, specifications, image_url, stock)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-        (data['name'], data['category'], data['brand'], data['price'],
-         data['description'], data.get('specifications', ''),
-         data['image_url'], data.get('stock', 10)))
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.execute('''INSERT INTO products 
+            (name, category, brand, price, description, specifications, image_url, stock)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            (data['name'], data['category'], data['brand'], data['price'],
+             data['description'], data.get('specifications', ''),
+             data['image_url'], data.get('stock', 10)))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify({'error': 'A product with this brand and name already exists'}), 409
+    facets.index.product_added(conn, cursor.lastrowid)
+    catalog_cache.cache.invalidate([])
     
     return jsonify({'message': 'Product added successfully'}), 201
 
@@ -486,15 +599,20 @@ def update_product(product_id):
     
     data = request.json
     conn = get_db()
-    conn.execute('''UPDATE products SET 
-        name=?, category=?, brand=?, price=?, description=?, 
-        specifications=?, image_url=?, stock=?
-        WHERE id=?''',
-        (data['name'], data['category'], data['brand'], data['price'],
-         data['description'], data.get('specifications', ''),
-         data['image_url'], data.get('stock', 10), product_id))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute('''UPDATE products SET 
+            name=?, category=?, brand=?, price=?, description=?, 
+            specifications=?, image_url=?, stock=?
+            WHERE id=?''',
+            (data['name'], data['category'], data['brand'], data['price'],
+             data['description'], data.get('specifications', ''),
+             data['image_url'], data.get('stock', 10), product_id))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify({'error': 'A product with this brand and name already exists'}), 409
+    facets.index.product_updated(conn, product_id)
+    catalog_cache.cache.invalidate([product_id])
     
     return jsonify({'message': 'Product updated successfully'})
 
@@ -506,9 +624,41 @@ def delete_product(product_id):
     conn = get_db()
     conn.execute('DELETE FROM products WHERE id=?', (product_id,))
     conn.commit()
-    conn.close()
+    facets.index.product_deleted(product_id)
+    catalog_cache.cache.invalidate([product_id])
     
     return jsonify({'message': 'Product deleted successfully'})
 
+@app.route('/api/admin/products/import', methods=['POST'])
+def bulk_import_products():
+    if 'user_id' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    fmt = request.args.get('format') or import_products.detect_format(content_type=request.content_type)
+    if fmt not in import_products.FORMATS:
+        return jsonify({'error': 'Send text/csv or application/x-ndjson, or pass format=csv|ndjson'}), 415
+    batch_size = request.args.get('batch_size', import_products.BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be positive'}), 400
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    
+    # The body is read as a stream, so a large import never sits in memory whole
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+    try:
+        report = import_products.import_stream(get_db(), stream, fmt, batch_size, dry_run)
+    except import_products.FormatError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(report.to_dict())
+
 if __name__ == '__main__':
+    # The dev server also seeds the admin account and sample products
+    conn = db.connect()
+    try:
+        seed.seed(conn)
+    finally:
+        conn.close()
+    # The reloader's watcher process never serves, so only the server starts the pool
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        passwords.pool.start()
     app.run(debug=True, port=5000)
\ No newline at end of file
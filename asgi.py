@@ -0,0 +1,218 @@
+"""
+ASGI Entry Point
+Async serving mode for uvicorn or hypercorn:
+
+    uvicorn asgi:application --workers 4
+    hypercorn asgi:application --workers 4
+
+Connections live on the event loop, so thousands of mostly idle catalog
+browsers cost no threads. Catalog reads (GET /api/products and
+/api/products/<id>) are async handlers answered straight from the
+response cache; only a cache miss borrows a thread to query SQLite.
+Every other route runs the Flask app on the same bounded thread pool.
+"""
+
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_accept_header, parse_etags
+
+import catalog_cache
+import db
+import passwords
+import responses
+import write_behind
+from app import app, product_detail, product_listing
+
+# Threads for blocking work. Each holds at most one pooled connection, so
+# more threads than connections would only queue on the pool.
+THREADS = int(os.environ.get('ASGI_THREADS', db.POOL_SIZE))
+MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 10 * 1024 * 1024))
+
+PRODUCT_PATH = re.compile(r'^/api/products/(\d+)$')
+
+executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='asgi')
+
+
+async def run_sync(fn, *args):
+    """Run a blocking call on the bounded pool without blocking the loop"""
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def _respond(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode(), str(v).encode('latin-1'))
+                            for k, v in headers.items()]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _respond_json(send, status, data):
+    await _respond(send, status, {'Content-Type': 'application/json'},
+                   json.dumps(data).encode())
+
+
+def _build_in_app_context(key, version, build):
+    # Builders use get_db(); the context teardown returns the connection
+    with app.app_context():
+        return responses.cache.get(key, version, build)
+
+
+async def catalog_read(scope, send, key, build):
+    """Serve a catalog response from the cache, building it off-loop on a miss"""
+    version = catalog_cache.cache.version
+    entry = responses.cache.lookup(key, version)
+    if entry is None:
+        try:
+            entry = await run_sync(_build_in_app_context, key, version, build)
+        except ValueError as e:
+            await _respond_json(send, 400, {'error': str(e)})
+            return
+    if entry is None:
+        await _respond_json(send, 404, {'error': 'Product not found'})
+        return
+
+    status, headers, body = responses.negotiate(
+        entry, responses.CATALOG_CACHE_CONTROL,
+        parse_accept_header(_header(scope, b'accept-encoding')),
+        parse_etags(_header(scope, b'if-none-match')))
+    if _header(scope, b'origin') is not None:
+        # Same answer flask_cors gives the Flask routes
+        headers['Access-Control-Allow-Origin'] = '*'
+    await _respond(send, status, headers, body)
+
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        name = f'HTTP_{name}'
+        if name in environ:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    # The body is already buffered, chunked uploads included
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def _run_wsgi(environ):
+    """Call the Flask app and buffer its response: (status, headers, body)"""
+    captured = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = int(status.split(' ', 1)[0])
+        captured['headers'] = headers
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return captured['status'], captured['headers'], b''.join(chunks)
+
+
+async def call_flask(scope, receive, send):
+    """Any other route: the Flask app, run on the thread pool"""
+    body = bytearray()
+    more = True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+        if len(body) > MAX_BODY_BYTES:
+            await _respond_json(send, 413, {'error': 'Request body too large'})
+            return
+
+    status, headers, content = await run_sync(_run_wsgi, _environ(scope, bytes(body)))
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                            for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Forked here, on the loop thread, before the thread pool has
+            # started any threads; the hashing processes are tied to the
+            # thread that forks them
+            passwords.pool.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Each of these joins threads or processes; keep the loop free
+            # while they finish
+            await asyncio.to_thread(write_behind.queue.stop)
+            await asyncio.to_thread(passwords.pool.shutdown)
+            await asyncio.to_thread(executor.shutdown, wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """The ASGI application"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    if scope['method'] == 'GET':
+        if path == '/api/products':
+            args = MultiDict(parse_qsl(scope['query_string'].decode('utf-8', 'replace'),
+                                       keep_blank_values=True))
+            key, build = product_listing(args)
+            await catalog_read(scope, send, key, build)
+            return
+        match = PRODUCT_PATH.match(path)
+        if match:
+            key, build = product_detail(int(match.group(1)))
+            await catalog_read(scope, send, key, build)
+            return
+
+    await call_flask(scope, receive, send)
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+API Benchmark
+Scripted load scenarios against the HTTP API. For each endpoint it
+reports p50/p95/p99 latency, requests per second and SQLite statements
+per request, and writes the run as JSON so runs can be diffed
+
+    python gen_data.py                             # once, a realistic data set
+    python bench_api.py                            # Flask test client, in process
+    python bench_api.py --target server            # threaded HTTP server, in process
+    python bench_api.py --url http://host:5000     # a server that is already running
+    python bench_api.py --compare bench_results/<earlier run>.json
+
+In-process targets run on a scratch copy of the database, so checkouts
+never touch the real one. Statement counts need the app in process;
+against --url they are reported as null.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+import gen_data
+
+REQUESTS = 300
+CONCURRENCY = 4
+WARMUP = 5
+SEED = 42
+RESULTS_DIR = 'bench_results'
+
+ADMIN_LOGIN = {'username': 'admin', 'password': 'admin123'}
+SEARCH_TERMS = ['guitar', 'piano', 'drum', 'violin', 'flute', 'dj', 'mic', 'yamaha', 'roland',
+                'fender', 'pro', 'studio', 'vintage', 'amp', 'strings', 'gui', 'pia']
+SORTS = ['default', 'price_asc', 'price_desc', 'rating', 'newest']
+
+QUERY_COUNT_HEADER = 'X-Bench-Queries'
+
+
+# Scenarios. Each is a generator that yields (endpoint, method, path, body)
+# and is sent back (status, body) for every request; one pass is one
+# iteration. setup runs once per worker and is not timed.
+
+def browse(rng, ctx):
+    """Catalog pages: a first page, then follow the cursor a page or two"""
+    params = {'limit': 24, 'sort': rng.choice(SORTS)}
+    if rng.random() < 0.5:
+        params['category'] = rng.choice(ctx['categories'])
+    status, body = yield 'GET /api/products (page)', 'GET', f'/api/products?{urlencode(params)}', None
+    for _ in range(rng.randint(1, 2)):
+        cursor = status == 200 and json.loads(body).get('next_cursor')
+        if not cursor:
+            return
+        params['cursor'] = cursor
+        status, body = yield ('GET /api/products (next page)', 'GET',
+                              f'/api/products?{urlencode(params)}', None)
+
+
+def search(rng, ctx):
+    """Full-text search combined with category and price filters"""
+    params = {'search': rng.choice(SEARCH_TERMS), 'limit': 24,
+              'sort': rng.choice(['relevance', 'price_asc', 'rating'])}
+    if rng.random() < 0.4:
+        params['category'] = rng.choice(ctx['categories'])
+    if rng.random() < 0.5:
+        low = rng.choice([0, 50, 100, 250, 500])
+        params.update(min_price=low, max_price=low * 4 + 200)
+    yield 'GET /api/products (search)', 'GET', f'/api/products?{urlencode(params)}', None
+
+
+def detail(rng, ctx):
+    """Product pages, skewed towards popular products"""
+    product_id = rng.choices(ctx['product_ids'], ctx['weights'])[0]
+    yield 'GET /api/products/<id>', 'GET', f'/api/products/{product_id}', None
+
+
+def login(rng, ctx):
+    """Log a bench user in and out"""
+    body = {'username': f"{gen_data.USER_PREFIX}{rng.randint(1, ctx['users'])}",
+            'password': gen_data.USER_PASSWORD}
+    yield 'POST /api/auth/login', 'POST', '/api/auth/login', body
+    yield 'POST /api/auth/logout', 'POST', '/api/auth/logout', {}
+
+
+def checkout(rng, ctx):
+    """Place an order of one to three products"""
+    items = [{'id': product_id, 'quantity': 1}
+             for product_id in set(rng.sample(ctx['product_ids'], rng.randint(1, 3)))]
+    body = {'items': items, 'payment_method': 'card', 'delivery_address': '1 Bench Street'}
+    yield 'POST /api/orders', 'POST', '/api/orders', body
+
+
+def admin_dashboard(rng, ctx):
+    """The admin page: sales, inventory, summary and a random analytics view"""
+    yield 'GET /api/admin/sales-data', 'GET', '/api/admin/sales-data', None
+    yield 'GET /api/admin/inventory', 'GET', '/api/admin/inventory', None
+    yield 'GET /api/admin/sales-summary', 'GET', '/api/admin/sales-summary', None
+    end = datetime.utcnow().date()
+    params = {'bucket': rng.choice(['hour', 'day', 'week']),
+              'group_by': rng.choice(['category', 'brand', 'product']),
+              'metric': rng.choice(['revenue', 'units', 'orders']),
+              'from': (end - timedelta(days=rng.choice([1, 7, 30, 90]))).isoformat(),
+              'to': end.isoformat()}
+    yield 'GET /api/admin/analytics', 'GET', f'/api/admin/analytics?{urlencode(params)}', None
+
+
+def login_bench_user(client, rng, ctx):
+    body = {'username': f"{gen_data.USER_PREFIX}{rng.randint(1, ctx['users'])}",
+            'password': gen_data.USER_PASSWORD}
+    if client.request('POST', '/api/auth/login', body)[0] != 200:
+        raise RuntimeError(f"{body['username']} can't log in; run gen_data.py first")
+
+
+def login_admin(client, rng, ctx):
+    if client.request('POST', '/api/auth/login', ADMIN_LOGIN)[0] != 200:
+        raise RuntimeError("admin can't log in; run seed.py first")
+
+
+# name: (setup, scenario)
+SCENARIOS = {
+    'browse': (None, browse),
+    'search': (None, search),
+    'detail': (None, detail),
+    'login': (None, login),
+    'checkout': (login_bench_user, checkout),
+    'admin': (login_admin, admin_dashboard),
+}
+
+
+class TestClient:
+    """Requests through Flask's test client, in this process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data(), response.headers.get(QUERY_COUNT_HEADER)
+
+
+class HTTPClient:
+    """Requests over a keep-alive HTTP connection, with a session cookie jar"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, body=None):
+        headers = {}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(body)
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # The server closed an idle keep-alive connection; reconnect once
+            self.connection.close()
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+        data = response.read()
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        return response.status, data, response.headers.get(QUERY_COUNT_HEADER)
+
+
+class QueryCounter:
+    """
+    WSGI middleware that counts the SQLite statements each request runs,
+    through a trace callback on every connection, and reports the count
+    in a response header
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.local = threading.local()
+
+    def install(self, conn):
+        conn.set_trace_callback(self.trace)
+
+    def trace(self, statement):
+        # Statements run by triggers arrive as comments; count the outer one only
+        if not statement.startswith('--'):
+            self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def __call__(self, environ, start_response):
+        self.local.count = 0
+
+        def counted(status, headers, exc_info=None):
+            headers.append((QUERY_COUNT_HEADER, str(self.local.count)))
+            return start_response(status, headers, exc_info)
+
+        return self.wsgi_app(environ, counted)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples):
+    """Latency and statement stats for one endpoint's (ms, ok, queries) samples"""
+    latencies = sorted(ms for ms, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, ok, _ in samples if not ok),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run_worker(make_client, name, quota, warmup, seed, ctx, samples, errors, before_request):
+    setup, scenario = SCENARIOS[name]
+    rng = random.Random(seed)
+    client = make_client()
+    try:
+        if setup:
+            setup(client, rng, ctx)
+        done = 0
+        iteration = 0
+        while done < quota:
+            timed = iteration >= warmup
+            iteration += 1
+            steps = scenario(rng, ctx)
+            response = None
+            while done < quota:
+                try:
+                    endpoint, method, path, body = steps.send(response)
+                except StopIteration:
+                    break
+                if before_request:
+                    before_request()
+                started = time.perf_counter()
+                status, data, queries = client.request(method, path, body)
+                elapsed = (time.perf_counter() - started) * 1000
+                response = (status, data)
+                if timed:
+                    queries = int(queries) if queries is not None else None
+                    samples.append((endpoint, elapsed, status < 400, queries))
+                    done += 1
+    except Exception as e:
+        errors.append(f'{name}: {e}')
+
+
+def run_scenario(make_client, name, requests, concurrency, warmup, seed, ctx, before_request):
+    """Run one scenario with concurrency workers sharing the request budget"""
+    samples, errors = [], []
+    quotas = [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+    threads = [threading.Thread(target=run_worker,
+                                args=(make_client, name, quota, warmup, seed * 1000 + n, ctx,
+                                      samples, errors, before_request))
+               for n, quota in enumerate(quotas)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    if errors:
+        raise RuntimeError('; '.join(sorted(set(errors))))
+
+    endpoints = {}
+    for endpoint, elapsed, ok, queries in samples:
+        endpoints.setdefault(endpoint, []).append((elapsed, ok, queries))
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok, _ in samples if not ok),
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(samples) / seconds, 1) if seconds else None,
+        'endpoints': {endpoint: summarize(rows) for endpoint, rows in sorted(endpoints.items())},
+    }
+
+
+def load_context(client, users):
+    """Product ids and categories to draw requests from, read through the API"""
+    status, body, _ = client.request('GET', '/api/products?fields=id,category')
+    if status != 200:
+        raise RuntimeError(f'GET /api/products returned {status}')
+    products = json.loads(body)
+    if not products:
+        raise RuntimeError('The catalog is empty; run seed.py or gen_data.py first')
+    product_ids = [product['id'] for product in products]
+    return {
+        'product_ids': product_ids,
+        # Zipf-like popularity, as gen_data gives its orders
+        'weights': [1 / (rank + 1) for rank in range(len(product_ids))],
+        'categories': sorted({product['category'] for product in products}),
+        'users': users,
+    }
+
+
+def scratch_copy(path, workdir):
+    """Copy the database for in-process runs; returns the copy's path"""
+    copy = os.path.join(workdir, os.path.basename(path))
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(copy)
+    source.backup(target)
+    source.close()
+    target.close()
+    return copy
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """Run the selected scenarios; returns the results document"""
+    workdir = None
+    server = None
+    before_request = None
+    try:
+        if args.url:
+            target = args.url
+            make_client = lambda: HTTPClient(args.url)
+        else:
+            # The app reads MUSIC_STORE_DB at import, so copy first, then import
+            workdir = tempfile.mkdtemp(prefix='bench_api_')
+            os.environ['MUSIC_STORE_DB'] = scratch_copy(args.db, workdir)
+            # Every bench client logs in from one address; don't throttle it
+            os.environ.setdefault('MUSIC_STORE_AUTH_IP_PER_MINUTE', '0')
+            os.environ.setdefault('MUSIC_STORE_LOGIN_USERNAME_PER_MINUTE', '0')
+            import catalog_cache
+            import db
+            from app import app
+
+            counter = QueryCounter(app.wsgi_app)
+            app.wsgi_app = counter
+            db.connect_hooks.append(counter.install)
+            if args.cold:
+                before_request = lambda: catalog_cache.cache.invalidate()
+
+            if args.target == 'server':
+                from werkzeug.serving import WSGIRequestHandler, make_server
+
+                class QuietHandler(WSGIRequestHandler):
+                    def log_request(self, *args):
+                        pass
+
+                server = make_server('127.0.0.1', 0, app, threaded=True,
+                                     request_handler=QuietHandler)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                url = f'http://127.0.0.1:{server.server_port}'
+                target = f'server ({url})'
+                make_client = lambda: HTTPClient(url)
+            else:
+                target = 'client'
+                make_client = lambda: TestClient(app)
+
+        ctx = load_context(make_client(), args.users)
+        results = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'target': target,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'cold': args.cold,
+            'products': len(ctx['product_ids']),
+            'scenarios': {},
+        }
+        for name in args.scenarios:
+            print(f"  • {name} ...", end=' ', flush=True)
+            result = run_scenario(make_client, name, args.requests, args.concurrency,
+                                  args.warmup, args.seed, ctx, before_request)
+            results['scenarios'][name] = result
+            print(f"{result['requests_per_second']} req/s, {result['errors']} errors")
+        return results
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        if workdir:
+            import write_behind
+            write_behind.queue.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _format_ms(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+def print_report(results, baseline=None):
+    """Per-endpoint table; with a baseline, p50/p95 changes against it"""
+    print(f"\n{'ENDPOINT':<36} {'REQS':>5} {'ERR':>4} {'P50 ms':>8} {'P95 ms':>8} "
+          f"{'P99 ms':>8} {'SQL/REQ':>8}")
+    print("-" * 82)
+    for name, scenario in results['scenarios'].items():
+        old_scenario = (baseline or {}).get('scenarios', {}).get(name)
+        line = f"[{name}] {scenario['requests_per_second']} req/s"
+        if old_scenario and old_scenario.get('requests_per_second'):
+            change = scenario['requests_per_second'] / old_scenario['requests_per_second'] - 1
+            line += f" ({change:+.0%} vs baseline)"
+        print(line)
+        for endpoint, stats in scenario['endpoints'].items():
+            queries = stats['queries_per_request']
+            print(f"  {endpoint:<34} {stats['requests']:>5} {stats['errors']:>4} "
+                  f"{_format_ms(stats['p50_ms']):>8} {_format_ms(stats['p95_ms']):>8} "
+                  f"{_format_ms(stats['p99_ms']):>8} {'-' if queries is None else queries:>8}")
+            old = (old_scenario or {}).get('endpoints', {}).get(endpoint)
+            if old:
+                deltas = [f"{key[:3]} {stats[key] / old[key] - 1:+.0%}"
+                          for key in ('p50_ms', 'p95_ms', 'p99_ms') if old.get(key)]
+                print(f"  {'':<34} vs baseline: {', '.join(deltas)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the HTTP API')
+    parser.add_argument('--target', choices=['client', 'server'], default='client',
+                        help='in-process test client or in-process HTTP server (default: client)')
+    parser.add_argument('--url', help='benchmark a running server instead, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated, from {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--requests', type=int, default=REQUESTS,
+                        help=f'timed requests per scenario (default: {REQUESTS})')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help=f'concurrent clients (default: {CONCURRENCY})')
+    parser.add_argument('--warmup', type=int, default=WARMUP,
+                        help=f'untimed iterations per client (default: {WARMUP})')
+    parser.add_argument('--seed', type=int, default=SEED, help=f'random seed (default: {SEED})')
+    parser.add_argument('--users', type=int, default=gen_data.USERS,
+                        help=f'bench users gen_data.py created (default: {gen_data.USERS})')
+    parser.add_argument('--cold', action='store_true',
+                        help='drop the catalog caches before every request (in-process only)')
+    parser.add_argument('--db', default=os.environ.get('MUSIC_STORE_DB', 'music_store.db'),
+                        help='database to copy for in-process runs (default: music_store.db)')
+    parser.add_argument('--output', help=f'results file (default: a new file in {RESULTS_DIR}/)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    if args.requests < 1 or args.concurrency < 1:
+        parser.error('--requests and --concurrency must be at least 1')
+    if args.cold and args.url:
+        parser.error('--cold needs the app in process')
+    if not args.url and not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist; run seed.py or gen_data.py first')
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("=" * 50)
+    print("API BENCHMARK")
+    print("=" * 50)
+    print()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    try:
+        results = run(args)
+    except RuntimeError as e:
+        print(f"\n❌ {e}")
+        sys.exit(1)
+
+    print_report(results, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
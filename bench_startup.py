@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measures worker cold start, i.e. a fresh interpreter importing app.py
+against a database that is already migrated, and fails when the median
+goes over the target
+
+    python bench_startup.py --runs 10 --target-ms 600
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import db
+
+RUNS = 7
+# Cold start budget for one worker process, interpreter start included
+TARGET_MS = float(os.environ.get('STARTUP_TARGET_MS', 600))
+
+# Reports the import time and the bootstrap time alone, in ms
+PROBE = '''
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.bootstrap()
+print((imported - started) * 1000, (time.perf_counter() - imported) * 1000)
+'''
+
+
+def run_once(env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', PROBE], env=env, capture_output=True,
+                            text=True, check=True)
+    total = (time.perf_counter() - started) * 1000
+    imported, bootstrap = (float(value) for value in result.stdout.split()[-2:])
+    return total, imported, bootstrap
+
+
+def benchmark(runs=RUNS, target_ms=TARGET_MS):
+    """Time cold starts on a scratch copy of the database; True if within target"""
+    workdir = tempfile.mkdtemp(prefix='startup_bench_')
+    try:
+        path = os.path.join(workdir, 'music_store.db')
+        if os.path.exists(db.DB_PATH):
+            source = db.connect(db.DB_PATH)
+            target = db.connect(path)
+            source.backup(target)
+            source.close()
+            target.close()
+        env = dict(os.environ, MUSIC_STORE_DB=path)
+
+        # The first start may migrate; that's the one-time bootstrap, not cold start
+        first = run_once(env)
+        print(f"  • First start (may migrate): {first[0]:.0f} ms")
+
+        samples = [run_once(env) for _ in range(runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    totals, imports, bootstraps = zip(*samples)
+    median = statistics.median(totals)
+    print(f"  • Cold start:  median {median:.0f} ms, min {min(totals):.0f} ms, "
+          f"max {max(totals):.0f} ms over {runs} runs")
+    print(f"  • import app:  median {statistics.median(imports):.0f} ms")
+    print(f"  • bootstrap(): median {statistics.median(bootstraps):.2f} ms on a current schema")
+    print(f"  • Target:      {target_ms:.0f} ms")
+    return median <= target_ms
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measure worker cold start time')
+    parser.add_argument('--runs', type=int, default=RUNS, help=f'timed starts (default: {RUNS})')
+    parser.add_argument('--target-ms', type=float, default=TARGET_MS,
+                        help=f'median cold start budget (default: {TARGET_MS:.0f})')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("=" * 50)
+    print("STARTUP BENCHMARK")
+    print("=" * 50)
+    print()
+
+    if benchmark(args.runs, args.target_ms):
+        print("\n✅ Cold start is within target")
+    else:
+        print("\n❌ Cold start is over target")
+        sys.exit(1)
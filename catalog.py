@@ -0,0 +1,267 @@
+"""
+Catalog Queries
+Filtered, sorted and keyset-paginated product listings, plus the
+full-text search index behind the shop search box
+"""
+
+import base64
+import json
+import logging
+import re
+import sqlite3
+
+PRODUCT_FIELDS = ('id', 'name', 'category', 'brand', 'price', 'description',
+                  'specifications', 'image_url', 'rating', 'stock', 'created_at')
+
+# sort name -> (expression, direction); id is always the tie-breaker
+SORTS = {
+    'default': ('p.id', 'ASC'),
+    'price_asc': ('p.price', 'ASC'),
+    'price_desc': ('p.price', 'DESC'),
+    'rating': ('p.rating', 'DESC'),
+    'newest': ('p.created_at', 'DESC'),
+    # BM25 score; lower is a better match. Only valid with a search term.
+    'relevance': ('products_fts.rank', 'ASC'),
+}
+
+SEARCH_COLUMNS = ('name', 'brand', 'category', 'description', 'specifications')
+
+# External-content FTS5 index over products. The update trigger only
+# fires for indexed columns, so stock changes from checkout skip it.
+SEARCH_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        {', '.join(SEARCH_COLUMNS)},
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in SEARCH_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in SEARCH_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_fts_update
+        AFTER UPDATE OF {', '.join(SEARCH_COLUMNS)} ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in SEARCH_COLUMNS)});
+        INSERT INTO products_fts(rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in SEARCH_COLUMNS)});
+    END""",
+]
+
+_search_available = None
+
+logger = logging.getLogger('music_store.catalog')
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+# Ids per batch lookup; a cart is well under this
+MAX_LOOKUP_IDS = 100
+LOOKUP_FIELDS = ('id', 'name', 'price', 'stock', 'image_url')
+
+
+def parse_fields(fields):
+    """Validate a comma-separated projection, returning a tuple of columns"""
+    if not fields:
+        return PRODUCT_FIELDS
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in requested:
+        requested.insert(0, 'id')
+    return tuple(dict.fromkeys(requested))
+
+
+def has_search_index(conn):
+    """Whether products_fts exists; checked once per process"""
+    global _search_available
+    if _search_available is None:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                           "AND name = 'products_fts'").fetchone()
+        _search_available = row is not None
+    return _search_available
+
+
+def ensure_search_index(conn):
+    """
+    Create the FTS5 table and its sync triggers if missing, indexing any
+    existing products. Returns False when SQLite was built without FTS5,
+    in which case search falls back to LIKE scans; startup calls this
+    again while the index is missing, so a later build with FTS5 adds it.
+    """
+    global _search_available
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                          "AND name = 'products_fts'").fetchone()
+    try:
+        for statement in SEARCH_SCHEMA:
+            conn.execute(statement)
+    except sqlite3.OperationalError as e:
+        logger.warning('Search index unavailable, search falls back to LIKE scans: %s', e)
+        _search_available = False
+        return False
+    if not exists:
+        rebuild_search_index(conn)
+    _search_available = True
+    return True
+
+
+def rebuild_search_index(conn):
+    """Re-index every product from the products table"""
+    conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+
+
+def search_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, and the last
+    word is a prefix so partial input works for type-ahead.
+    """
+    tokens = re.findall(r'\w+', text)
+    if not tokens:
+        return None
+    terms = [f'"{t}"' for t in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return ' '.join(terms)
+
+
+def encode_cursor(sort_value, product_id):
+    """Opaque cursor for the row a page ended on"""
+    raw = json.dumps([sort_value, product_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, product_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    # The sort value is bound straight into the keyset query
+    if (not isinstance(product_id, int) or isinstance(product_id, bool)
+            or not isinstance(sort_value, (str, int, float, type(None)))):
+        raise ValueError('Invalid cursor')
+    return sort_value, product_id
+
+
+def filter_values(value):
+    """A filter given as None, 'all', one value or several, as a sorted tuple"""
+    if isinstance(value, str):
+        value = [value]
+    return tuple(sorted({v for v in value or () if v and v != 'all'}))
+
+
+def build_filters(category=None, min_price=None, max_price=None, search='',
+                  brand=None, min_rating=None, in_stock=False, use_index=True):
+    """
+    WHERE clause fragments and params shared by listing queries. Columns
+    are qualified with the products alias p; with use_index the search
+    term becomes a MATCH against products_fts, which must be joined in.
+    category and brand take one value or a list, matching any of them.
+    """
+    clauses = []
+    params = []
+
+    for column, value in (('category', category), ('brand', brand)):
+        values = filter_values(value)
+        if len(values) == 1:
+            clauses.append(f'p.{column} = ?')
+        elif values:
+            clauses.append(f"p.{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+    if min_price:
+        clauses.append('p.price >= ?')
+        params.append(min_price)
+
+    if max_price:
+        clauses.append('p.price <= ?')
+        params.append(max_price)
+
+    if min_rating:
+        clauses.append('p.rating >= ?')
+        params.append(min_rating)
+
+    if in_stock:
+        clauses.append('p.stock > 0')
+
+    if search and use_index:
+        clauses.append('products_fts MATCH ?')
+        params.append(search_query(search))
+    elif search:
+        clauses.append('(p.name LIKE ? OR p.brand LIKE ?)')
+        params.extend([f'%{search}%', f'%{search}%'])
+
+    return clauses, params
+
+
+def get_product(conn, product_id):
+    """A single product as a dict, or None"""
+    row = conn.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_products(conn, product_ids):
+    """Products by id as {id: dict}, read with one IN (...) query; unknown ids are left out"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    placeholders = ', '.join('?' * len(product_ids))
+    rows = conn.execute(f'SELECT * FROM products WHERE id IN ({placeholders})', product_ids)
+    return {row['id']: dict(row) for row in rows}
+
+
+def list_products(conn, filters=None, sort=None, fields=None,
+                  limit=None, cursor=None):
+    """
+    Run a product listing. Returns (rows, next_cursor); rows are dicts
+    holding only the requested fields. Without a limit every matching row
+    is returned and next_cursor is None. Searches default to relevance
+    order.
+    """
+    filters = dict(filters or {})
+    if filters.get('search') and not search_query(filters['search']):
+        filters['search'] = ''
+    searching = bool(filters.get('search')) and has_search_index(conn)
+
+    sort = sort or ('relevance' if searching else 'default')
+    if sort not in SORTS:
+        raise ValueError(f'Unknown sort: {sort}')
+    if sort == 'relevance' and not searching:
+        sort = 'default'
+    column, direction = SORTS[sort]
+    fields = parse_fields(fields)
+
+    clauses, params = build_filters(**filters, use_index=searching)
+
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        op = '>' if direction == 'ASC' else '<'
+        clauses.append(f'({column}, p.id) {op} (?, ?)')
+        params.extend([sort_value, last_id])
+
+    selected = ', '.join(f'p.{f}' for f in fields)
+    query = f'SELECT {selected}, {column} AS sort_key FROM products p'
+    if searching:
+        query += ' JOIN products_fts ON products_fts.rowid = p.id'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    query += f' ORDER BY {column} {direction}, p.id {direction}'
+
+    if limit is not None:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        # One extra row tells us whether another page exists
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+
+    rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['sort_key'], last['id'])
+
+    return [{f: row[f] for f in fields} for row in rows], next_cursor
@@ -0,0 +1,184 @@
+"""
+Catalog Cache
+In-process product and listing cache, invalidated by the catalog write paths
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MAX_PRODUCTS = int(os.environ.get('CATALOG_CACHE_MAX_PRODUCTS', 10000))
+MAX_LISTINGS = int(os.environ.get('CATALOG_CACHE_MAX_LISTINGS', 512))
+# Upper bound on staleness for other worker processes, which never see
+# this process's invalidations
+TTL = float(os.environ.get('CATALOG_CACHE_TTL', 60))
+
+
+class LRUCache:
+    """Size-bounded LRU map whose entries also expire after a TTL"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        return self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def items(self):
+        return [(key, value) for key, (_, value) in self._entries.items()]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+class CatalogCache:
+    """
+    Product rows by id plus listing results by query. Listings remember
+    which product ids they contain, so a stock change only drops the
+    listings that show that product; edits that can change which products
+    match a filter drop every listing.
+    """
+
+    def __init__(self, max_products=MAX_PRODUCTS, max_listings=MAX_LISTINGS, ttl=TTL):
+        self._lock = threading.Lock()
+        self.products = LRUCache(max_products, ttl)
+        # key -> ((rows, next_cursor), ids of the products in rows)
+        self.listings = LRUCache(max_listings, ttl)
+        self.version = 0
+        self.invalidations = 0
+
+    def get_product(self, product_id, loader):
+        """Cached product dict, or loader(product_id) on a miss"""
+        with self._lock:
+            product = self.products.get(product_id)
+            version = self.version
+        if product is not None:
+            return product
+
+        product = loader(product_id)
+        if product is not None:
+            with self._lock:
+                # Skip the fill if a write landed while we were loading
+                if version == self.version:
+                    self.products.put(product_id, product)
+        return product
+
+    def get_products(self, product_ids, loader):
+        """
+        Cached product dicts for product_ids as {id: dict}. Misses are
+        fetched together with one loader(missing_ids) call, which returns
+        the same mapping; ids it leaves out are not in the catalog.
+        """
+        found, missing = {}, []
+        with self._lock:
+            for product_id in product_ids:
+                product = self.products.get(product_id)
+                if product is None:
+                    missing.append(product_id)
+                else:
+                    found[product_id] = product
+            version = self.version
+        if not missing:
+            return found
+
+        loaded = loader(missing)
+        with self._lock:
+            if version == self.version:
+                for product_id, product in loaded.items():
+                    self.products.put(product_id, product)
+        found.update(loaded)
+        return found
+
+    def get_listing(self, key, loader):
+        """Cached (rows, next_cursor) for a listing key, or loader() on a miss"""
+        with self._lock:
+            entry = self.listings.get(key)
+            version = self.version
+        if entry is not None:
+            return entry[0]
+
+        result = loader()
+        with self._lock:
+            if version == self.version:
+                self.listings.put(key, (result, {row['id'] for row in result[0]}))
+        return result
+
+    def invalidate(self, product_ids=None, membership_changed=True):
+        """
+        Drop cached data after a catalog write. product_ids limits which
+        product rows are dropped (None drops them all). With
+        membership_changed=False only listings showing those products go.
+        """
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+
+            if product_ids is None:
+                self.products.clear()
+            else:
+                for product_id in product_ids:
+                    self.products.pop(product_id)
+
+            if membership_changed or product_ids is None:
+                self.listings.clear()
+                return
+
+            changed = set(product_ids)
+            for key, (_, ids) in self.listings.items():
+                if ids & changed:
+                    self.listings.pop(key)
+
+    def stats(self):
+        """Hit/miss counters and sizes for both caches"""
+        with self._lock:
+            return {
+                'version': self.version,
+                'invalidations': self.invalidations,
+                'products': self.products.stats(),
+                'listings': self.listings.stats(),
+            }
+
+
+cache = CatalogCache()
+
+
+def listing_key(filters, sort, fields, limit, cursor):
+    """Hashable cache key for a product listing request"""
+    return (tuple(sorted((filters or {}).items())), sort, fields, limit, cursor)
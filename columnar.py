@@ -0,0 +1,306 @@
+"""
+Columnar Export Format
+Compact column-chunk files for the analytics exports, plus an optional
+Parquet writer when pyarrow is installed
+
+File layout (all integers little-endian):
+
+    MAGIC
+    chunk 0 buffers, chunk 1 buffers, ...   (each buffer 8-byte aligned)
+    footer: JSON describing every chunk's columns and buffer offsets
+    footer length (uint32) + MAGIC
+
+Rows are buffered one chunk at a time, so writing needs memory for a
+single chunk only. Every chunk types each column on its own:
+
+    int / float       raw array buffer, integers in the narrowest width
+                      (8 to 64 bits) that holds the chunk
+    dict              unsigned codes (8, 16 or 32 bits) into a per-chunk
+                      dictionary of strings
+    string            int64 offsets plus one UTF-8 blob
+
+Columns holding NULLs also get a one-byte-per-row validity buffer, and
+store 0 in the NULL slots.
+Low-cardinality text (category, brand, status, payment method, ...)
+ends up dictionary-encoded automatically.
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+MAGIC = b'HHCOL1\x00\x00'
+CHUNK_ROWS = 65536
+# Dictionary-encode text when distinct values are at most this share of
+# the chunk's non-null values
+DICT_MAX_RATIO = 0.5
+
+_SWAP = sys.byteorder != 'little'
+
+# Candidate typecodes, narrowest first; array sizes are fixed for these
+_INT_TYPECODES = ('b', 'h', 'i', 'q')
+_CODE_TYPECODES = ('B', 'H', 'I')
+
+
+def _infer_type(values):
+    """Storage kind for a chunk's worth of one column"""
+    kind = None
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, int):
+            kind = kind or 'int'
+        elif isinstance(value, float):
+            kind = 'float'
+        else:
+            return 'text'
+    return kind or 'int'
+
+
+def _fit_typecode(typecodes, low, high):
+    """First typecode whose range holds [low, high]"""
+    for typecode in typecodes:
+        bits = array(typecode).itemsize * 8
+        if typecode.isupper():
+            lo, hi = 0, 2 ** bits - 1
+        else:
+            lo, hi = -2 ** (bits - 1), 2 ** (bits - 1) - 1
+        if lo <= low and high <= hi:
+            return typecode
+    raise OverflowError(f'values {low}..{high} do not fit {typecodes[-1]}')
+
+
+def _array_bytes(typecode, values):
+    buf = array(typecode, values)
+    if _SWAP:
+        buf.byteswap()
+    return buf.tobytes()
+
+
+class ColumnarWriter:
+    """Streams rows into a columnar file, one chunk of CHUNK_ROWS at a time"""
+
+    def __init__(self, f, columns, chunk_rows=CHUNK_ROWS):
+        self.f = f
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.pending = [[] for _ in self.columns]
+        self.chunks = []
+        self.rows = 0
+        self.offset = 0
+        self._write(MAGIC)
+
+    def _write(self, data):
+        self.f.write(data)
+        self.offset += len(data)
+
+    def _buffer(self, data):
+        """Write an aligned buffer, returning [offset, length]"""
+        padding = -self.offset % 8
+        if padding:
+            self._write(b'\x00' * padding)
+        start = self.offset
+        self._write(data)
+        return [start, len(data)]
+
+    def write(self, row):
+        for values, value in zip(self.pending, row):
+            values.append(value)
+        if len(self.pending[0]) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        count = len(self.pending[0])
+        if not count:
+            return
+        chunk = {'rows': count, 'columns': []}
+        for name, values in zip(self.columns, self.pending):
+            chunk['columns'].append(self._encode_column(name, values))
+        self.chunks.append(chunk)
+        self.rows += count
+        self.pending = [[] for _ in self.columns]
+
+    def _encode_column(self, name, values):
+        meta = {'name': name}
+        if any(value is None for value in values):
+            meta['validity'] = self._buffer(bytes(value is not None for value in values))
+
+        kind = _infer_type(values)
+        if kind == 'int':
+            ints = [v or 0 for v in values]
+            meta['type'] = 'int'
+            meta['typecode'] = _fit_typecode(_INT_TYPECODES, min(ints), max(ints))
+            meta['data'] = self._buffer(_array_bytes(meta['typecode'], ints))
+        elif kind == 'float':
+            meta['type'] = 'float'
+            meta['typecode'] = 'd'
+            meta['data'] = self._buffer(_array_bytes('d', [float(v or 0) for v in values]))
+        else:
+            texts = [None if v is None else str(v) for v in values]
+            distinct = {}
+            for text in texts:
+                if text is not None and text not in distinct:
+                    distinct[text] = len(distinct)
+            non_null = sum(text is not None for text in texts)
+            if len(distinct) <= max(1, non_null * DICT_MAX_RATIO):
+                meta['type'] = 'dict'
+                meta['typecode'] = _fit_typecode(_CODE_TYPECODES, 0, max(len(distinct) - 1, 0))
+                meta['dictionary'] = list(distinct)
+                meta['data'] = self._buffer(_array_bytes(
+                    meta['typecode'], [0 if t is None else distinct[t] for t in texts]))
+            else:
+                meta['type'] = 'string'
+                meta['typecode'] = 'q'
+                encoded = [b'' if t is None else t.encode() for t in texts]
+                offsets = [0]
+                for item in encoded:
+                    offsets.append(offsets[-1] + len(item))
+                meta['offsets'] = self._buffer(_array_bytes('q', offsets))
+                meta['data'] = self._buffer(b''.join(encoded))
+        return meta
+
+    def close(self):
+        self._flush()
+        footer = json.dumps({'version': 1, 'columns': self.columns,
+                             'rows': self.rows, 'chunks': self.chunks},
+                            separators=(',', ':')).encode()
+        self._write(footer)
+        self._write(struct.pack('<I', len(footer)) + MAGIC)
+
+
+class ColumnarFile:
+    """
+    Memory-mapped reader. On little-endian hosts numeric columns and
+    dictionary codes come back as memoryviews straight over the mapped
+    file, with no copying; drop any such views before calling close().
+    Big-endian hosts get byteswapped copies instead.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        tail = len(MAGIC) + 4
+        if self._view[:len(MAGIC)] != MAGIC or self._view[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a columnar export file')
+        (footer_length,) = struct.unpack('<I', self._view[-tail:-len(MAGIC)])
+        footer_start = len(self._view) - tail - footer_length
+        footer = json.loads(bytes(self._view[footer_start:footer_start + footer_length]))
+        self.columns = footer['columns']
+        self.rows = footer['rows']
+        self.chunks = footer['chunks']
+
+    def _slice(self, ref):
+        start, length = ref
+        return self._view[start:start + length]
+
+    def _meta(self, chunk, name):
+        return self.chunks[chunk]['columns'][self.columns.index(name)]
+
+    def _numbers(self, ref, typecode):
+        """A little-endian buffer as typed values: a view, or a swapped copy"""
+        if not _SWAP:
+            return self._slice(ref).cast(typecode)
+        values = array(typecode)
+        values.frombytes(self._slice(ref))
+        values.byteswap()
+        return values
+
+    def raw(self, name, chunk=0):
+        """
+        Buffers for one column chunk: (type, values, validity). values
+        holds the numbers for int/float columns, the codes for dict
+        columns and the offsets for string columns: a zero-copy typed
+        memoryview on little-endian hosts, an array copy elsewhere.
+        """
+        meta = self._meta(chunk, name)
+        validity = self._slice(meta['validity']) if 'validity' in meta else None
+        buffer = meta['offsets'] if meta['type'] == 'string' else meta['data']
+        return meta['type'], self._numbers(buffer, meta['typecode']), validity
+
+    def dictionary(self, name, chunk=0):
+        """The string dictionary of a dict-encoded column chunk"""
+        return self._meta(chunk, name).get('dictionary')
+
+    def column(self, name):
+        """Decoded values of a column across all chunks, as a list"""
+        values = []
+        for chunk in range(len(self.chunks)):
+            kind, data, validity = self.raw(name, chunk)
+            meta = self._meta(chunk, name)
+            if kind == 'dict':
+                dictionary = meta['dictionary']
+                decoded = [dictionary[code] if dictionary else None for code in data]
+            elif kind == 'string':
+                blob = self._slice(meta['data'])
+                decoded = [bytes(blob[data[i]:data[i + 1]]).decode()
+                           for i in range(len(data) - 1)]
+            else:
+                decoded = data.tolist()
+            if validity is not None:
+                decoded = [v if ok else None for v, ok in zip(decoded, validity)]
+            values.extend(decoded)
+        return values
+
+    def to_rows(self):
+        """Every row as a dict; convenient, but copies the whole file"""
+        columns = [self.column(name) for name in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*columns)]
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetWriter:
+    """Parquet via pyarrow, one row group per chunk, dictionary-encoded strings"""
+
+    def __init__(self, f, columns, chunk_rows=CHUNK_ROWS):
+        if pyarrow is None:
+            raise RuntimeError('Parquet output needs pyarrow: pip install pyarrow')
+        self.f = f
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self.pending = [[] for _ in self.columns]
+        self.schema = None
+        self.writer = None
+
+    def write(self, row):
+        for values, value in zip(self.pending, row):
+            values.append(value)
+        if len(self.pending[0]) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        table = pyarrow.table(dict(zip(self.columns, self.pending)))
+        if self.schema is None:
+            # All-NULL columns in the first chunk have no type yet
+            self.schema = pyarrow.schema([
+                field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+                for field in table.schema])
+            self.writer = pyarrow.parquet.ParquetWriter(self.f, self.schema,
+                                                        use_dictionary=True)
+        if table.num_rows:
+            self.writer.write_table(table.cast(self.schema))
+        self.pending = [[] for _ in self.columns]
+
+    def close(self):
+        self._flush()
+        if self.writer is not None:
+            self.writer.close()
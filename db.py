@@ -0,0 +1,234 @@
+"""
+Database Connection Layer
+Pooled SQLite connections with WAL mode and tuned pragmas
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g
+
+DB_PATH = os.environ.get('MUSIC_STORE_DB', 'music_store.db')
+
+# Applied to every new connection. WAL lets readers keep going while
+# create_order holds the write lock; NORMAL sync is safe under WAL.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,       # ~16 MB page cache per connection
+    'mmap_size': 134217728,     # 128 MB memory-mapped I/O
+    'busy_timeout': 5000,       # ms to wait on a locked database
+    'temp_store': 'MEMORY',
+}
+
+POOL_SIZE = int(os.environ.get('MUSIC_STORE_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('MUSIC_STORE_DB_POOL_TIMEOUT', 5.0))
+
+# Where reports, exports and admin analytics read: 'primary' or 'replica'.
+# The replica is a read-only copy refreshed by replica.py.
+REPORTING_SOURCE = os.environ.get('MUSIC_STORE_REPORTING', 'primary')
+REPLICA_PATH = os.environ.get('MUSIC_STORE_REPLICA', 'music_store_replica.db')
+
+
+# Called with every new connection, e.g. to install a trace callback
+connect_hooks = []
+
+# Set by instrumentation.py to wrap each request's connection in a
+# profiling proxy; the proxy exposes the real connection as .wrapped
+connection_wrapper = None
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection frees up within the pool timeout"""
+
+
+def connect(path=None):
+    """Open a new connection with the store's pragmas applied"""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    for hook in connect_hooks:
+        hook(conn)
+    return conn
+
+
+def connect_readonly(path):
+    """Read-only connection, for replicas and snapshots nobody writes to"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for hook in connect_hooks:
+        hook(conn)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of reusable connections, reset after a fork"""
+
+    def __init__(self, path=None, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path or DB_PATH
+        self.max_size = max_size
+        self.timeout = timeout
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._open = 0
+        self._in_use = 0
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+
+    def _check_pid(self):
+        # Connections must never be shared across a fork; forked workers
+        # drop what they inherited and build their own pool.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def acquire(self):
+        """Take an idle connection, opening one if under the size bound"""
+        with self._lock:
+            self._check_pid()
+            if not self._idle and self._open >= self.max_size:
+                self._waits += 1
+                started = time.monotonic()
+                deadline = started + self.timeout
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolExhausted(
+                            f'No database connection available after {self.timeout}s')
+                    self._lock.wait(remaining)
+                self._wait_time += time.monotonic() - started
+
+            if self._idle:
+                self._hits += 1
+                self._in_use += 1
+                return self._idle.pop()
+
+            self._misses += 1
+            self._open += 1
+            self._in_use += 1
+
+        try:
+            return connect(self.path)
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.append(conn)
+            except sqlite3.Error:
+                self._open -= 1
+            self._lock.notify()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._open -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        """Counters used to size the pool"""
+        with self._lock:
+            self._check_pid()
+            return {
+                'pid': self._pid,
+                'max_size': self.max_size,
+                'open_connections': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'hits': self._hits,
+                'misses': self._misses,
+                'waits': self._waits,
+                'wait_time_ms': round(self._wait_time * 1000, 3),
+                'timeouts': self._timeouts,
+            }
+
+
+pool = ConnectionPool()
+
+
+def init_app(app):
+    """Return the request's pooled connection when the app context ends"""
+
+    @app.teardown_appcontext
+    def release_db(exception=None):
+        conn = g.pop('db', None)
+        if conn is not None:
+            pool.release(getattr(conn, 'wrapped', conn))
+        report_conn = g.pop('report_db', None)
+        if report_conn is not None:
+            report_conn.close()
+
+
+def get_db():
+    """Connection for the current app context, shared across the request"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+        if connection_wrapper is not None:
+            g.db = connection_wrapper(g.db)
+    return g.db
+
+
+def reporting_path(source=None):
+    """
+    Database file reports should read for source (default
+    REPORTING_SOURCE). Falls back to the primary until the replica has
+    been built.
+    """
+    if (source or REPORTING_SOURCE) == 'replica' and os.path.exists(REPLICA_PATH):
+        return REPLICA_PATH
+    return DB_PATH
+
+
+def connect_reporting(source=None):
+    """New connection to the reporting database; read-only for the replica"""
+    path = reporting_path(source)
+    return connect(path) if path == DB_PATH else connect_readonly(path)
+
+
+def reporting_version():
+    """Changes whenever the replica is swapped in; None when reading the primary"""
+    path = reporting_path()
+    if path == DB_PATH:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_report_db():
+    """
+    Connection for report queries in the current app context. The
+    replica is opened per request rather than pooled, because each
+    refresh swaps in a new file that pooled connections would never see.
+    """
+    if reporting_path() == DB_PATH:
+        return get_db()
+    if 'report_db' not in g:
+        g.report_db = connect_readonly(REPLICA_PATH)
+        if connection_wrapper is not None:
+            g.report_db = connection_wrapper(g.report_db)
+    return g.report_db
@@ -2,287 +2,621 @@
 """
 Database Export Script
 Exports database data to CSV and JSON files for easy viewing
+
+Rows are streamed from the cursor in fetchmany batches and written
+incrementally, so memory use stays flat however large the tables get.
+Every dataset reads the same point-in-time snapshot, and with --jobs
+they are exported in parallel worker processes. With --incremental only
+rows past each dataset's last watermark are written, as delta files.
 """
 
-import sqlite3
+import argparse
 import csv
+import gzip
 import json
 import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
-def export_to_csv_and_json():
+import columnar
+import db
+import rollups
+
+EXPORT_DIR = 'exports'
+BATCH_SIZE = 5000
+# Print a progress line every this many rows on large datasets
+PROGRESS_EVERY = 100000
+
+FORMATS = ('csv', 'json', 'ndjson', 'columnar', 'parquet')
+DEFAULT_FORMATS = ('csv', 'json')
+# Binary formats are already compact and are never gzipped, so the
+# columnar files stay memory-mappable
+BINARY_FORMATS = ('columnar', 'parquet')
+EXTENSIONS = {'csv': 'csv', 'json': 'json', 'ndjson': 'ndjson',
+              'columnar': 'col', 'parquet': 'parquet'}
+
+# name -> (heading, query)
+DATASETS = {
+    # ===== 1. SALES DATA (Orders with Customer Info) =====
+    'sales_data': ('📊 Exporting SALES DATA...', '''
+        SELECT
+            o.id as order_id,
+            u.username as customer,
+            u.email as email,
+            o.total_amount as total_amount,
+            o.status as status,
+            o.payment_method as payment_method,
+            o.delivery_address as delivery_address,
+            o.created_at as order_date,
+            COUNT(oi.id) as items_count
+        FROM orders o
+        JOIN users u ON o.user_id = u.id
+        LEFT JOIN order_items oi ON o.id = oi.order_id
+        {delta}
+        GROUP BY o.id
+        ORDER BY o.created_at DESC
+    '''),
+
+    # ===== 2. CUSTOMER PURCHASE DETAILS =====
+    'customer_purchases': ('🛒 Exporting CUSTOMER PURCHASE DETAILS...', '''
+        SELECT
+            o.id as order_id,
+            u.username as customer,
+            p.name as product_name,
+            p.category as category,
+            p.brand as brand,
+            oi.quantity as quantity_bought,
+            oi.price as price_per_item,
+            (oi.quantity * oi.price) as total_item_price,
+            o.payment_method as payment_method,
+            o.status as order_status,
+            o.created_at as purchase_date
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.id
+        JOIN users u ON o.user_id = u.id
+        JOIN products p ON oi.product_id = p.id
+        {delta}
+        ORDER BY o.created_at DESC
+    '''),
+
+    # ===== 3. INVENTORY & STOCK STATUS =====
+    'inventory_stock': ('📦 Exporting INVENTORY & STOCK STATUS...', '''
+        SELECT
+            p.id as product_id,
+            p.name as product_name,
+            p.category as category,
+            p.brand as brand,
+            p.price as price,
+            p.stock as current_stock,
+            COALESCE(st.quantity_sold, 0) as units_sold,
+            COALESCE(st.total_revenue, 0) as total_revenue,
+            p.rating as rating,
+            CASE
+                WHEN p.stock = 0 THEN 'OUT OF STOCK'
+                WHEN p.stock <= 5 THEN 'LOW STOCK'
+                ELSE 'IN STOCK'
+            END as stock_status,
+            st.last_updated as last_sales_update
+        FROM products p
+        LEFT JOIN sales_tracking st ON p.id = st.product_id
+        {delta}
+        ORDER BY p.category, p.name
+    '''),
+
+    # ===== 4. SALES SUMMARY BY PRODUCT =====
+    'sales_summary': ('📈 Exporting SALES SUMMARY BY PRODUCT...', '''
+        SELECT
+            p.id as product_id,
+            p.name as product_name,
+            p.category as category,
+            p.brand as brand,
+            p.price as current_price,
+            COALESCE(st.quantity_sold, 0) as total_sold,
+            COALESCE(st.total_revenue, 0) as total_revenue,
+            ROUND(COALESCE(st.total_revenue, 0) / NULLIF(COALESCE(st.quantity_sold, 0), 0), 2) as average_price
+        FROM products p
+        LEFT JOIN sales_tracking st ON p.id = st.product_id
+        {delta}
+        ORDER BY COALESCE(st.quantity_sold, 0) DESC
+    '''),
+}
+
+STATE_FILE = os.path.join(EXPORT_DIR, 'export_state.json')
+# Deltas a dataset may accumulate before the next run compacts them
+# into a fresh full snapshot
+COMPACT_AFTER = 7
+
+# name -> (watermark query, delta filter). A watermark is the row the
+# query returns; the filter takes the previous and the new one. Orders
+# and order items are append-only, so their ids are exact watermarks.
+# Product rows change in place, so they are keyed on sales_tracking's
+# (last_updated, product_id): last_updated has one-second resolution and
+# the product id orders rows within the same second. A row sold again
+# within the second of the last export, with a lower product id than the
+# watermark's, and admin edits that bypass sales tracking are only
+# picked up by the next full snapshot. Empty tables give a floor
+# watermark, so they too get deltas from then on.
+_LATEST_SALE = '''SELECT last_updated, product_id FROM sales_tracking
+                  UNION ALL SELECT '', 0
+                  ORDER BY 1 DESC, 2 DESC LIMIT 1'''
+_SALES_SINCE = '''WHERE (st.last_updated, st.product_id) > (?, ?)
+                    AND (st.last_updated, st.product_id) <= (?, ?)'''
+INCREMENTAL = {
+    'sales_data': ('SELECT COALESCE(MAX(id), 0) FROM orders',
+                   'WHERE o.id > ? AND o.id <= ?'),
+    'customer_purchases': ('SELECT COALESCE(MAX(id), 0) FROM order_items',
+                           'WHERE oi.id > ? AND oi.id <= ?'),
+    'inventory_stock': (_LATEST_SALE, _SALES_SINCE),
+    'sales_summary': (_LATEST_SALE, _SALES_SINCE),
+}
+
+def stream_rows(cursor, batch_size=BATCH_SIZE):
+    """Yield rows from an executed cursor without materialising the result"""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
+
+def open_output(path, compress, binary=False):
+    """Text file for writing, gzip-compressed when asked"""
+    if binary:
+        return open(path, 'wb')
+    if compress:
+        return gzip.open(path + '.gz', 'wt', newline='', encoding='utf-8')
+    return open(path, 'w', newline='', encoding='utf-8')
+
+class CsvOutput:
+    """CSV written row by row, header from the cursor's columns"""
+
+    def __init__(self, f, columns):
+        self.writer = csv.writer(f)
+        self.writer.writerow(columns)
+
+    def write(self, row):
+        self.writer.writerow(tuple(row))
+
+    def close(self):
+        pass
+
+class JsonArrayOutput:
+    """A pretty-printed JSON array streamed one object at a time"""
+
+    def __init__(self, f, columns):
+        self.f = f
+        self.columns = columns
+        self.first = True
+        f.write('[')
+
+    def write(self, row):
+        item = json.dumps(dict(zip(self.columns, row)), indent=2)
+        self.f.write(('\n' if self.first else ',\n') + '  ' + item.replace('\n', '\n  '))
+        self.first = False
+
+    def close(self):
+        self.f.write(']' if self.first else '\n]')
+
+class NdjsonOutput:
+    """One compact JSON object per line"""
+
+    def __init__(self, f, columns):
+        self.f = f
+        self.columns = columns
+
+    def write(self, row):
+        self.f.write(json.dumps(dict(zip(self.columns, row)), separators=(',', ':')) + '\n')
+
+    def close(self):
+        pass
+
+OUTPUTS = {'csv': CsvOutput, 'json': JsonArrayOutput, 'ndjson': NdjsonOutput,
+           'columnar': columnar.ColumnarWriter, 'parquet': columnar.ParquetWriter}
+
+def export_dataset(conn, name, query, timestamp, formats=DEFAULT_FORMATS,
+                   compress=False, batch_size=BATCH_SIZE, params=(), stem=None):
+    """
+    Stream one query into every requested format in a single pass, to
+    files named {stem}_{timestamp}.{format} (stem defaults to the name).
+    Returns a report with row count, elapsed time, throughput and files.
+    """
+    started = time.perf_counter()
+    cursor = conn.execute(query, params)
+    columns = [col[0] for col in cursor.description]
+
+    stem = stem or name
+    paths = [os.path.join(EXPORT_DIR, f'{stem}_{timestamp}.{EXTENSIONS[fmt]}') for fmt in formats]
+    files = [open_output(path, compress, fmt in BINARY_FORMATS) for fmt, path in zip(formats, paths)]
+    try:
+        outputs = [OUTPUTS[fmt](f, columns) for fmt, f in zip(formats, files)]
+        rows = 0
+        for row in stream_rows(cursor, batch_size):
+            for output in outputs:
+                output.write(row)
+            rows += 1
+            if rows % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  … {rows:,} rows ({rows / elapsed:,.0f} rows/s)")
+        for output in outputs:
+            output.close()
+    finally:
+        for f in files:
+            f.close()
+
+    if compress:
+        paths = [path if fmt in BINARY_FORMATS else path + '.gz'
+                 for fmt, path in zip(formats, paths)]
+    elapsed = time.perf_counter() - started
+    return {
+        'dataset': name,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed) if elapsed > 0 else rows,
+        'bytes': sum(os.path.getsize(path) for path in paths),
+        'files': paths,
+    }
+
+def print_report(report):
+    """Per-dataset result line plus the files written"""
+    for path in report['files']:
+        print(f"  ✓ Exported: {path}")
+    print(f"  • {report['rows']:,} rows in {report['seconds']:.2f}s "
+          f"({report['rows_per_second']:,} rows/s, {report['bytes'] / 1024:,.1f} KB)")
+
+def take_snapshot(conn):
+    """
+    Copy the database to a temporary file with the backup API. The copy
+    is made in one step, i.e. inside a single read transaction, so it is
+    a consistent point-in-time image even while checkout keeps writing.
+    """
+    fd, path = tempfile.mkstemp(prefix='music_store_snapshot_', suffix='.db')
+    os.close(fd)
+    target = sqlite3.connect(path)
+    try:
+        conn.backup(target)
+        # Readers open the copy read-only, which a WAL database can't do
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+    return path
+
+def open_snapshot(path):
+    """Read-only connection to a snapshot file"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def load_state():
+    """Per-dataset watermarks and delta files from earlier runs"""
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def save_state(state):
+    """Write the state file atomically so a crash never leaves it half-written"""
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+def plan_exports(conn, state, incremental=False, force_full=False,
+                 compact_after=COMPACT_AFTER):
+    """
+    Decide per dataset between a full snapshot and a delta, reading the
+    new watermarks from conn, which must be the snapshot being exported.
+    Returns a list of job dicts; a dataset whose watermark hasn't moved
+    since its last delta or snapshot gets no job.
+    """
+    plan = []
+    for name, (heading, query) in DATASETS.items():
+        watermark_sql, delta_filter = INCREMENTAL[name]
+        previous = state.get(name, {})
+        row = conn.execute(watermark_sql).fetchone()
+        watermark = list(row) if row is not None and None not in tuple(row) else None
+
+        since = previous.get('watermark')
+        if since is not None and not isinstance(since, list):
+            # State files from before watermarks were rows
+            since = [since]
+        delta = (incremental and not force_full
+                 and since is not None and watermark is not None
+                 and len(since) == len(watermark)
+                 and len(previous.get('deltas', [])) < compact_after)
+
+        if delta and watermark == since:
+            continue
+        if delta:
+            plan.append({'name': name, 'heading': heading, 'mode': 'delta',
+                         'stem': f'{name}_delta', 'watermark': watermark,
+                         'query': query.replace('{delta}', delta_filter),
+                         'params': (*since, *watermark)})
+        else:
+            plan.append({'name': name, 'heading': heading, 'mode': 'full',
+                         'stem': name, 'watermark': watermark,
+                         'query': query.replace('{delta}', ''), 'params': ()})
+    return plan
+
+def update_state(state, plan, reports, timestamp):
+    """
+    Record the new watermarks in state. Returns the files the new state
+    no longer references, for removal once it is saved: a full snapshot
+    supersedes the previous one and every delta since, and an empty
+    delta is dropped (from its report too) so idle runs don't bring
+    compaction closer.
+    """
+    obsolete = []
+    for job, report in zip(plan, reports):
+        entry = state.setdefault(job['name'], {'deltas': []})
+        entry['watermark'] = job['watermark']
+        if job['mode'] == 'full':
+            for files in entry.get('deltas', []):
+                obsolete.extend(files)
+            obsolete.extend(entry.get('full_files', []))
+            entry['deltas'] = []
+            entry['last_full'] = timestamp
+            entry['full_files'] = report['files']
+        elif report['rows']:
+            entry.setdefault('deltas', []).append(report['files'])
+        else:
+            obsolete.extend(report['files'])
+            report['files'] = []
+    # A rerun within the same second writes to the same names
+    written = {path for report in reports for path in report['files']}
+    return [path for path in obsolete if path not in written]
+
+def remove_files(paths):
+    """Delete superseded export files, skipping any already gone"""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _export_from_snapshot(path, job, timestamp, formats, compress, batch_size):
+    """Worker-process entry point: export one dataset on its own connection"""
+    conn = open_snapshot(path)
+    try:
+        return export_dataset(conn, job['name'], job['query'], timestamp, formats,
+                              compress, batch_size, job['params'], job['stem'])
+    finally:
+        conn.close()
+
+def export_parallel(path, plan, timestamp, formats, compress, batch_size, jobs):
+    """Export every planned dataset concurrently from the snapshot at path"""
+    for job in plan:
+        print(f"{job['heading']} ({job['mode']})")
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_export_from_snapshot, path, job, timestamp,
+                               formats, compress, batch_size) for job in plan]
+        for future in as_completed(futures):
+            report = future.result()
+            print(f"\n✓ {report['dataset']}")
+            print_report(report)
+            reports[report['dataset']] = report
+
+    return [reports[job['name']] for job in plan]
+
+def export_serial(conn, plan, timestamp, formats, compress, batch_size):
+    """Export every planned dataset one after another on conn"""
+    reports = []
+    for job in plan:
+        print(f"\n{job['heading']} ({job['mode']})")
+        report = export_dataset(conn, job['name'], job['query'], timestamp, formats,
+                                compress, batch_size, job['params'], job['stem'])
+        print_report(report)
+        reports.append(report)
+    return reports
+
+def summary_statistics(conn):
+    """
+    Store-wide totals. Order figures come from the daily rollups, one row
+    per day, instead of aggregating the order history.
+    """
+    totals = rollups.totals(conn)
+    row = conn.execute('''
+        SELECT
+            (SELECT MAX(created_at) FROM orders) as latest_order_date,
+            (SELECT COUNT(*) FROM users WHERE is_admin = 0) as total_customers
+    ''').fetchone()
+    stock = conn.execute('''
+        SELECT
+            COUNT(*) as total_products,
+            COALESCE(SUM(stock), 0) as total_stock,
+            COALESCE(SUM(stock > 5), 0) as in_stock,
+            COALESCE(SUM(stock > 0 AND stock <= 5), 0) as low_stock,
+            COALESCE(SUM(stock = 0), 0) as out_of_stock
+        FROM products
+    ''').fetchone()
+
+    total_orders = totals['total_orders']
+    total_revenue = totals['total_revenue']
+
+    return {
+        "export_date": datetime.now().isoformat(),
+        "summary": {
+            "total_orders": total_orders,
+            "total_revenue": float(total_revenue),
+            "total_customers": row['total_customers'],
+            "total_products": stock['total_products'],
+            "total_units_sold": totals['total_units'],
+            "total_stock_remaining": stock['total_stock'],
+            "average_order_value": float(total_revenue / total_orders) if total_orders > 0 else 0
+        },
+        "sales_data": {
+            "total_files": total_orders,
+            "latest_order_date": row['latest_order_date']
+        },
+        "inventory_data": {
+            "total_products": stock['total_products'],
+            "in_stock_products": stock['in_stock'],
+            "low_stock_products": stock['low_stock'],
+            "out_of_stock_products": stock['out_of_stock']
+        }
+    }
+
+def export_to_csv_and_json(formats=DEFAULT_FORMATS, compress=False, batch_size=BATCH_SIZE,
+                           jobs=1, incremental=False, force_full=False,
+                           compact_after=COMPACT_AFTER, source=None):
     """Export database data to CSV and JSON files"""
-    
-    db_path = 'music_store.db'
-    
+
+    db_path = db.reporting_path(source)
+
     if not os.path.exists(db_path):
         print("❌ Database not found!")
         return False
-    
+
+    snapshot_path = None
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+        conn = db.connect_reporting(source)
+        if db_path != db.DB_PATH:
+            print(f"\n📖 Reading from the reporting replica: {db_path}")
+
         # Create exports directory
-        if not os.path.exists('exports'):
-            os.makedirs('exports')
-        
+        if not os.path.exists(EXPORT_DIR):
+            os.makedirs(EXPORT_DIR)
+
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # ===== 1. SALES DATA (Orders with Customer Info) =====
-        print("\n📊 Exporting SALES DATA...")
-        
-        cursor.execute('''
-            SELECT 
-                o.id as order_id,
-                u.username as customer,
-                u.email as email,
-                o.total_amount as total_amount,
-                o.status as status,
-                o.payment_method as payment_method,
-                o.delivery_address as delivery_address,
-                o.created_at as order_date,
-                COUNT(oi.id) as items_count
-            FROM orders o
-            JOIN users u ON o.user_id = u.id
-            LEFT JOIN order_items oi ON o.id = oi.order_id
-            GROUP BY o.id
-            ORDER BY o.created_at DESC
-        ''')
-        
-        sales_data = [dict(row) for row in cursor.fetchall()]
-        
-        # Export to CSV
-        if sales_data:
-            csv_file = f'exports/sales_data_{timestamp}.csv'
-            with open(csv_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=sales_data[0].keys())
-                writer.writeheader()
-                writer.writerows(sales_data)
-            print(f"  ✓ CSV exported: {csv_file}")
-        
-        # Export to JSON
-        json_file = f'exports/sales_data_{timestamp}.json'
-        with open(json_file, 'w') as f:
-            json.dump(sales_data, f, indent=2)
-        print(f"  ✓ JSON exported: {json_file}")
-        
-        # ===== 2. CUSTOMER PURCHASE DETAILS =====
-        print("\n🛒 Exporting CUSTOMER PURCHASE DETAILS...")
-        
-        cursor.execute('''
-            SELECT 
-                o.id as order_id,
-                u.username as customer,
-                p.name as product_name,
-                p.category as category,
-                p.brand as brand,
-                oi.quantity as quantity_bought,
-                oi.price as price_per_item,
-                (oi.quantity * oi.price) as total_item_price,
-                o.payment_method as payment_method,
-                o.status as order_status,
-                o.created_at as purchase_date
-            FROM order_items oi
-            JOIN orders o ON oi.order_id = o.id
-            JOIN users u ON o.user_id = u.id
-            JOIN products p ON oi.product_id = p.id
-            ORDER BY o.created_at DESC
-        ''')
-        
-        purchases_data = [dict(row) for row in cursor.fetchall()]
-        
-        # Export to CSV
-        if purchases_data:
-            csv_file = f'exports/customer_purchases_{timestamp}.csv'
-            with open(csv_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=purchases_data[0].keys())
-                writer.writeheader()
-                writer.writerows(purchases_data)
-            print(f"  ✓ CSV exported: {csv_file}")
-        
-        # Export to JSON
-        json_file = f'exports/customer_purchases_{timestamp}.json'
-        with open(json_file, 'w') as f:
-            json.dump(purchases_data, f, indent=2)
-        print(f"  ✓ JSON exported: {json_file}")
-        
-        # ===== 3. INVENTORY & STOCK STATUS =====
-        print("\n📦 Exporting INVENTORY & STOCK STATUS...")
-        
-        cursor.execute('''
-            SELECT 
-                p.id as product_id,
-                p.name as product_name,
-                p.category as category,
-                p.brand as brand,
-                p.price as price,
-                p.stock as current_stock,
-                COALESCE(st.quantity_sold, 0) as units_sold,
-                COALESCE(st.total_revenue, 0) as total_revenue,
-                p.rating as rating,
-                CASE 
-                    WHEN p.stock = 0 THEN 'OUT OF STOCK'
-                    WHEN p.stock <= 5 THEN 'LOW STOCK'
-                    ELSE 'IN STOCK'
-                END as stock_status,
-                st.last_updated as last_sales_update
-            FROM products p
-            LEFT JOIN sales_tracking st ON p.id = st.product_id
-            ORDER BY p.category, p.name
-        ''')
-        
-        inventory_data = [dict(row) for row in cursor.fetchall()]
-        
-        # Export to CSV
-        if inventory_data:
-            csv_file = f'exports/inventory_stock_{timestamp}.csv'
-            with open(csv_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=inventory_data[0].keys())
-                writer.writeheader()
-                writer.writerows(inventory_data)
-            print(f"  ✓ CSV exported: {csv_file}")
-        
-        # Export to JSON
-        json_file = f'exports/inventory_stock_{timestamp}.json'
-        with open(json_file, 'w') as f:
-            json.dump(inventory_data, f, indent=2)
-        print(f"  ✓ JSON exported: {json_file}")
-        
-        # ===== 4. SALES SUMMARY BY PRODUCT =====
-        print("\n📈 Exporting SALES SUMMARY BY PRODUCT...")
-        
-        cursor.execute('''
-            SELECT 
-                p.id as product_id,
-                p.name as product_name,
-                p.category as category,
-                p.brand as brand,
-                p.price as current_price,
-                COALESCE(st.quantity_sold, 0) as total_sold,
-                COALESCE(st.total_revenue, 0) as total_revenue,
-                ROUND(COALESCE(st.total_revenue, 0) / NULLIF(COALESCE(st.quantity_sold, 0), 0), 2) as average_price
-            FROM products p
-            LEFT JOIN sales_tracking st ON p.id = st.product_id
-            ORDER BY COALESCE(st.quantity_sold, 0) DESC
-        ''')
-        
-        sales_summary = [dict(row) for row in cursor.fetchall()]
-        
-        # Export to CSV
-        if sales_summary:
-            csv_file = f'exports/sales_summary_{timestamp}.csv'
-            with open(csv_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=sales_summary[0].keys())
-                writer.writeheader()
-                writer.writerows(sales_summary)
-            print(f"  ✓ CSV exported: {csv_file}")
-        
-        # Export to JSON
-        json_file = f'exports/sales_summary_{timestamp}.json'
-        with open(json_file, 'w') as f:
-            json.dump(sales_summary, f, indent=2)
-        print(f"  ✓ JSON exported: {json_file}")
-        
+        started = time.perf_counter()
+
+        if jobs > 1:
+            print(f"\n📸 Taking snapshot for {jobs} parallel jobs...")
+            snapshot_path = take_snapshot(conn)
+            conn.close()
+            conn = open_snapshot(snapshot_path)
+        else:
+            # One read transaction: under WAL every query below sees the
+            # same snapshot, so the files agree with each other
+            conn.execute('BEGIN')
+
+        state = load_state()
+        plan = plan_exports(conn, state, incremental, force_full, compact_after)
+        unchanged = [name for name in DATASETS if name not in {job['name'] for job in plan}]
+        if unchanged:
+            print(f"\n⏭  Unchanged since the last export: {', '.join(unchanged)}")
+
+        if jobs > 1:
+            reports = export_parallel(snapshot_path, plan, timestamp, formats,
+                                      compress, batch_size, jobs)
+        else:
+            reports = export_serial(conn, plan, timestamp, formats, compress, batch_size)
+
+        obsolete = update_state(state, plan, reports, timestamp)
+        save_state(state)
+        remove_files(obsolete)
+
         # ===== 5. SUMMARY STATISTICS =====
         print("\n📊 Generating SUMMARY STATISTICS...")
-        
-        cursor.execute('SELECT COUNT(*) as total_orders FROM orders')
-        total_orders = cursor.fetchone()['total_orders']
-        
-        cursor.execute('SELECT SUM(total_amount) as total_revenue FROM orders')
-        total_revenue = cursor.fetchone()['total_revenue'] or 0
-        
-        cursor.execute('SELECT COUNT(*) as total_customers FROM users WHERE is_admin = 0')
-        total_customers = cursor.fetchone()['total_customers']
-        
-        cursor.execute('SELECT COUNT(*) as total_products FROM products')
-        total_products = cursor.fetchone()['total_products']
-        
-        cursor.execute('SELECT SUM(quantity_sold) as total_units_sold FROM sales_tracking')
-        total_units = cursor.fetchone()['total_units_sold'] or 0
-        
-        cursor.execute('SELECT SUM(stock) as total_stock FROM products')
-        total_stock = cursor.fetchone()['total_stock'] or 0
-        
-        statistics = {
-            "export_date": datetime.now().isoformat(),
-            "summary": {
-                "total_orders": total_orders,
-                "total_revenue": float(total_revenue),
-                "total_customers": total_customers,
-                "total_products": total_products,
-                "total_units_sold": total_units,
-                "total_stock_remaining": total_stock,
-                "average_order_value": float(total_revenue / total_orders) if total_orders > 0 else 0
-            },
-            "sales_data": {
-                "total_files": len(sales_data),
-                "latest_order_date": max([item['order_date'] for item in sales_data]) if sales_data else None
-            },
-            "inventory_data": {
-                "total_products": len(inventory_data),
-                "in_stock_products": len([x for x in inventory_data if x['stock_status'] == 'IN STOCK']),
-                "low_stock_products": len([x for x in inventory_data if x['stock_status'] == 'LOW STOCK']),
-                "out_of_stock_products": len([x for x in inventory_data if x['stock_status'] == 'OUT OF STOCK'])
-            }
-        }
-        
+
+        statistics = summary_statistics(conn)
+        statistics["exports"] = reports
+
         # Export statistics
-        stats_file = f'exports/summary_statistics_{timestamp}.json'
+        stats_file = os.path.join(EXPORT_DIR, f'summary_statistics_{timestamp}.json')
         with open(stats_file, 'w') as f:
             json.dump(statistics, f, indent=2)
         print(f"  ✓ Statistics exported: {stats_file}")
-        
+
+        summary = statistics['summary']
+        inventory = statistics['inventory_data']
+
         # Print summary to console
         print("\n" + "="*60)
         print("SUMMARY STATISTICS")
         print("="*60)
         print(f"\n📦 Products & Inventory:")
-        print(f"  • Total Products: {total_products}")
-        print(f"  • In Stock: {statistics['inventory_data']['in_stock_products']}")
-        print(f"  • Low Stock: {statistics['inventory_data']['low_stock_products']}")
-        print(f"  • Out of Stock: {statistics['inventory_data']['out_of_stock_products']}")
-        print(f"  • Total Stock Remaining: {total_stock} units")
-        
+        print(f"  • Total Products: {summary['total_products']}")
+        print(f"  • In Stock: {inventory['in_stock_products']}")
+        print(f"  • Low Stock: {inventory['low_stock_products']}")
+        print(f"  • Out of Stock: {inventory['out_of_stock_products']}")
+        print(f"  • Total Stock Remaining: {summary['total_stock_remaining']} units")
+
         print(f"\n💰 Sales & Revenue:")
-        print(f"  • Total Orders: {total_orders}")
-        print(f"  • Total Revenue: ${total_revenue:,.2f}")
-        print(f"  • Units Sold: {total_units}")
-        print(f"  • Average Order Value: ${statistics['summary']['average_order_value']:,.2f}")
-        
+        print(f"  • Total Orders: {summary['total_orders']}")
+        print(f"  • Total Revenue: ${summary['total_revenue']:,.2f}")
+        print(f"  • Units Sold: {summary['total_units_sold']}")
+        print(f"  • Average Order Value: ${summary['average_order_value']:,.2f}")
+
         print(f"\n👥 Customers:")
-        print(f"  • Total Customers: {total_customers}")
-        
+        print(f"  • Total Customers: {summary['total_customers']}")
+
         conn.close()
-        
+
+        total_rows = sum(r['rows'] for r in reports)
+        total_seconds = sum(r['seconds'] for r in reports)
+        wall_seconds = time.perf_counter() - started
+
         print("\n" + "="*60)
         print("✅ EXPORT COMPLETE!")
         print("="*60)
-        print(f"\n📁 All files saved to: exports/")
+        print(f"\n📁 All files saved to: {EXPORT_DIR}/")
+        print(f"⏱  {total_rows:,} rows in {wall_seconds:.2f}s wall clock "
+              f"({total_seconds:.2f}s summed across datasets, {jobs} job(s))")
         print(f"\nFiles created:")
-        print(f"  • sales_data_{timestamp}.csv / .json")
-        print(f"  • customer_purchases_{timestamp}.csv / .json")
-        print(f"  • inventory_stock_{timestamp}.csv / .json")
-        print(f"  • sales_summary_{timestamp}.csv / .json")
+        for report in reports:
+            for path in report['files']:
+                print(f"  • {os.path.basename(path)}")
         print(f"  • summary_statistics_{timestamp}.json")
-        
+
         return True
-        
+
     except Exception as e:
         print(f"\n❌ Error during export: {e}")
         import traceback
         traceback.print_exc()
         return False
 
+    finally:
+        if snapshot_path and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export store data to CSV/JSON files')
+    parser.add_argument('--format', default=','.join(DEFAULT_FORMATS),
+                        help=f"comma-separated output formats: {', '.join(FORMATS)} "
+                             f"(default: {','.join(DEFAULT_FORMATS)})")
+    parser.add_argument('--gzip', action='store_true', help='gzip-compress every output file')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'rows fetched per cursor batch (default: {BATCH_SIZE})')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='datasets exported in parallel from one snapshot (default: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='export only rows added or changed since the last run')
+    parser.add_argument('--full', action='store_true',
+                        help='write a full snapshot and compact away earlier deltas')
+    parser.add_argument('--compact-after', type=int, default=COMPACT_AFTER,
+                        help=f'deltas kept before an incremental run writes a full '
+                             f'snapshot instead (default: {COMPACT_AFTER})')
+    parser.add_argument('--source', choices=('primary', 'replica'), default=None,
+                        help=f'database to read (default: {db.REPORTING_SOURCE}, '
+                             f'from MUSIC_STORE_REPORTING)')
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    formats = tuple(f.strip() for f in args.format.split(',') if f.strip())
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown or not formats:
+        parser.error(f"unknown format(s): {', '.join(unknown) or '(none)'}")
+    if 'parquet' in formats and columnar.pyarrow is None:
+        parser.error("parquet output needs pyarrow: pip install pyarrow")
+    args.formats = formats
+    return args
+
 if __name__ == "__main__":
+    args = parse_args()
+
     print("="*60)
     print("DATABASE EXPORT UTILITY")
     print("="*60)
-    
-    success = export_to_csv_and_json()
-    
+
+    success = export_to_csv_and_json(args.formats, args.gzip, args.batch_size, args.jobs,
+                                     args.incremental, args.full, args.compact_after,
+                                     args.source)
+
     if success:
         print("\n✨ You can now open the CSV files in Excel or Google Sheets!")
         print("✨ Or view the JSON files in any text editor!")
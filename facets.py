@@ -0,0 +1,349 @@
+"""
+Catalog Facets
+In-memory bitmap index over products for facet counts. Every category,
+brand, price bucket, rating and the in-stock flag has a bitmap (a Python
+int with one bit per product), so counting a facet under any mix of
+filters is a few ANDs and popcounts rather than a GROUP BY per facet.
+Products get dense bit positions, reused after deletes, so bitmaps grow
+with the number of products rather than the highest product id.
+
+The index is loaded with one scan on first use and kept current by the
+admin hooks and refresh() on the checkout path. Writes made by other
+worker processes show up once a background rebuild swaps in a fresh
+scan, at most the catalog cache TTL later; requests keep counting on the
+current bitmaps while it runs.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+import catalog
+import db
+from catalog_cache import TTL
+
+# Lower edges of the price buckets; the last one is open-ended
+PRICE_BUCKETS = (0, 100, 250, 500, 1000, 2500)
+
+_COLUMNS = 'SELECT id, category, brand, price, rating, stock FROM products'
+
+logger = logging.getLogger('music_store.facets')
+
+
+def _bucket(price):
+    return max(bisect.bisect_right(PRICE_BUCKETS, price or 0) - 1, 0)
+
+
+class _Bitmaps:
+    """One generation of the index: the bitmaps and the rows behind them"""
+
+    def __init__(self):
+        self.rows = {}
+        self.slots = {}
+        self.ids = []
+        self.free = []
+        self.all = 0
+        self.categories = {}
+        self.brands = {}
+        self.prices = [0] * len(PRICE_BUCKETS)
+        self.ratings = {}
+        self.in_stock = 0
+
+    def add(self, product_id, category, brand, price, rating, stock):
+        if self.free:
+            slot = self.free.pop()
+            self.ids[slot] = product_id
+        else:
+            slot = len(self.ids)
+            self.ids.append(product_id)
+        self.slots[product_id] = slot
+        bit = 1 << slot
+        self.rows[product_id] = (category, brand, price, rating, stock)
+        self.all |= bit
+        self.categories[category] = self.categories.get(category, 0) | bit
+        self.brands[brand] = self.brands.get(brand, 0) | bit
+        self.prices[_bucket(price)] |= bit
+        if rating is not None:
+            self.ratings[rating] = self.ratings.get(rating, 0) | bit
+        if stock and stock > 0:
+            self.in_stock |= bit
+
+    def remove(self, product_id):
+        row = self.rows.pop(product_id, None)
+        if row is None:
+            return None
+        category, brand, price, rating, _ = row
+        slot = self.slots.pop(product_id)
+        self.ids[slot] = None
+        self.free.append(slot)
+        mask = ~(1 << slot)
+        self.all &= mask
+        self.categories[category] &= mask
+        self.brands[brand] &= mask
+        self.prices[_bucket(price)] &= mask
+        if rating is not None:
+            self.ratings[rating] &= mask
+        self.in_stock &= mask
+        return row
+
+    def bits(self, product_ids):
+        """Bitmap of the given products that are in the index"""
+        bits = 0
+        for product_id in product_ids:
+            slot = self.slots.get(product_id)
+            if slot is not None:
+                bits |= 1 << slot
+        return bits
+
+
+def _scan(conn):
+    data = _Bitmaps()
+    for row in conn.execute(_COLUMNS):
+        data.add(*row)
+    return data
+
+
+class FacetIndex:
+    """Bitmaps per facet value over the products table"""
+
+    def __init__(self, ttl=TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Held by the request that builds the index on first use
+        self._load_lock = threading.Lock()
+        self._data = None
+        self._loaded_at = None
+        # pid of the process whose background rebuild is running
+        self._building = None
+        # (product id, row or None) applied by refresh() while a scan runs,
+        # replayed onto the new bitmaps before they are swapped in
+        self._replay = None
+        self.rebuilds = 0
+        self.refreshes = 0
+
+    def _swap(self, data):
+        """Install freshly scanned bitmaps; call with the lock held"""
+        for product_id, row in self._replay or ():
+            data.remove(product_id)
+            if row is not None:
+                data.add(*row)
+        self._replay = None
+        self._data = data
+        self._loaded_at = time.monotonic()
+        self.rebuilds += 1
+
+    def _rebuild(self):
+        """Background thread: scan on a connection of its own, then swap"""
+        try:
+            conn = db.connect()
+            try:
+                data = _scan(conn)
+            finally:
+                conn.close()
+        except Exception:
+            logger.exception('Facet index rebuild failed; keeping the current bitmaps')
+            data = None
+        with self._lock:
+            if data is not None:
+                self._swap(data)
+            else:
+                self._replay = None
+                self._loaded_at = time.monotonic()
+            self._building = None
+
+    def _current(self, conn):
+        """The bitmaps to count on, starting a rebuild once they are stale"""
+        with self._lock:
+            data = self._data
+            if data is not None:
+                stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+                if stale and self._building != os.getpid():
+                    self._building = os.getpid()
+                    self._replay = []
+                    threading.Thread(target=self._rebuild, name='facet-rebuild',
+                                     daemon=True).start()
+                return data
+
+        # First use: one request scans, the others wait for it
+        with self._load_lock:
+            with self._lock:
+                if self._data is not None:
+                    return self._data
+                self._replay = []
+            try:
+                data = _scan(conn)
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                raise
+            with self._lock:
+                self._swap(data)
+                return data
+
+    def invalidate(self):
+        """Mark the index stale; the next facet request starts a rebuild"""
+        with self._lock:
+            self._loaded_at = None
+
+    def refresh(self, conn, product_ids):
+        """
+        Re-read product_ids after a write (a missing row was deleted).
+        Returns the ids that are out of stock now but were in stock
+        before; while the index is not loaded, every out-of-stock id.
+        """
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+        placeholders = ', '.join('?' * len(product_ids))
+        rows = {row[0]: tuple(row) for row in conn.execute(
+            f'{_COLUMNS} WHERE id IN ({placeholders})', product_ids)}
+
+        sold_out = []
+        with self._lock:
+            data = self._data
+            if self._replay is not None:
+                self._replay.extend((product_id, rows.get(product_id))
+                                    for product_id in product_ids)
+            for product_id in product_ids:
+                old = data.remove(product_id) if data is not None else None
+                row = rows.get(product_id)
+                if row is None:
+                    continue
+                if data is not None:
+                    data.add(*row)
+                if not (row[5] and row[5] > 0) and (data is None or (old and old[4] and old[4] > 0)):
+                    sold_out.append(product_id)
+            self.refreshes += 1
+        return sold_out
+
+    def product_added(self, conn, product_id):
+        """Hook for an admin insert"""
+        self.refresh(conn, [product_id])
+
+    def product_updated(self, conn, product_id):
+        """Hook for an admin edit"""
+        self.refresh(conn, [product_id])
+
+    def product_deleted(self, product_id):
+        """Hook for an admin delete; nothing is left to read back"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((product_id, None))
+            if self._data is not None:
+                self._data.remove(product_id)
+            self.refreshes += 1
+
+    @staticmethod
+    def _price_bits(data, min_price, max_price):
+        """Products with min_price <= price <= max_price, as catalog.build_filters reads them"""
+        bits = 0
+        edges = PRICE_BUCKETS + (float('inf'),)
+        for index, bitmap in enumerate(data.prices):
+            low, high = edges[index], edges[index + 1]
+            if (max_price and low > max_price) or (min_price and high <= min_price):
+                continue
+            if (not min_price or low >= min_price) and (not max_price or high <= max_price):
+                bits |= bitmap
+                continue
+            # A bucket the range cuts through: check each product in it
+            while bitmap:
+                low_bit = bitmap & -bitmap
+                price = data.rows[data.ids[low_bit.bit_length() - 1]][2]
+                if (not min_price or price >= min_price) and (not max_price or price <= max_price):
+                    bits |= low_bit
+                bitmap ^= low_bit
+        return bits
+
+    @staticmethod
+    def _search_ids(conn, search):
+        use_index = catalog.has_search_index(conn)
+        clauses, params = catalog.build_filters(search=search, use_index=use_index)
+        query = 'SELECT p.id FROM products p'
+        if use_index:
+            query += ' JOIN products_fts ON products_fts.rowid = p.id'
+        return [row[0] for row in conn.execute(query + ' WHERE ' + ' AND '.join(clauses), params)]
+
+    def counts(self, conn, filters):
+        """
+        Facet counts for a listing's filters (the dict catalog.list_products
+        takes). Each facet is counted under every filter except its own,
+        so choosing a category still shows what the other categories hold.
+        """
+        filters = filters or {}
+        search = filters.get('search')
+        search = search if search and catalog.search_query(search) else ''
+        search_ids = self._search_ids(conn, search) if search else None
+        data = self._current(conn)
+
+        with self._lock:
+            everything = data.all
+            selected = {
+                'category': catalog.filter_values(filters.get('category')),
+                'brand': catalog.filter_values(filters.get('brand')),
+            }
+            masks = {}
+            for name, bitmaps in (('category', data.categories), ('brand', data.brands)):
+                if selected[name]:
+                    masks[name] = 0
+                    for value in selected[name]:
+                        masks[name] |= bitmaps.get(value, 0)
+            if filters.get('min_price') or filters.get('max_price'):
+                masks['price'] = self._price_bits(data, filters.get('min_price'),
+                                                  filters.get('max_price'))
+            min_rating = filters.get('min_rating')
+            if min_rating:
+                masks['rating'] = 0
+                for rating, bitmap in data.ratings.items():
+                    if rating >= min_rating:
+                        masks['rating'] |= bitmap
+            if filters.get('in_stock'):
+                masks['in_stock'] = data.in_stock
+            if search_ids is not None:
+                masks['search'] = data.bits(search_ids)
+
+            def base(excluding=None):
+                bits = everything
+                for name, mask in masks.items():
+                    if name != excluding:
+                        bits &= mask
+                return bits
+
+            def value_counts(name, bitmaps):
+                bits = base(name)
+                counts = {value: (bits & bitmap).bit_count() for value, bitmap in bitmaps.items()}
+                return {value: count for value, count in sorted(counts.items())
+                        if count or value in selected[name]}
+
+            price_bits = base('price')
+            edges = PRICE_BUCKETS + (None,)
+            return {
+                'total': base().bit_count(),
+                'categories': value_counts('category', data.categories),
+                'brands': value_counts('brand', data.brands),
+                'price': [{'min': edges[i], 'max': edges[i + 1],
+                           'count': (price_bits & bitmap).bit_count()}
+                          for i, bitmap in enumerate(data.prices)],
+                'in_stock': (base('in_stock') & data.in_stock).bit_count(),
+            }
+
+    def stats(self):
+        with self._lock:
+            data = self._data
+            loaded = data is not None
+            fresh = self._loaded_at is not None
+            return {
+                'loaded': loaded,
+                'products': len(data.rows) if loaded else 0,
+                'bits': len(data.ids) if loaded else 0,
+                'categories': len(data.categories) if loaded else 0,
+                'brands': len(data.brands) if loaded else 0,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if fresh else None,
+                'rebuilding': self._building == os.getpid(),
+                'rebuilds': self.rebuilds,
+                'refreshes': self.refreshes,
+            }
+
+
+index = FacetIndex()
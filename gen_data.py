@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator
+Populates the store with N users, M products and K orders for load
+testing. The same --seed always produces the same rows, so benchmark
+runs on generated data are comparable
+
+    python gen_data.py --users 1000 --products 2000 --orders 20000
+
+Users and products are matched on username and (brand, name) and only
+added when missing; orders are appended on every run. Bench users log
+in with bench_user_<n> / bench123.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import db
+import migrate_db
+import passwords
+import write_behind
+from orders import ORDER_STATUSES
+
+USERS = 1000
+PRODUCTS = 2000
+ORDERS = 20000
+SEED = 42
+# Orders are spread over this many days up to the anchor date. The
+# anchor is fixed, not today, so a seed gives the same rows on any day
+DAYS = 90
+ANCHOR = datetime(2025, 12, 31)
+
+USER_PREFIX = 'bench_user_'
+USER_PASSWORD = 'bench123'
+BATCH_SIZE = 5000
+
+# category: (brands, product nouns)
+CATALOG = {
+    'Guitars': (['Fender', 'Gibson', 'Ibanez', 'Epiphone', 'PRS', 'Gretsch'],
+                ['Electric Guitar', 'Acoustic Guitar', 'Bass Guitar', 'Hollow Body Guitar']),
+    'Pianos & Keyboards': (['Yamaha', 'Korg', 'Roland', 'Casio', 'Nord', 'Kawai'],
+                           ['Digital Piano', 'Stage Piano', 'Synthesizer', 'MIDI Keyboard']),
+    'Drums': (['Pearl', 'Roland', 'Tama', 'Ludwig', 'DW', 'Alesis'],
+              ['Drum Kit', 'Snare Drum', 'Electronic Drum Kit', 'Cymbal Pack']),
+    'Violins': (['Stentor', 'Yamaha', 'Eastman', 'Cremona', 'Scherl'],
+                ['Violin', 'Viola', 'Cello', 'Violin Bow']),
+    'Flutes': (['Yamaha', 'Pearl', 'Jupiter', 'Trevor James', 'Gemeinhardt'],
+               ['Flute', 'Piccolo', 'Alto Flute', 'Headjoint']),
+    'DJ Equipment': (['Pioneer', 'Numark', 'Denon', 'Rane', 'Native Instruments'],
+                     ['DJ Controller', 'Mixer', 'Turntable', 'Media Player']),
+    'Accessories': (['Shure', 'Boss', "D'Addario", 'Ernie Ball', 'Audio-Technica', 'Vic Firth'],
+                    ['Microphone', 'Amplifier', 'Strings Pack', 'Headphones', 'Effects Pedal',
+                     'Drumsticks']),
+}
+SERIES = ['Classic', 'Studio', 'Pro', 'Standard', 'Deluxe', 'Custom', 'Player', 'Vintage',
+          'Stage', 'Junior']
+PAYMENT_METHODS = ['cash_on_delivery', 'card', 'upi', 'net_banking']
+STATUS_WEIGHTS = [10, 15, 20, 50, 5]
+
+_INSERT_USER = '''INSERT INTO users (username, email, password) VALUES (?, ?, ?)
+                  ON CONFLICT DO NOTHING'''
+_INSERT_PRODUCT = '''INSERT INTO products
+                     (name, category, brand, price, description, specifications,
+                      image_url, rating, stock)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (brand, name) DO NOTHING'''
+_INSERT_ORDER = '''INSERT INTO orders (id, user_id, total_amount, status, payment_method,
+                                       delivery_address, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)'''
+_INSERT_ITEM = '''INSERT INTO order_items (order_id, product_id, quantity, price)
+                  VALUES (?, ?, ?, ?)'''
+
+
+def generate_users(count):
+    """(username, email, password hash) for bench users 1..count"""
+    # One KDF hash shared by every bench user; hashing each would take minutes
+    password = passwords.hash_password(USER_PASSWORD)
+    return [(f'{USER_PREFIX}{n}', f'{USER_PREFIX}{n}@example.com', password)
+            for n in range(1, count + 1)]
+
+
+def generate_products(rng, count):
+    """Product rows in the column order seed.SAMPLE_PRODUCTS uses"""
+    categories = list(CATALOG)
+    rows = []
+    for n in range(1, count + 1):
+        category = categories[n % len(categories)]
+        brands, nouns = CATALOG[category]
+        brand = rng.choice(brands)
+        noun = rng.choice(nouns)
+        series = rng.choice(SERIES)
+        name = f'{brand} {series} {noun} {n:05d}'
+        price = round(rng.lognormvariate(5.5, 1.0), 2) + 0.99
+        rows.append((name, category, brand, min(price, 9999.99),
+                     f'{series} {noun.lower()} from {brand}',
+                     f'Model {n:05d}, {series.lower()} series',
+                     None, round(rng.uniform(3.5, 5.0), 1), rng.randint(50, 500)))
+    return rows
+
+
+def generate_orders(rng, count, first_id, user_ids, products, anchor, days):
+    """
+    Orders with ids from first_id, in created_at order, and their lines.
+    products is a list of (id, price); popularity is skewed so a few
+    products sell most, like a real catalog.
+    Returns (orders, items).
+    """
+    span = days * 86400
+    offsets = sorted(rng.random() * span for _ in range(count))
+    weights = [1 / (rank + 1) for rank in range(len(products))]
+    orders, items = [], []
+    for n, offset in enumerate(offsets):
+        order_id = first_id + n
+        created_at = anchor - timedelta(seconds=span - offset)
+        lines = {}
+        for product_id, price in rng.choices(products, weights, k=rng.randint(1, 4)):
+            quantity, _ = lines.get(product_id, (0, price))
+            lines[product_id] = (quantity + rng.randint(1, 2), price)
+        total = round(sum(quantity * price for quantity, price in lines.values()), 2)
+        orders.append((order_id, rng.choice(user_ids), total,
+                       rng.choices(ORDER_STATUSES, STATUS_WEIGHTS)[0],
+                       rng.choice(PAYMENT_METHODS), f'{rng.randint(1, 999)} Bench Street',
+                       created_at.strftime('%Y-%m-%d %H:%M:%S')))
+        items.extend((order_id, product_id, quantity, price)
+                     for product_id, (quantity, price) in lines.items())
+    return orders, items
+
+
+def _insert_batches(conn, sql, rows):
+    """executemany in batches; returns the rows inserted, not counting trigger writes"""
+    inserted = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        inserted += conn.executemany(sql, rows[start:start + BATCH_SIZE]).rowcount
+    return inserted
+
+
+def generate(conn, users=USERS, products=PRODUCTS, orders=ORDERS, seed=SEED,
+             anchor=ANCHOR, days=DAYS):
+    """
+    Insert the synthetic data in one write transaction, keeping
+    sales_tracking and the rollups in step with the new orders.
+    Returns (users added, products added, orders added).
+    """
+    rng = random.Random(seed)
+    anchor = anchor or ANCHOR
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        users_added = _insert_batches(conn, _INSERT_USER, generate_users(users))
+        products_added = _insert_batches(conn, _INSERT_PRODUCT, generate_products(rng, products))
+
+        user_ids = [row[0] for row in conn.execute(
+            'SELECT id FROM users WHERE username LIKE ? ORDER BY id', (f'{USER_PREFIX}%',))]
+        catalog = [tuple(row) for row in conn.execute('SELECT id, price FROM products ORDER BY id')]
+        orders_added = 0
+        if orders and user_ids and catalog:
+            after_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]
+            order_rows, item_rows = generate_orders(rng, orders, after_id + 1, user_ids, catalog,
+                                                    anchor, days)
+            orders_added = _insert_batches(conn, _INSERT_ORDER, order_rows)
+            _insert_batches(conn, _INSERT_ITEM, item_rows)
+
+            # With write-behind on, the new orders sit past its watermark and
+            # are folded in with anything else pending; otherwise fold them here
+            if not write_behind.apply_pending(conn):
+                write_behind.fold_orders(conn, after_id, after_id + orders_added)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return users_added, products_added, orders_added
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Populate the store with synthetic data')
+    parser.add_argument('--users', type=int, default=USERS, help=f'bench users (default: {USERS})')
+    parser.add_argument('--products', type=int, default=PRODUCTS,
+                        help=f'products (default: {PRODUCTS})')
+    parser.add_argument('--orders', type=int, default=ORDERS,
+                        help=f'orders to append (default: {ORDERS})')
+    parser.add_argument('--seed', type=int, default=SEED, help=f'random seed (default: {SEED})')
+    parser.add_argument('--days', type=int, default=DAYS,
+                        help=f'days of order history (default: {DAYS})')
+    parser.add_argument('--anchor', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        default=ANCHOR,
+                        help=f'date the order history ends at, YYYY-MM-DD '
+                             f'(default: {ANCHOR:%Y-%m-%d})')
+    parser.add_argument('--db', default=db.DB_PATH, help=f'database file (default: {db.DB_PATH})')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("=" * 50)
+    print("SYNTHETIC DATA GENERATOR")
+    print("=" * 50)
+    print()
+
+    conn = db.connect(args.db)
+    try:
+        migrate_db.migrate(conn)
+        started = time.perf_counter()
+        added = generate(conn, args.users, args.products, args.orders, args.seed,
+                         args.anchor, args.days)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    print(f"✓ Users added:    {added[0]:,}")
+    print(f"✓ Products added: {added[1]:,}")
+    print(f"✓ Orders added:   {added[2]:,}")
+    print(f"✓ Done in {elapsed:.2f}s")
+    print(f"\n✅ Bench users log in as {USER_PREFIX}<n> / {USER_PASSWORD}")
+    print("   Restart running servers so their caches pick up the new data")
@@ -0,0 +1,38 @@
+"""
+Gunicorn Configuration
+The same production setup as serve.py, for hosts with gunicorn installed:
+
+    gunicorn -c gunicorn.conf.py
+
+Send HUP for a graceful reload and TERM for a graceful stop.
+"""
+
+import os
+
+import passwords
+import serve
+
+wsgi_app = 'app:app'
+bind = serve.BIND
+workers = serve.WORKERS
+threads = int(os.environ.get('SERVE_THREADS', 4))
+
+# Load the app, and so initialise the database, once in the master;
+# workers share it through copy-on-write
+preload_app = True
+
+# Recycle workers to bound memory growth, staggered by the jitter
+max_requests = serve.MAX_REQUESTS
+max_requests_jitter = serve.MAX_REQUESTS_JITTER
+graceful_timeout = serve.GRACEFUL_TIMEOUT
+backlog = serve.BACKLOG
+
+
+def post_fork(server, worker):
+    # Each worker forks its own password hashing processes before it
+    # starts its threads
+    passwords.pool.start()
+
+
+def worker_exit(server, worker):
+    passwords.pool.shutdown()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Bulk Product Import
+Adds and updates products from a CSV or NDJSON stream
+
+    python import_products.py catalog.csv
+    python import_products.py - --format ndjson < catalog.ndjson
+
+Rows are matched on their natural key (brand, name): new products are
+inserted and existing ones updated in place. Rows are validated and
+upserted in batches, each batch in its own short transaction, so a large
+import never holds the write lock for long. A bad row is reported with
+its line number and skipped; the rest of its batch still goes in.
+Caches and the facet index are refreshed once at the end, not per row.
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import catalog
+import catalog_cache
+import db
+import facets
+import migrate_db
+
+BATCH_SIZE = int(os.environ.get('MUSIC_STORE_IMPORT_BATCH_SIZE', 1000))
+# Imports writing at least this many rows merge the search index into one
+# segment afterwards; smaller ones leave it to FTS5's automerge
+OPTIMIZE_ROWS = int(os.environ.get('MUSIC_STORE_IMPORT_OPTIMIZE_ROWS', 10000))
+# At most this many row errors are listed in a report; the rest are only counted
+MAX_ERRORS = 100
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson',
+                 'application/ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+REQUIRED = ('name', 'category', 'brand', 'price')
+
+# Optional fields left out of a row keep their current value on update
+# and take the column default on insert
+_UPSERT = '''
+    INSERT INTO products (name, category, brand, price, description, specifications,
+                          image_url, rating, stock)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, COALESCE(?8, 5.0), COALESCE(?9, 10))
+    ON CONFLICT (brand, name) DO UPDATE SET
+        category = ?2,
+        price = ?4,
+        description = COALESCE(?5, description),
+        specifications = COALESCE(?6, specifications),
+        image_url = COALESCE(?7, image_url),
+        rating = COALESCE(?8, rating),
+        stock = COALESCE(?9, stock)
+'''
+
+
+class FormatError(ValueError):
+    """The stream as a whole cannot be imported (bad format or header)"""
+
+
+def _number(value, field):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be a number, got {value!r}')
+    if not math.isfinite(number):
+        raise ValueError(f'{field} must be a finite number')
+    return number
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate(row):
+    """
+    Check one row (a dict of field -> value, strings from CSV or JSON
+    values) and return the parameter tuple for the upsert. Raises
+    ValueError naming the first problem. Empty values count as missing.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+
+    name, category, brand = (_text(row.get(field)) for field in ('name', 'category', 'brand'))
+    price = _text(row.get('price'))
+    missing = [field for field, value in zip(REQUIRED, (name, category, brand, price))
+               if value is None]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    price = _number(price, 'price')
+    if price < 0:
+        raise ValueError('price must not be negative')
+
+    rating = _text(row.get('rating'))
+    if rating is not None:
+        rating = _number(rating, 'rating')
+        if not 0 <= rating <= 5:
+            raise ValueError('rating must be between 0 and 5')
+
+    stock = _text(row.get('stock'))
+    if stock is not None:
+        stock = _number(stock, 'stock')
+        if not stock.is_integer():
+            raise ValueError(f'stock must be a whole number, got {stock:g}')
+        stock = int(stock)
+        if stock < 0:
+            raise ValueError('stock must not be negative')
+
+    return (name, category, brand, round(price, 2), _text(row.get('description')),
+            _text(row.get('specifications')), _text(row.get('image_url')), rating, stock)
+
+
+def read_csv(lines):
+    """(line number, row dict) for each record of a CSV stream with a header row"""
+    reader = csv.DictReader(lines)
+    header = reader.fieldnames or []
+    missing = [field for field in REQUIRED if field not in header]
+    if missing:
+        raise FormatError(f"CSV header is missing {', '.join(missing)}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(lines):
+    """
+    (line number, row dict) for each line of an NDJSON stream. A line
+    that is not valid JSON is passed on as its error message instead.
+    """
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            yield line_num, f'invalid JSON: {e}'
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def detect_format(content_type=None, filename=None):
+    """Import format from a Content-Type or a file extension, or None"""
+    if content_type:
+        return CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+    if filename:
+        return EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    return None
+
+
+class Report:
+    """Running totals for one import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'batches': self.batches,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def _upsert_batch(conn, batch, report):
+    """Upsert one batch of (line, params) in its own transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM products').fetchone()[0]
+        conn.execute('SAVEPOINT import_batch')
+        try:
+            written = conn.executemany(_UPSERT, [params for _, params in batch]).rowcount
+        except sqlite3.DatabaseError:
+            # Something in the batch was rejected: redo it row by row so
+            # only the offending rows are skipped
+            conn.execute('ROLLBACK TO import_batch')
+            written = 0
+            for line, params in batch:
+                try:
+                    written += conn.execute(_UPSERT, params).rowcount
+                except sqlite3.DatabaseError as e:
+                    report.error(line, str(e))
+        conn.execute('RELEASE import_batch')
+        inserted = conn.execute('SELECT COUNT(*) FROM products WHERE id > ?',
+                                (last_id,)).fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    report.inserted += inserted
+    report.updated += written - inserted
+    report.batches += 1
+
+
+def import_rows(conn, records, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Validate and upsert (line number, row) records, as the readers yield
+    them. With dry_run the rows are only validated. Returns a Report.
+    """
+    report = Report()
+    batch = []
+    for line, row in records:
+        report.rows += 1
+        if isinstance(row, str):
+            report.error(line, row)
+            continue
+        try:
+            batch.append((line, validate(row)))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            if not dry_run:
+                _upsert_batch(conn, batch, report)
+            batch = []
+    if batch and not dry_run:
+        _upsert_batch(conn, batch, report)
+
+    if report.inserted or report.updated:
+        refresh_catalog(conn, report.inserted + report.updated)
+    return report
+
+
+def refresh_catalog(conn, rows_written=0):
+    """One refresh of everything derived from products after an import"""
+    # The FTS triggers kept the search index current row by row. Merging
+    # rewrites the whole index, so it only pays off after a large import
+    if rows_written >= OPTIMIZE_ROWS and catalog.has_search_index(conn):
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+        conn.commit()
+    facets.index.invalidate()
+    catalog_cache.cache.invalidate()
+
+
+def import_stream(conn, stream, fmt, batch_size=BATCH_SIZE, dry_run=False):
+    """Import a text stream of the given format; returns a Report"""
+    if fmt not in READERS:
+        raise FormatError(f"Unsupported format {fmt!r}; use one of {', '.join(FORMATS)}")
+    return import_rows(conn, READERS[fmt](stream), batch_size, dry_run)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Bulk add and update products from CSV or NDJSON')
+    parser.add_argument('file', help="CSV or NDJSON file, or - for stdin")
+    parser.add_argument('--format', choices=FORMATS,
+                        help='input format (default: from the file extension)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'rows per transaction (default: {BATCH_SIZE})')
+    parser.add_argument('--dry-run', action='store_true', help='validate only, write nothing')
+    parser.add_argument('--db', default=db.DB_PATH, help=f'database file (default: {db.DB_PATH})')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("=" * 50)
+    print("BULK PRODUCT IMPORT")
+    print("=" * 50)
+    print()
+
+    fmt = args.format or detect_format(filename=args.file)
+    if fmt is None:
+        sys.exit("❌ Cannot tell the format from the file name; pass --format")
+
+    stream = (io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+              if args.file == '-' else open(args.file, encoding='utf-8-sig', newline=''))
+    conn = db.connect(args.db)
+    try:
+        migrate_db.migrate(conn)
+        started = time.perf_counter()
+        report = import_stream(conn, stream, fmt, args.batch_size, args.dry_run)
+        elapsed = time.perf_counter() - started
+    except FormatError as e:
+        sys.exit(f"❌ {e}")
+    finally:
+        conn.close()
+        stream.close()
+
+    print(f"✓ Rows read:  {report.rows:,}")
+    if args.dry_run:
+        print(f"✓ Valid rows: {report.rows - report.failed:,} (dry run, nothing written)")
+    else:
+        print(f"✓ Inserted:   {report.inserted:,}")
+        print(f"✓ Updated:    {report.updated:,}")
+    print(f"✓ Done in {elapsed:.2f}s")
+
+    if report.failed:
+        print(f"\n⚠️  {report.failed:,} rows failed:")
+        for error in report.errors:
+            print(f"   line {error['line']}: {error['error']}")
+        if report.failed > len(report.errors):
+            print(f"   ... and {report.failed - len(report.errors):,} more")
+    else:
+        print("\n✅ All rows imported")
+    if not args.dry_run:
+        print("   Running servers keep their cached catalog until its TTL expires")
@@ -0,0 +1,477 @@
+"""
+Request Instrumentation
+Opt-in profiling, turned on with MUSIC_STORE_INSTRUMENT=1. Each request's
+get_db() connection is wrapped in a cursor proxy that records every
+statement with its normalised SQL, duration and rows, and each response
+carries a Server-Timing header splitting its time into DB, serialisation
+and the rest. Per-endpoint histograms, per-statement totals and pool
+stats are rendered for /metrics in Prometheus text format, and slow or
+repeated (N+1) statements are logged. N+1s that the client drives, such
+as one items request per order, show up instead as bursts: one session
+calling the same endpoint many times within a short window.
+
+Metrics are per process; under serve.py or gunicorn each worker reports
+its own, so scrape every worker or aggregate them.
+"""
+
+import bisect
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from flask import g, has_request_context, request, session
+from flask.json.provider import DefaultJSONProvider
+
+import db
+import replica
+
+ENABLED = os.environ.get('MUSIC_STORE_INSTRUMENT', '0') == '1'
+# Statements at least this slow are logged; 0 logs every statement
+SLOW_QUERY_MS = float(os.environ.get('MUSIC_STORE_SLOW_QUERY_MS', 100))
+# A statement run this many times in one request is probably an N+1
+REPEAT_THRESHOLD = int(os.environ.get('MUSIC_STORE_REPEAT_THRESHOLD', 10))
+# One client calling the same endpoint this many times within the window
+# is probably looping over a list it fetched (a client-side N+1)
+BURST_THRESHOLD = int(os.environ.get('MUSIC_STORE_BURST_THRESHOLD', 10))
+BURST_WINDOW_MS = float(os.environ.get('MUSIC_STORE_BURST_WINDOW_MS', 1000))
+# Clients whose recent requests are remembered for burst detection
+MAX_BURST_CLIENTS = 10000
+
+# Distinct statements tracked; anything past this is counted as 'other'
+MAX_STATEMENTS = 500
+SLOW_LOG_SIZE = 100
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger('music_store.sql')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize(sql):
+    """SQL with literals replaced by ? and IN (?, ?, ...) lists collapsed, on one line"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?, ...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class Statement:
+    """One executed statement; fetches after execute add to its time and rows"""
+
+    __slots__ = ('sql', 'seconds', 'rows')
+
+    def __init__(self, sql, seconds, rows):
+        self.sql = sql
+        self.seconds = seconds
+        self.rows = rows
+
+
+class Profile:
+    """What one request spent its time on"""
+
+    __slots__ = ('started', 'statements', 'phases')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []
+        self.phases = {}
+
+    def db_seconds(self):
+        return sum(statement.seconds for statement in self.statements)
+
+
+class TracedCursor:
+    """Cursor proxy that times execute and fetch calls into a Profile"""
+
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._statement = None
+
+    def _executed(self, sql, started):
+        cursor = self._cursor
+        # Statements without a result set report the rows they changed
+        rows = cursor.rowcount if cursor.description is None and cursor.rowcount > 0 else 0
+        self._statement = Statement(sql, time.perf_counter() - started, rows)
+        self._profile.statements.append(self._statement)
+
+    def _fetched(self, started, rows):
+        if self._statement is not None:
+            self._statement.seconds += time.perf_counter() - started
+            self._statement.rows += rows
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        self._cursor.execute(sql, parameters)
+        self._executed(sql, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_parameters)
+        self._executed(sql, started)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(self._cursor.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """Connection proxy whose cursors record into the request's Profile"""
+
+    def __init__(self, conn, profile):
+        self.wrapped = conn
+        self._profile = profile
+
+    def cursor(self):
+        return TracedCursor(self.wrapped.cursor(), self._profile)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def __enter__(self):
+        self.wrapped.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.wrapped.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+def wrap_connection(conn):
+    """db.connection_wrapper: trace the connection when a request is being profiled"""
+    profile = g.get('profile')
+    return conn if profile is None else TracedConnection(conn, profile)
+
+
+@contextmanager
+def _timed(profile, phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[phase] = profile.phases.get(phase, 0.0) + time.perf_counter() - started
+
+
+def timed(phase):
+    """Context manager adding the time spent inside to phase for the current request"""
+    if not ENABLED or not has_request_context():
+        return nullcontext()
+    profile = g.get('profile')
+    return nullcontext() if profile is None else _timed(profile, phase)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with jsonify's encoding counted as serialisation"""
+
+    def dumps(self, obj, **kwargs):
+        with timed('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Process-wide request and statement metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.histograms = {}
+        self.statements = {}
+        self.repeated = {}
+        self.bursts = {}
+        # (client, endpoint) -> times of its recent requests, oldest first
+        self._recent = OrderedDict()
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.slow_total = 0
+
+    def _observe(self, name, endpoint, buckets, value):
+        key = (name, endpoint)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def record(self, endpoint, method, status, profile, total):
+        """Fold one finished request into the metrics; returns its statements by SQL"""
+        by_sql = {}
+        for statement in profile.statements:
+            sql = normalize(statement.sql)
+            calls, seconds, rows = by_sql.get(sql, (0, 0.0, 0))
+            by_sql[sql] = (calls + 1, seconds + statement.seconds, rows + statement.rows)
+
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._observe('duration', endpoint, TIME_BUCKETS, total)
+            self._observe('db', endpoint, TIME_BUCKETS, profile.db_seconds())
+            self._observe('serialize', endpoint, TIME_BUCKETS,
+                          profile.phases.get('serialize', 0.0))
+            self._observe('statements', endpoint, COUNT_BUCKETS, len(profile.statements))
+            for sql, (calls, seconds, rows) in by_sql.items():
+                if sql not in self.statements and len(self.statements) >= MAX_STATEMENTS:
+                    sql = 'other'
+                totals = self.statements.setdefault(sql, [0, 0.0, 0])
+                totals[0] += calls
+                totals[1] += seconds
+                totals[2] += rows
+            if any(calls >= REPEAT_THRESHOLD for calls, _, _ in by_sql.values()):
+                self.repeated[endpoint] = self.repeated.get(endpoint, 0) + 1
+        return by_sql
+
+    def record_burst(self, endpoint, client, now):
+        """
+        Note a request from client. Returns how many requests it made to
+        endpoint within the burst window when that reaches BURST_THRESHOLD,
+        once per burst; otherwise None.
+        """
+        key = (client, endpoint)
+        cutoff = now - BURST_WINDOW_MS / 1000
+        with self._lock:
+            times = self._recent.pop(key, None) or deque()
+            while times and times[0] < cutoff:
+                times.popleft()
+            times.append(now)
+            self._recent[key] = times
+            while len(self._recent) > MAX_BURST_CLIENTS:
+                self._recent.popitem(last=False)
+            if len(times) != BURST_THRESHOLD:
+                return None
+            self.bursts[endpoint] = self.bursts.get(endpoint, 0) + 1
+            return len(times)
+
+    def log_slow(self, endpoint, statement):
+        ms = statement.seconds * 1000
+        sql = normalize(statement.sql)
+        logger.warning('slow query %.1f ms, %d rows, %s: %s', ms, statement.rows, endpoint, sql)
+        with self._lock:
+            self.slow_total += 1
+            self.slow.append({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'endpoint': endpoint,
+                'ms': round(ms, 3),
+                'rows': statement.rows,
+                'sql': sql,
+            })
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self.slow))
+
+    def render(self):
+        """Everything in Prometheus text exposition format"""
+        with self._lock:
+            requests = dict(self.requests)
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count)
+                          for key, h in self.histograms.items()}
+            statements = {sql: tuple(totals) for sql, totals in self.statements.items()}
+            repeated = dict(self.repeated)
+            bursts = dict(self.bursts)
+            slow_total = self.slow_total
+
+        lines = []
+        _metric(lines, 'music_store_http_requests_total', 'counter', 'Requests served',
+                [({'endpoint': e, 'method': m, 'status': s}, count)
+                 for (e, m, s), count in sorted(requests.items())])
+
+        for name, help_text in (
+                ('duration', 'Total request time in seconds'),
+                ('db', 'Time spent in SQLite statements per request, in seconds'),
+                ('serialize', 'Time spent encoding JSON per request, in seconds'),
+                ('statements', 'SQLite statements run per request')):
+            metric = ('music_store_http_request_statements' if name == 'statements'
+                      else f'music_store_http_request_{name}_seconds')
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for (kind, endpoint), (buckets, counts, total, count) in sorted(histograms.items()):
+                if kind != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{_labels(endpoint=endpoint, le=bound)} '
+                                 f'{cumulative}')
+                lines.append(f'{metric}_bucket{_labels(endpoint=endpoint, le="+Inf")} {count}')
+                lines.append(f'{metric}_sum{_labels(endpoint=endpoint)} {total:.6f}')
+                lines.append(f'{metric}_count{_labels(endpoint=endpoint)} {count}')
+
+        _metric(lines, 'music_store_http_requests_repeated_statements_total', 'counter',
+                f'Requests that ran one statement {REPEAT_THRESHOLD}+ times '
+                f'(server-side N+1 suspects)',
+                [({'endpoint': e}, count) for e, count in sorted(repeated.items())])
+
+        _metric(lines, 'music_store_http_request_bursts_total', 'counter',
+                f'Times one client called an endpoint {BURST_THRESHOLD}+ times within '
+                f'{BURST_WINDOW_MS:g} ms (client-side N+1 suspects)',
+                [({'endpoint': e}, count) for e, count in sorted(bursts.items())])
+
+        by_time = sorted(statements.items(), key=lambda item: -item[1][1])
+        for index, (metric, help_text) in enumerate((
+                ('music_store_db_statement_calls_total', 'Executions per normalised statement'),
+                ('music_store_db_statement_seconds_total', 'Time per normalised statement'),
+                ('music_store_db_statement_rows_total',
+                 'Rows returned or changed per normalised statement'))):
+            _metric(lines, metric, 'counter', help_text,
+                    [({'statement': sql}, totals[index]) for sql, totals in by_time])
+
+        _metric(lines, 'music_store_db_slow_statements_total', 'counter',
+                f'Statements slower than {SLOW_QUERY_MS:g} ms', [({}, slow_total)])
+
+        pool = db.pool.stats()
+        for name in ('open_connections', 'in_use', 'idle'):
+            _metric(lines, f'music_store_db_pool_{name}', 'gauge', f'Connection pool {name}',
+                    [({}, pool[name])])
+        for name in ('hits', 'misses', 'waits', 'timeouts'):
+            _metric(lines, f'music_store_db_pool_{name}_total', 'counter',
+                    f'Connection pool {name}', [({}, pool[name])])
+
+        # Reporting replica staleness; the lag is absent until a replica exists
+        status = replica.status()
+        _metric(lines, 'music_store_replica_available', 'gauge',
+                'Whether a refreshed reporting replica exists', [({}, int(status['available']))])
+        _metric(lines, 'music_store_replica_serving', 'gauge',
+                'Whether reports read from the replica rather than the primary',
+                [({}, int(status['serving_from'] == 'replica'))])
+        _metric(lines, 'music_store_replica_lag_seconds', 'gauge',
+                'Seconds since the reporting replica was last refreshed',
+                [({}, status['lag_seconds'])] if 'lag_seconds' in status else [])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        if isinstance(value, float):
+            value = f'{value:.6f}'
+        lines.append(f'{name}{_labels(**labels)} {value}')
+
+
+metrics = Metrics()
+
+
+def _start_request():
+    g.profile = Profile()
+
+
+def _finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    total = time.perf_counter() - profile.started
+    endpoint = request.endpoint or 'unmatched'
+    by_sql = metrics.record(endpoint, request.method, response.status_code, profile, total)
+
+    for statement in profile.statements:
+        if statement.seconds * 1000 >= SLOW_QUERY_MS:
+            metrics.log_slow(endpoint, statement)
+    for sql, (calls, _, _) in by_sql.items():
+        if calls >= REPEAT_THRESHOLD:
+            logger.warning('%s ran the same statement %d times (N+1?): %s', endpoint, calls, sql)
+
+    # Signed-in users are told apart by account, everyone else by address
+    user_id = session.get('user_id')
+    client = f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+    burst = metrics.record_burst(endpoint, client, time.monotonic())
+    if burst:
+        logger.warning('%s called %d times within %g ms by %s (client-side N+1?)',
+                       endpoint, burst, BURST_WINDOW_MS, client)
+
+    db_ms = profile.db_seconds() * 1000
+    serialize_ms = profile.phases.get('serialize', 0.0) * 1000
+    total_ms = total * 1000
+    response.headers['Server-Timing'] = ', '.join((
+        f'db;dur={db_ms:.3f};desc="{len(profile.statements)} statements"',
+        f'serialize;dur={serialize_ms:.3f}',
+        f'app;dur={max(total_ms - db_ms - serialize_ms, 0.0):.3f}',
+        f'total;dur={total_ms:.3f}',
+    ))
+    return response
+
+
+def init_app(app):
+    """Profile every request of app; a no-op unless instrumentation is enabled"""
+    if not ENABLED:
+        return
+    db.connection_wrapper = wrap_connection
+    app.json = TimedJSONProvider(app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
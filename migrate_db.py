@@ -1,67 +1,358 @@
 #!/usr/bin/env python3
 """
 Database Migration Script
-Fixes missing columns in existing orders table
+Versioned, ordered schema migrations tracked in the schema_version table
 """
 
 import sqlite3
 import os
 
+import catalog
+import db
+
+def _base_schema(c):
+    """Core tables"""
+    # Users table
+    c.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        is_admin INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Products table
+    c.execute('''CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        category TEXT NOT NULL,
+        brand TEXT NOT NULL,
+        price REAL NOT NULL,
+        description TEXT,
+        specifications TEXT,
+        image_url TEXT,
+        rating REAL DEFAULT 5.0,
+        stock INTEGER DEFAULT 10,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    # Orders table
+    c.execute('''CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        total_amount REAL,
+        status TEXT DEFAULT 'pending',
+        payment_method TEXT,
+        delivery_address TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''')
+
+    # Order items table
+    c.execute('''CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER,
+        product_id INTEGER,
+        quantity INTEGER,
+        price REAL,
+        FOREIGN KEY (order_id) REFERENCES orders (id),
+        FOREIGN KEY (product_id) REFERENCES products (id)
+    )''')
+
+    # Sales tracking table
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_tracking (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        quantity_sold INTEGER DEFAULT 0,
+        total_revenue REAL DEFAULT 0,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (product_id) REFERENCES products (id),
+        UNIQUE(product_id)
+    )''')
+
+def _order_columns(c):
+    """Payment and delivery columns on databases that predate them"""
+    columns = {col[1] for col in c.execute("PRAGMA table_info(orders)").fetchall()}
+
+    if 'payment_method' not in columns:
+        c.execute('ALTER TABLE orders ADD COLUMN payment_method TEXT DEFAULT "cash_on_delivery"')
+
+    if 'delivery_address' not in columns:
+        c.execute('ALTER TABLE orders ADD COLUMN delivery_address TEXT DEFAULT ""')
+
+def _search_index(c):
+    """Full-text search index over products"""
+    catalog.ensure_search_index(c)
+
+def _secondary_indexes(c):
+    """Indexes for the order history, catalog and export access paths"""
+    # Order history: filter by user, newest first
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_orders_user_created
+                 ON orders (user_id, created_at)''')
+    # Exports and reports sort orders by date
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_orders_created
+                 ON orders (created_at)''')
+    # Order items by order, covering the columns the item lists read
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_order_items_order
+                 ON order_items (order_id, product_id, quantity, price)''')
+    # Order items by product, for per-product sales rollups
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_order_items_product
+                 ON order_items (product_id, quantity, price)''')
+    # Catalog filters and keyset sorts
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_products_category_price
+                 ON products (category, price)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_products_price
+                 ON products (price, id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_products_rating
+                 ON products (rating, id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_products_created
+                 ON products (created_at, id)''')
+    c.execute('ANALYZE')
+
+def _sales_rollups(c):
+    """Hourly and daily sales rollups, backfilled from existing orders"""
+    for table, column in (('sales_hourly', 'hour'), ('sales_daily', 'day')):
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            {column} TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            category TEXT,
+            units INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({column}, product_id)
+        ) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS orders_daily (
+        day TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_sales_daily_category
+                 ON sales_daily (category, day)''')
+
+    for table, column, bucket in (
+            ('sales_hourly', 'hour', "strftime('%Y-%m-%d %H:00:00', o.created_at)"),
+            ('sales_daily', 'day', 'date(o.created_at)')):
+        c.execute(f'DELETE FROM {table}')
+        c.execute(f'''INSERT INTO {table} ({column}, product_id, category, units, revenue, orders)
+                      SELECT {bucket}, oi.product_id, p.category,
+                             SUM(oi.quantity), SUM(oi.quantity * oi.price), COUNT(DISTINCT o.id)
+                      FROM order_items oi
+                      JOIN orders o ON oi.order_id = o.id
+                      LEFT JOIN products p ON oi.product_id = p.id
+                      GROUP BY 1, 2''')
+    c.execute('DELETE FROM orders_daily')
+    c.execute('''INSERT INTO orders_daily (day, orders, revenue, units)
+                 SELECT date(o.created_at), COUNT(*), COALESCE(SUM(o.total_amount), 0),
+                        COALESCE(SUM((SELECT SUM(quantity) FROM order_items
+                                      WHERE order_id = o.id)), 0)
+                 FROM orders o
+                 GROUP BY 1''')
+
+def _hourly_order_rollup(c):
+    """Order-level hourly rollup for the analytics API, backfilled from existing orders"""
+    c.execute('''CREATE TABLE IF NOT EXISTS orders_hourly (
+        hour TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    # Databases migrated before this step was frozen may already have
+    # been filling the table at checkout
+    c.execute('DELETE FROM orders_hourly')
+    c.execute('''INSERT INTO orders_hourly (hour, orders, revenue, units)
+                 SELECT strftime('%Y-%m-%d %H:00:00', o.created_at), COUNT(*),
+                        COALESCE(SUM(o.total_amount), 0),
+                        COALESCE(SUM((SELECT SUM(quantity) FROM order_items
+                                      WHERE order_id = o.id)), 0)
+                 FROM orders o
+                 GROUP BY 1''')
+
+def _bookkeeping_watermarks(c):
+    """Progress of the write-behind sales bookkeeping, by order id"""
+    c.execute('''CREATE TABLE IF NOT EXISTS bookkeeping_watermarks (
+        name TEXT PRIMARY KEY,
+        applied_order_id INTEGER NOT NULL
+    )''')
+
+def _product_natural_key(c):
+    """
+    One product per (brand, name). Older startups re-seeded the sample
+    catalog on every boot; each duplicate is merged into the oldest row
+    with its name, moving order lines and sales onto it, and the natural
+    key is then enforced.
+    """
+    dupes = c.execute('''SELECT p.id, k.keep FROM products p
+                         JOIN (SELECT brand, name, MIN(id) AS keep FROM products
+                               GROUP BY brand, name HAVING COUNT(*) > 1) k
+                           ON p.brand = k.brand AND p.name = k.name
+                         WHERE p.id != k.keep''').fetchall()
+    if dupes:
+        c.execute('CREATE TEMP TABLE product_merge (dup INTEGER PRIMARY KEY, keep INTEGER NOT NULL)')
+        c.executemany('INSERT INTO product_merge (dup, keep) VALUES (?, ?)',
+                      [tuple(row) for row in dupes])
+        c.execute('''UPDATE order_items
+                     SET product_id = (SELECT keep FROM product_merge WHERE dup = product_id)
+                     WHERE product_id IN (SELECT dup FROM product_merge)''')
+        c.execute('''INSERT INTO sales_tracking (product_id, quantity_sold, total_revenue)
+                     SELECT m.keep, SUM(st.quantity_sold), SUM(st.total_revenue)
+                     FROM sales_tracking st JOIN product_merge m ON st.product_id = m.dup
+                     WHERE true
+                     GROUP BY m.keep
+                     ON CONFLICT(product_id) DO UPDATE SET
+                     quantity_sold = quantity_sold + excluded.quantity_sold,
+                     total_revenue = total_revenue + excluded.total_revenue''')
+        c.execute('DELETE FROM sales_tracking WHERE product_id IN (SELECT dup FROM product_merge)')
+        # Move the product rollup rows the same way. The order rollups
+        # don't depend on product ids, and orders still waiting for
+        # write-behind are folded in later under the product they now name
+        for table, bucket in (('sales_hourly', 'hour'), ('sales_daily', 'day')):
+            c.execute(f'''INSERT INTO {table} ({bucket}, product_id, category, units, revenue, orders)
+                          SELECT r.{bucket}, m.keep, p.category,
+                                 SUM(r.units), SUM(r.revenue), SUM(r.orders)
+                          FROM {table} r
+                          JOIN product_merge m ON r.product_id = m.dup
+                          JOIN products p ON p.id = m.keep
+                          WHERE true
+                          GROUP BY r.{bucket}, m.keep
+                          ON CONFLICT ({bucket}, product_id) DO UPDATE SET
+                          units = units + excluded.units,
+                          revenue = revenue + excluded.revenue,
+                          orders = orders + excluded.orders''')
+            c.execute(f'DELETE FROM {table} WHERE product_id IN (SELECT dup FROM product_merge)')
+        c.execute('DELETE FROM products WHERE id IN (SELECT dup FROM product_merge)')
+        c.execute('DROP TABLE product_merge')
+
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_products_natural_key ON products (brand, name)')
+
+# Ordered (version, description, step). Never edit an applied step;
+# append a new one instead.
+MIGRATIONS = [
+    (1, 'Base schema', _base_schema),
+    (2, 'Order payment and delivery columns', _order_columns),
+    (3, 'Product full-text search index', _search_index),
+    (4, 'Secondary indexes for orders, order items and products', _secondary_indexes),
+    (5, 'Hourly and daily sales rollups', _sales_rollups),
+    (6, 'Hourly order rollup', _hourly_order_rollup),
+    (7, 'Write-behind bookkeeping watermarks', _bookkeeping_watermarks),
+    (8, 'Product natural key (brand, name), merging duplicates', _product_natural_key),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Queries whose plans are reported before and after migrating
+HOT_QUERIES = {
+    'user orders': ('SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC', (1,)),
+    'order items': ('''SELECT oi.*, p.name, p.image_url, p.brand FROM order_items oi
+                       JOIN products p ON oi.product_id = p.id
+                       WHERE oi.order_id = ?''', (1,)),
+    'products by category': ('SELECT * FROM products WHERE category = ? AND price <= ?',
+                             ('Guitars', 1000)),
+    'products by price': ('SELECT * FROM products ORDER BY price, id LIMIT 24', ()),
+    'customer purchases export': ('''SELECT o.id, p.name, oi.quantity FROM order_items oi
+                                     JOIN orders o ON oi.order_id = o.id
+                                     JOIN products p ON oi.product_id = p.id
+                                     ORDER BY o.created_at DESC''', ()),
+}
+
+def current_version(conn):
+    """Highest applied migration, or 0 for an unversioned database"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+def migrate(conn, verbose=False):
+    """
+    Apply pending migrations in order, each in its own transaction.
+    Safe to call from several processes at once: the version is
+    re-checked under the write lock. Returns the versions applied.
+    """
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    applied = []
+    for version, description, step in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            if verbose:
+                print(f"→ {version}: {description}")
+            step(conn)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+def query_plans(conn):
+    """EXPLAIN QUERY PLAN output for each hot query"""
+    plans = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+            plans[name] = [row[3] for row in rows]
+        except sqlite3.OperationalError as e:
+            plans[name] = [f'unavailable: {e}']
+    return plans
+
+def print_plans(title, plans):
+    """Print query plans in a readable block"""
+    print(f"\n{title}:")
+    for name, steps in plans.items():
+        print(f"  {name}")
+        for step in steps:
+            print(f"    • {step}")
+
 def migrate_database():
-    """Add missing columns to orders table if they don't exist"""
-    
-    db_path = 'music_store.db'
-    
+    """Bring the database up to the latest schema version"""
+
+    db_path = db.DB_PATH
+
     if not os.path.exists(db_path):
         print("✓ Database will be created fresh on app startup")
         return
-    
+
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Check what columns exist in orders table
-        cursor.execute("PRAGMA table_info(orders)")
-        columns = {col[1] for col in cursor.fetchall()}
-        
-        print("Current orders table columns:")
-        for col in columns:
-            print(f"  ✓ {col}")
-        
-        # Add missing columns
-        if 'payment_method' not in columns:
-            print("\n→ Adding payment_method column...")
-            cursor.execute('ALTER TABLE orders ADD COLUMN payment_method TEXT DEFAULT "cash_on_delivery"')
-            print("  ✓ payment_method added")
-        else:
-            print("  ✓ payment_method already exists")
-        
-        if 'delivery_address' not in columns:
-            print("\n→ Adding delivery_address column...")
-            cursor.execute('ALTER TABLE orders ADD COLUMN delivery_address TEXT DEFAULT ""')
-            print("  ✓ delivery_address added")
-        else:
-            print("  ✓ delivery_address already exists")
-        
-        conn.commit()
-        conn.close()
-        
-        print("\n✅ Database migration successful!")
-        print("\nUpdated orders table columns:")
-        
-        # Show updated columns
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(orders)")
-        for col in cursor.fetchall():
-            print(f"  ✓ {col[1]}")
+        conn = db.connect(db_path)
+
+        version = current_version(conn)
+        print(f"Current schema version: {version} (latest: {LATEST_VERSION})")
+
+        if version >= LATEST_VERSION:
+            print("\n✅ Database is already up to date")
+            conn.close()
+            return True
+
+        before = query_plans(conn)
+        applied = migrate(conn, verbose=True)
+        after = query_plans(conn)
+
+        print(f"\n✅ Applied {len(applied)} migration(s); now at version {current_version(conn)}")
+        print_plans("Query plans before", before)
+        print_plans("Query plans after", after)
+
         conn.close()
-        
+
     except Exception as e:
         print(f"\n❌ Error during migration: {e}")
         print("\nAlternative: Delete music_store.db and restart the app")
         return False
-    
+
     return True
 
 if __name__ == "__main__":
@@ -69,9 +360,9 @@ if __name__ == "__main__":
     print("DATABASE MIGRATION SCRIPT")
     print("=" * 50)
     print()
-    
+
     success = migrate_database()
-    
+
     if success:
         print("\nYou can now run: python app.py")
     else:
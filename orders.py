@@ -0,0 +1,191 @@
+"""
+Order Queries
+Set-based order placement, and order history with line items embedded
+"""
+
+from datetime import datetime, timedelta
+
+import rollups
+from catalog import decode_cursor, encode_cursor
+
+ORDER_STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class OrderError(ValueError):
+    """An order that cannot be placed; status is the HTTP code to return"""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or []
+
+
+def normalize_items(items):
+    """
+    Validate cart lines and merge duplicates into {product_id: quantity}.
+    Client-side prices are ignored; only ids and quantities are trusted.
+    """
+    quantities = {}
+    for item in items:
+        try:
+            product_id = int(item['id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise OrderError('Each item needs an id and a quantity')
+        if quantity <= 0:
+            raise OrderError(f'Invalid quantity for product {product_id}')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def place_order(conn, user_id, items, payment_method, delivery_address, track_sales=True):
+    """
+    Create an order in one write transaction. Prices come from the
+    products table in a single IN (...) read, and stock is decremented
+    only where stock >= quantity, so either every line is reserved or the
+    whole order is rolled back. With track_sales, sales_tracking and the
+    rollups are updated in the same transaction; otherwise the
+    write-behind worker folds the order in later.
+    Returns (order_id, total_amount).
+    """
+    quantities = normalize_items(items)
+    if not quantities:
+        raise OrderError('No items in order')
+    product_ids = list(quantities)
+    placeholders = ', '.join('?' * len(product_ids))
+
+    # Take the write lock up front so the price/stock read and the
+    # decrement see the same snapshot; everything below is set-based.
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        products = {row['id']: row for row in conn.execute(
+            f'SELECT id, name, price, stock FROM products WHERE id IN ({placeholders})',
+            product_ids)}
+
+        missing = [pid for pid in product_ids if pid not in products]
+        if missing:
+            raise OrderError('Some products no longer exist', 400,
+                             [{'id': pid, 'error': 'not found'} for pid in missing])
+
+        short = [{'id': pid, 'name': products[pid]['name'],
+                  'requested': qty, 'available': products[pid]['stock']}
+                 for pid, qty in quantities.items() if products[pid]['stock'] < qty]
+        if short:
+            raise OrderError('Insufficient stock', 409, short)
+
+        lines = [(pid, qty, products[pid]['price']) for pid, qty in quantities.items()]
+        total_amount = round(sum(qty * price for _, qty, price in lines), 2)
+
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+                           [(qty, pid, qty) for pid, qty, _ in lines])
+        if cursor.rowcount != len(lines):
+            raise OrderError('Insufficient stock', 409)
+
+        cursor.execute('''INSERT INTO orders (user_id, total_amount, payment_method, delivery_address, status)
+                          VALUES (?, ?, ?, ?, ?)''',
+                       (user_id, total_amount, payment_method, delivery_address, 'pending'))
+        order_id = cursor.lastrowid
+
+        cursor.executemany('''INSERT INTO order_items (order_id, product_id, quantity, price)
+                              VALUES (?, ?, ?, ?)''',
+                           [(order_id, pid, qty, price) for pid, qty, price in lines])
+
+        if track_sales:
+            cursor.executemany('''INSERT INTO sales_tracking (product_id, quantity_sold, total_revenue)
+                                  VALUES (?, ?, ?)
+                                  ON CONFLICT(product_id) DO UPDATE SET
+                                  quantity_sold = quantity_sold + excluded.quantity_sold,
+                                  total_revenue = total_revenue + excluded.total_revenue,
+                                  last_updated = CURRENT_TIMESTAMP''',
+                               [(pid, qty, price * qty) for pid, qty, price in lines])
+
+            rollups.record_order(conn, order_id)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return order_id, total_amount
+
+
+def parse_date(value, end_of_day=False):
+    """
+    YYYY-MM-DD to the timestamp format SQLite stores. With end_of_day the
+    following midnight is returned, for use as an exclusive upper bound.
+    """
+    if not value:
+        return None
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Invalid date: {value} (expected YYYY-MM-DD)')
+    if end_of_day:
+        day += timedelta(days=1)
+    return day.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def order_history(conn, user_id, status=None, date_from=None, date_to=None,
+                  limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    One page of a user's orders, newest first, each with its items.
+    Returns (orders, next_cursor). Items for the whole page come from a
+    single IN (...) query instead of one request per order.
+    """
+    if status and status not in ORDER_STATUSES:
+        raise ValueError(f'Unknown status: {status}')
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    clauses = ['user_id = ?']
+    params = [user_id]
+
+    if status:
+        clauses.append('status = ?')
+        params.append(status)
+
+    start = parse_date(date_from)
+    if start:
+        clauses.append('created_at >= ?')
+        params.append(start)
+
+    end = parse_date(date_to, end_of_day=True)
+    if end:
+        clauses.append('created_at < ?')
+        params.append(end)
+
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, last_id])
+
+    params.append(limit + 1)
+    rows = conn.execute(f'''SELECT * FROM orders WHERE {' AND '.join(clauses)}
+                            ORDER BY created_at DESC, id DESC LIMIT ?''',
+                        params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+    orders = [dict(row) for row in rows]
+    if not orders:
+        return orders, next_cursor
+
+    by_id = {order['id']: order for order in orders}
+    for order in orders:
+        order['items'] = []
+
+    placeholders = ', '.join('?' * len(by_id))
+    items = conn.execute(f'''SELECT oi.*, p.name, p.image_url, p.brand FROM order_items oi
+                             JOIN products p ON oi.product_id = p.id
+                             WHERE oi.order_id IN ({placeholders})
+                             ORDER BY oi.order_id, oi.id''', list(by_id)).fetchall()
+    for item in items:
+        by_id[item['order_id']]['items'].append(dict(item))
+
+    return orders, next_cursor
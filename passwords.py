@@ -0,0 +1,256 @@
+"""
+Password Hashing
+Salted KDF hashes for user passwords, computed off the request thread
+
+New hashes use ALGORITHM: scrypt (the default, stored in Werkzeug's
+scrypt:N:r:p$salt$hash format, as users.csv already has) or argon2 when
+argon2-cffi is installed. Older hashes still verify: unsalted SHA-256
+hex digests from before the switch, and hashes made with other
+parameters. verify() reports when the stored hash should be replaced,
+so accounts move to the current scheme on their next login.
+
+A KDF costs tens of milliseconds of CPU by design. The work runs in a
+small pool of worker processes, so a burst of logins cannot hold the GIL
+and stall every other request in the server process. Servers start the
+pool as each worker process starts (serve.py, gunicorn.conf.py, asgi.py
+and the dev server); anywhere else hashing runs on the calling thread.
+"""
+
+import ctypes
+import hashlib
+import hmac
+import multiprocessing
+import os
+import signal
+import stat
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:
+    argon2 = None
+
+ALGORITHMS = ('scrypt', 'argon2')
+ALGORITHM = os.environ.get('MUSIC_STORE_PASSWORD_HASH', 'scrypt')
+# scrypt cost: N (a power of two) drives both CPU time and memory (128 * N * r bytes)
+SCRYPT_N = int(os.environ.get('MUSIC_STORE_SCRYPT_N', 32768))
+SCRYPT_R = int(os.environ.get('MUSIC_STORE_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('MUSIC_STORE_SCRYPT_P', 1))
+ARGON2_TIME_COST = int(os.environ.get('MUSIC_STORE_ARGON2_TIME_COST', 3))
+ARGON2_MEMORY_KIB = int(os.environ.get('MUSIC_STORE_ARGON2_MEMORY_KIB', 65536))
+ARGON2_PARALLELISM = int(os.environ.get('MUSIC_STORE_ARGON2_PARALLELISM', 1))
+
+# Hashing processes per server process; 0 hashes on the calling thread
+WORKERS = int(os.environ.get('MUSIC_STORE_HASH_WORKERS', min(2, os.cpu_count() or 1)))
+# Hash jobs allowed in flight (running plus queued) before callers get Busy
+MAX_PENDING = int(os.environ.get('MUSIC_STORE_HASH_MAX_PENDING', max(WORKERS, 1) * 8))
+
+if ALGORITHM not in ALGORITHMS:
+    raise ValueError(f"MUSIC_STORE_PASSWORD_HASH must be one of {', '.join(ALGORITHMS)}")
+if ALGORITHM == 'argon2' and argon2 is None:
+    raise RuntimeError('MUSIC_STORE_PASSWORD_HASH=argon2 needs argon2-cffi: '
+                       'pip install argon2-cffi')
+
+SCRYPT_METHOD = f'scrypt:{SCRYPT_N}:{SCRYPT_R}:{SCRYPT_P}'
+_argon2 = (argon2.PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_KIB,
+                                 parallelism=ARGON2_PARALLELISM)
+           if argon2 is not None else None)
+
+# Unknown usernames are checked against this so they cost the same as a
+# wrong password. Only the parameters and salt matter, so no real hash
+# has to be computed for it
+if ALGORITHM == 'argon2':
+    _DUMMY_HASH = (f'$argon2id$v=19$m={ARGON2_MEMORY_KIB},t={ARGON2_TIME_COST},'
+                   f'p={ARGON2_PARALLELISM}$c29tZXNhbHRzb21lc2FsdA${"A" * 43}')
+else:
+    _DUMMY_HASH = f'{SCRYPT_METHOD}$dummysaltdummysa${"0" * 128}'
+# prctl option: signal this process when its parent exits
+_PR_SET_PDEATHSIG = 1
+
+
+class Busy(Exception):
+    """Too many hash jobs are already pending"""
+
+
+def _is_legacy(stored):
+    """Unsalted SHA-256 hex digest, as every account had before KDF hashing"""
+    return len(stored) == 64 and '$' not in stored
+
+
+def hash_password(password):
+    """Hash a password with the current algorithm and parameters"""
+    if ALGORITHM == 'argon2':
+        return _argon2.hash(password)
+    return generate_password_hash(password, method=SCRYPT_METHOD)
+
+
+def needs_rehash(stored):
+    """True if stored was not made with the current algorithm and parameters"""
+    if _is_legacy(stored):
+        return True
+    if stored.startswith('$argon2'):
+        return ALGORITHM != 'argon2' or _argon2.check_needs_rehash(stored)
+    return ALGORITHM != 'scrypt' or stored.split('$', 1)[0] != SCRYPT_METHOD
+
+
+def check_password(stored, password):
+    """True if password matches the stored hash, whatever scheme made it"""
+    if _is_legacy(stored):
+        return hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest())
+    if stored.startswith('$argon2'):
+        if _argon2 is None:
+            return False
+        try:
+            return _argon2.verify(stored, password)
+        except argon2.exceptions.Argon2Error:
+            return False
+    try:
+        return check_password_hash(stored, password)
+    except ValueError:
+        return False
+
+
+def _verify(stored, password):
+    """
+    Worker side of verify(). A missing account, or a wrong password for
+    a fast legacy hash, also pays for a check against the dummy hash, so
+    timing doesn't tell which usernames exist.
+    """
+    if stored is None:
+        check_password(_DUMMY_HASH, password)
+        return False, None
+    if not check_password(stored, password):
+        if _is_legacy(stored):
+            check_password(_DUMMY_HASH, password)
+        return False, None
+    return True, hash_password(password) if needs_rehash(stored) else None
+
+
+def _init_worker():
+    """Runs in each hashing process as it starts"""
+    # Close the sockets inherited from the server, above all the listening
+    # socket, so a hashing process never holds the port. The pool's own
+    # channels are pipes, not sockets
+    try:
+        fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        fds = []
+    for fd in fds:
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except OSError:
+            pass
+    # The server's signal handlers were inherited with the fork; a hashing
+    # process has nothing to clean up, so it takes the defaults
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Exit with the server process even if it dies without shutdown()
+    if sys.platform.startswith('linux'):
+        try:
+            ctypes.CDLL(None, use_errno=True).prctl(_PR_SET_PDEATHSIG, signal.SIGKILL)
+        except (OSError, AttributeError):
+            pass
+
+
+class HashPool:
+    """
+    Bounded process pool for KDF work, one per server process. start()
+    forks the hashing processes, so it is called while the process is
+    still single-threaded, before it serves requests. Until then, and
+    if the pool breaks, hashing runs on the calling thread.
+    """
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self.jobs = 0
+        self.rejected = 0
+        self.broken = 0
+
+    def start(self):
+        """Fork the hashing processes for this process"""
+        with self._lock:
+            if not self.workers or (self._executor is not None and self._pid == os.getpid()):
+                return
+            # fork, not spawn: spawned processes would re-import the
+            # server's main module and rerun its startup
+            self._pid = os.getpid()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker)
+            executor = self._executor
+        # A fork-context pool forks every worker on its first job; do it now
+        executor.submit(int).result()
+
+    def run(self, fn, *args):
+        """fn(*args) in a hashing process; raises Busy when the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Busy('Password hashing is overloaded')
+        try:
+            with self._lock:
+                self.jobs += 1
+                # A pool inherited through fork belongs to the parent
+                executor = self._executor if self._pid == os.getpid() else None
+            if executor is None:
+                return fn(*args)
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A hashing process died (e.g. killed for memory). Forking
+                # replacements from a request thread isn't safe, so hash
+                # here until the server process is recycled
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                        self.broken += 1
+                return fn(*args)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        """Stop this process's hashing processes and wait for them to exit"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if executor is None or self._pid != os.getpid():
+                return
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'algorithm': ALGORITHM,
+                'workers': self.workers,
+                'started': self._executor is not None and self._pid == os.getpid(),
+                'jobs': self.jobs,
+                'rejected': self.rejected,
+                'broken': self.broken,
+            }
+
+
+pool = HashPool()
+
+
+def create(password):
+    """hash_password() on the pool, for a new or changed password"""
+    return pool.run(hash_password, password)
+
+
+def verify(stored, password):
+    """
+    Check a login on the pool. stored is the account's hash, or None
+    for an unknown username. Returns (ok, new_hash); new_hash is set
+    when the stored hash is outdated and should be saved in its place.
+    """
+    return pool.run(_verify, stored, password)
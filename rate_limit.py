@@ -0,0 +1,85 @@
+"""
+Rate Limiting
+Token buckets per client key for the login and registration endpoints
+
+Each key (a client IP, or a username with the client IP trying it) gets
+a bucket of BURST tokens that refills at PER_MINUTE tokens a minute; an
+attempt spends one. A credential-stuffing burst is refused once its
+bucket is empty, before any password hashing is done. Username buckets
+include the IP, so guessing at an account from one address never locks
+its owner out from another. Buckets live in this process only, so with
+several server workers each worker enforces the limit on its own.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Attempts a minute per client IP (login and registration) and per
+# username from one client IP (login); 0 turns that limit off
+IP_PER_MINUTE = float(os.environ.get('MUSIC_STORE_AUTH_IP_PER_MINUTE', 30))
+IP_BURST = int(os.environ.get('MUSIC_STORE_AUTH_IP_BURST', 10))
+USERNAME_PER_MINUTE = float(os.environ.get('MUSIC_STORE_LOGIN_USERNAME_PER_MINUTE', 5))
+USERNAME_BURST = int(os.environ.get('MUSIC_STORE_LOGIN_USERNAME_BURST', 5))
+# Buckets kept per limiter; the least recently used go first
+MAX_KEYS = int(os.environ.get('MUSIC_STORE_RATE_LIMIT_KEYS', 100000))
+
+
+class TokenBucketLimiter:
+    """A token bucket per key, refilled continuously"""
+
+    def __init__(self, per_minute, burst, max_keys=MAX_KEYS):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> (tokens, monotonic time they were counted at)
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def take(self, key):
+        """
+        Spend a token for key. Returns 0 if the attempt may go ahead,
+        otherwise the seconds until the bucket has a token again.
+        """
+        if not self.enabled:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, counted_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - counted_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'per_minute': self.rate * 60,
+                'burst': self.burst,
+                'keys': len(self._buckets),
+                'allowed': self.allowed,
+                'limited': self.limited,
+            }
+
+
+auth_by_ip = TokenBucketLimiter(IP_PER_MINUTE, IP_BURST)
+login_by_username = TokenBucketLimiter(USERNAME_PER_MINUTE, USERNAME_BURST)
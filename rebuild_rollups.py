@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Sales Rollup Rebuild Script
+Recomputes the hourly and daily sales rollups from the order history,
+then checks them against a fresh aggregate of the order tables
+"""
+
+import os
+import time
+
+import db
+import rollups
+import write_behind
+
+def rebuild_rollups():
+    """Rebuild every rollup table in one transaction"""
+    
+    if not os.path.exists(db.DB_PATH):
+        print("❌ Database not found!")
+        return False
+    
+    conn = db.connect()
+    try:
+        started = time.perf_counter()
+        
+        # Hold the write lock so no order lands between the delete and the refill
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Drain write-behind first, or its next flush would count the
+            # pending orders a second time on top of the rebuilt rollups
+            write_behind.apply_pending(conn)
+            days = rollups.rebuild(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        elapsed = time.perf_counter() - started
+        print(f"✓ Rebuilt rollups for {days} days of sales in {elapsed:.2f}s")
+        
+        problems = rollups.verify(conn)
+        for problem in problems:
+            print(f"❌ {problem}")
+        return not problems
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("SALES ROLLUP REBUILD")
+    print("=" * 50)
+    print()
+    
+    if rebuild_rollups():
+        print("\n✅ Sales rollups match the order history")
+    else:
+        print("\n⚠️  Sales rollups do not match the order history")
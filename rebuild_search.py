@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Search Index Rebuild Script
+Creates the product full-text index on an existing database, or
+re-indexes every product if the index already exists
+"""
+
+import os
+import time
+
+import catalog
+import db
+
+def rebuild_search():
+    """Create or rebuild the products_fts index"""
+    
+    if not os.path.exists(db.DB_PATH):
+        print("❌ Database not found!")
+        return False
+    
+    conn = db.connect()
+    try:
+        started = time.perf_counter()
+        
+        if not catalog.ensure_search_index(conn):
+            print("❌ This SQLite build has no FTS5 support")
+            return False
+        
+        catalog.rebuild_search_index(conn)
+        conn.commit()
+        
+        count = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        elapsed = time.perf_counter() - started
+        print(f"✓ Indexed {count} products in {elapsed:.2f}s")
+    finally:
+        conn.close()
+    
+    return True
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("SEARCH INDEX REBUILD")
+    print("=" * 50)
+    print()
+    
+    if rebuild_search():
+        print("\n✅ Search index is up to date")
+    else:
+        print("\n⚠️  Search will fall back to LIKE scans")
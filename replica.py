@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Reporting Replica
+Keeps a read-only copy of the store database for exports, view_data.py
+and admin analytics, so long report queries never contend with checkout
+
+The copy is made with the SQLite backup API a few pages at a time,
+sleeping between steps, so the primary's lock is only ever held briefly.
+It is built in a temporary file and swapped in atomically; readers that
+already have the old file open keep reading it until they reconnect.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+import db
+
+# Pages copied per backup step, and the pause between steps
+STEP_PAGES = int(os.environ.get('MUSIC_STORE_REPLICA_STEP_PAGES', 256))
+STEP_SLEEP = float(os.environ.get('MUSIC_STORE_REPLICA_STEP_SLEEP', 0.005))
+REFRESH_INTERVAL = float(os.environ.get('MUSIC_STORE_REPLICA_INTERVAL', 60))
+# A write to the primary restarts a stepped backup; after this many
+# restarts the copy is finished in a single step instead
+MAX_RESTARTS = 5
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def refresh(source_path=None, replica_path=None, step_pages=STEP_PAGES,
+            step_sleep=STEP_SLEEP, max_restarts=MAX_RESTARTS):
+    """
+    Copy the primary into the replica file. Returns stats for the run:
+    pages copied, steps taken, restarts and duration.
+    """
+    source_path = source_path or db.DB_PATH
+    replica_path = replica_path or db.REPLICA_PATH
+    tmp_path = replica_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    stats = {'pages': 0, 'steps': 0, 'restarts': 0, 'single_step': False}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['steps'] += 1
+        stats['pages'] = total
+        # Remaining only grows when SQLite started the copy over
+        if last_remaining is not None and remaining > last_remaining:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        # backup() only sleeps on a busy database; pausing here between
+        # steps is what gives checkout its turn at the lock
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    started = time.time()
+    source = db.connect(source_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        try:
+            source.backup(target, pages=step_pages, progress=progress, sleep=step_sleep)
+        except _TooManyRestarts:
+            # Under WAL a single-step copy still does not block writers
+            stats['single_step'] = True
+            source.backup(target)
+
+        # Readers open the replica read-only, which a WAL database can't do
+        target.execute('PRAGMA journal_mode = DELETE')
+        target.execute('''CREATE TABLE IF NOT EXISTS replica_meta (
+            refreshed_at REAL NOT NULL,
+            started_at REAL NOT NULL,
+            source_path TEXT NOT NULL
+        )''')
+        target.execute('DELETE FROM replica_meta')
+        target.execute('INSERT INTO replica_meta VALUES (?, ?, ?)',
+                       (time.time(), started, os.path.abspath(source_path)))
+        target.commit()
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+
+    os.replace(tmp_path, replica_path)
+    stats['duration_ms'] = round((time.time() - started) * 1000, 1)
+    return stats
+
+
+def status(replica_path=None):
+    """Replica freshness: when it was refreshed and its lag in seconds"""
+    replica_path = replica_path or db.REPLICA_PATH
+    info = {
+        'reporting_source': db.REPORTING_SOURCE,
+        'serving_from': 'replica' if db.reporting_path() == replica_path else 'primary',
+        'replica_path': replica_path,
+        'available': os.path.exists(replica_path),
+    }
+    if not info['available']:
+        return info
+
+    conn = db.connect_readonly(replica_path)
+    try:
+        row = conn.execute('SELECT refreshed_at, started_at FROM replica_meta').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    if row is None:
+        info['available'] = False
+        return info
+
+    info['refreshed_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(row['refreshed_at']))
+    info['refresh_duration_ms'] = round((row['refreshed_at'] - row['started_at']) * 1000, 1)
+    info['lag_seconds'] = round(time.time() - row['refreshed_at'], 3)
+    return info
+
+
+def run(interval=REFRESH_INTERVAL, once=False):
+    """Refresh the replica now, then every interval seconds unless once"""
+    while True:
+        try:
+            stats = refresh()
+            print(f"✓ Replica refreshed: {stats['pages']} pages in {stats['steps']} steps, "
+                  f"{stats['restarts']} restarts, {stats['duration_ms']} ms")
+        except sqlite3.Error as e:
+            print(f"❌ Replica refresh failed: {e}")
+            if once:
+                return False
+        if once:
+            return True
+        time.sleep(interval)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Maintain the read-only reporting replica')
+    parser.add_argument('--once', action='store_true', help='refresh once and exit')
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL,
+                        help=f'seconds between refreshes (default: {REFRESH_INTERVAL:g})')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("=" * 50)
+    print("REPORTING REPLICA")
+    print("=" * 50)
+    print(f"\n{db.DB_PATH} → {db.REPLICA_PATH}\n")
+
+    if not os.path.exists(db.DB_PATH):
+        print("❌ Database not found!")
+    else:
+        try:
+            run(args.interval, args.once)
+        except KeyboardInterrupt:
+            print("\n👋 Stopped")
@@ -6,21 +6,44 @@ Use this if you want to completely reset the database with fresh sample data
 
 import os
 import sqlite3
-import shutil
 
-def reset_database():
+import db
+
+# Files SQLite keeps next to the database in WAL mode
+SIDECARS = ('-wal', '-shm')
+
+def backup_database(db_path, backup_path):
+    """
+    Copy the database with SQLite's backup API. Under WAL, committed
+    transactions may still sit in the -wal file, which a plain file copy
+    of the database would miss.
+    """
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def reset_database(db_path=None):
     """Backup old database and create a fresh one"""
     
-    db_path = 'music_store.db'
+    db_path = db_path or db.DB_PATH
     
     if os.path.exists(db_path):
         # Create backup
-        backup_path = f'music_store.db.backup'
-        shutil.copy2(db_path, backup_path)
+        backup_path = f'{db_path}.backup'
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        backup_database(db_path, backup_path)
         print(f"✓ Backup created: {backup_path}")
         
-        # Delete old database
-        os.remove(db_path)
+        # Delete old database, with its WAL files so a new database
+        # is never paired with a stale log
+        for path in [db_path] + [db_path + suffix for suffix in SIDECARS]:
+            if os.path.exists(path):
+                os.remove(path)
         print(f"✓ Old database deleted")
     
     print("\n✓ Fresh database will be created on next app startup")
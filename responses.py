@@ -0,0 +1,138 @@
+"""
+Response Cache
+Pre-encoded JSON bodies with strong ETags, conditional GET and
+pre-compressed variants for the catalog and admin read endpoints
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from flask import Response, request
+
+import instrumentation
+from catalog_cache import LRUCache, TTL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512))
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+CATALOG_CACHE_CONTROL = 'public, max-age=30'
+ADMIN_CACHE_CONTROL = 'private, no-cache'
+
+
+class EncodedResponse:
+    """A JSON body encoded once, with its ETag and compressed variants"""
+
+    __slots__ = ('body', 'etag', 'encodings')
+
+    def __init__(self, data):
+        self.body = json.dumps(data, separators=(',', ':')).encode()
+        # Content hash, so every worker derives the same tag for the same data
+        self.etag = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self.encodings = {}
+        if len(self.body) >= COMPRESS_MIN_BYTES:
+            self.encodings['gzip'] = gzip.compress(self.body, compresslevel=6)
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(self.body)
+
+
+class ResponseCache:
+    """Encoded responses by key, valid only for the data version they were built at"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self._lock = threading.Lock()
+        self._entries = LRUCache(max_entries, ttl)
+        self.stale = 0
+
+    def get(self, key, version, build):
+        """
+        Encoded response for key at version, calling build() for the data
+        on a miss. Returns None, uncached, when build() returns None.
+        """
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is not None:
+            cached_version, entry = cached
+            if cached_version == version:
+                return entry
+            with self._lock:
+                self.stale += 1
+
+        data = build()
+        if data is None:
+            return None
+        with instrumentation.timed('serialize'):
+            entry = EncodedResponse(data)
+        with self._lock:
+            self._entries.put(key, (version, entry))
+        return entry
+
+    def lookup(self, key, version):
+        """The cached entry for key at version, or None; never builds"""
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return None
+
+    def stats(self):
+        with self._lock:
+            stats = self._entries.stats()
+            stats['stale'] = self.stale
+            return stats
+
+
+cache = ResponseCache()
+
+
+def negotiate(entry, cache_control, accept_encodings, if_none_match):
+    """
+    (status, headers, body) for an encoded entry: 304 when the client
+    already has this ETag, otherwise the smallest representation it
+    accepts. Takes werkzeug's parsed Accept-Encoding and If-None-Match,
+    so it serves both Flask and the ASGI handlers.
+    """
+    body, encoding = entry.body, None
+    for candidate in ('br', 'gzip'):
+        if candidate in entry.encodings and accept_encodings[candidate]:
+            body, encoding = entry.encodings[candidate], candidate
+            break
+
+    # Each representation gets its own strong tag
+    etag = f'{entry.etag}-{encoding}' if encoding else entry.etag
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding',
+    }
+
+    if if_none_match.contains(etag):
+        return 304, headers, b''
+
+    headers['Content-Type'] = 'application/json'
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return 200, headers, body
+
+
+def send(entry, cache_control):
+    """Flask response for an encoded entry, negotiated against the current request"""
+    status, headers, body = negotiate(entry, cache_control, request.accept_encodings,
+                                      request.if_none_match)
+    return Response(body, status=status, headers=headers)
+
+
+def cached_json(key, version, build, cache_control=CATALOG_CACHE_CONTROL):
+    """Build-or-reuse an encoded response and send it; None if build() found nothing"""
+    entry = cache.get(key, version, build)
+    if entry is None:
+        return None
+    return send(entry, cache_control)
@@ -0,0 +1,321 @@
+"""
+Sales Rollups
+Materialised hourly and daily sales aggregates, kept current inside the
+order transaction so dashboards and summaries never scan order history
+"""
+
+import heapq
+
+ROLLUP_SCHEMA = [
+    # Units, revenue and order count per hour x product; category is
+    # copied at sale time so category reports need no join
+    '''CREATE TABLE IF NOT EXISTS sales_hourly (
+        hour TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        category TEXT,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        orders INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, product_id)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        category TEXT,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        orders INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id)
+    ) WITHOUT ROWID''',
+    # Order-level totals per hour and day; summing the product rows would
+    # count an order once per product in it
+    '''CREATE TABLE IF NOT EXISTS orders_hourly (
+        hour TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS orders_daily (
+        day TEXT PRIMARY KEY,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS idx_sales_daily_category ON sales_daily (category, day)',
+]
+
+ROLLUP_TABLES = ('sales_hourly', 'sales_daily', 'orders_hourly', 'orders_daily')
+
+HOUR = "strftime('%Y-%m-%d %H:00:00', o.created_at)"
+DAY = "date(o.created_at)"
+
+# Each statement folds the orders matched by {where} into one rollup
+# table. The SELECT always has a WHERE clause, which keeps SQLite from
+# parsing ON CONFLICT as a join constraint.
+_PRODUCT_ROLLUP = '''
+    INSERT INTO {table} ({bucket_column}, product_id, category, units, revenue, orders)
+    SELECT {bucket}, oi.product_id, p.category,
+           SUM(oi.quantity), SUM(oi.quantity * oi.price), COUNT(DISTINCT o.id)
+    FROM order_items oi
+    JOIN orders o ON oi.order_id = o.id
+    LEFT JOIN products p ON oi.product_id = p.id
+    WHERE {where}
+    GROUP BY 1, 2
+    ON CONFLICT ({bucket_column}, product_id) DO UPDATE SET
+        units = units + excluded.units,
+        revenue = revenue + excluded.revenue,
+        orders = orders + excluded.orders
+'''
+
+_ORDER_ROLLUP = '''
+    INSERT INTO {table} ({bucket_column}, orders, revenue, units)
+    SELECT {bucket}, COUNT(*), COALESCE(SUM(o.total_amount), 0),
+           COALESCE(SUM((SELECT SUM(quantity) FROM order_items WHERE order_id = o.id)), 0)
+    FROM orders o
+    WHERE {where}
+    GROUP BY 1
+    ON CONFLICT ({bucket_column}) DO UPDATE SET
+        orders = orders + excluded.orders,
+        revenue = revenue + excluded.revenue,
+        units = units + excluded.units
+'''
+
+
+def ensure_rollups(conn):
+    """Create the rollup tables if they are missing"""
+    for statement in ROLLUP_SCHEMA:
+        conn.execute(statement)
+
+
+def has_rollups(conn):
+    """True when every rollup table exists in this database"""
+    placeholders = ', '.join('?' * len(ROLLUP_TABLES))
+    row = conn.execute(f'''SELECT COUNT(*) FROM sqlite_master
+                           WHERE type = 'table' AND name IN ({placeholders})''',
+                       ROLLUP_TABLES).fetchone()
+    return row[0] == len(ROLLUP_TABLES)
+
+
+def _apply(conn, where, params):
+    conn.execute(_PRODUCT_ROLLUP.format(table='sales_hourly', bucket_column='hour',
+                                        bucket=HOUR, where=where), params)
+    conn.execute(_PRODUCT_ROLLUP.format(table='sales_daily', bucket_column='day',
+                                        bucket=DAY, where=where), params)
+    conn.execute(_ORDER_ROLLUP.format(table='orders_hourly', bucket_column='hour',
+                                      bucket=HOUR, where=where), params)
+    conn.execute(_ORDER_ROLLUP.format(table='orders_daily', bucket_column='day',
+                                      bucket=DAY, where=where), params)
+
+
+def record_order(conn, order_id):
+    """
+    Fold one new order into the rollups. Call inside the transaction that
+    inserted the order and its items; touches one row per product in the
+    product rollups plus one row in each order rollup.
+    """
+    _apply(conn, 'o.id = ?', (order_id,))
+
+
+def record_orders(conn, after_id, upto_id):
+    """Fold every order with after_id < id <= upto_id into the rollups"""
+    _apply(conn, 'o.id > ? AND o.id <= ?', (after_id, upto_id))
+
+
+def rebuild(conn):
+    """
+    Recompute every rollup from orders and order_items. The caller owns
+    the transaction; returns the number of daily order rows written.
+    """
+    ensure_rollups(conn)
+    for table in ROLLUP_TABLES:
+        conn.execute(f'DELETE FROM {table}')
+    _apply(conn, 'true', ())
+    return conn.execute('SELECT COUNT(*) FROM orders_daily').fetchone()[0]
+
+
+def totals(conn):
+    """
+    Store-wide order totals: orders, revenue, units and the latest day
+    with sales. Reads one row per day from orders_daily; databases without
+    rollups fall back to aggregating the orders table.
+    """
+    if has_rollups(conn):
+        query = '''SELECT COALESCE(SUM(orders), 0) AS total_orders,
+                          COALESCE(SUM(revenue), 0) AS total_revenue,
+                          COALESCE(SUM(units), 0) AS total_units,
+                          MAX(day) AS latest_day
+                   FROM orders_daily'''
+    else:
+        query = f'''SELECT COUNT(*) AS total_orders,
+                           COALESCE(SUM(o.total_amount), 0) AS total_revenue,
+                           (SELECT COALESCE(SUM(quantity), 0) FROM order_items) AS total_units,
+                           MAX({DAY}) AS latest_day
+                    FROM orders o'''
+    row = conn.execute(query).fetchone()
+    return {
+        'total_orders': row['total_orders'],
+        'total_revenue': round(row['total_revenue'], 2),
+        'total_units': row['total_units'],
+        'latest_day': row['latest_day'],
+    }
+
+
+def daily_series(conn, date_from=None, date_to=None, category=None):
+    """
+    Orders, units and revenue per day between two inclusive YYYY-MM-DD
+    dates, oldest first. With a category, counts only that category's lines.
+    """
+    clauses, params = [], []
+    if date_from:
+        clauses.append('day >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append('day <= ?')
+        params.append(date_to)
+
+    if category:
+        clauses.append('category = ?')
+        params.append(category)
+        # orders here is orders containing the category; an order with two
+        # products in it is counted for each
+        query = f'''SELECT day, SUM(orders) AS orders, SUM(units) AS units,
+                           ROUND(SUM(revenue), 2) AS revenue
+                    FROM sales_daily WHERE {' AND '.join(clauses)}
+                    GROUP BY day ORDER BY day'''
+    else:
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        query = f'''SELECT day, orders, units, ROUND(revenue, 2) AS revenue
+                    FROM orders_daily {where} ORDER BY day'''
+    return [dict(row) for row in conn.execute(query, params)]
+
+
+def category_totals(conn, date_from=None, date_to=None):
+    """Units and revenue per category over a date range, biggest first"""
+    clauses, params = [], []
+    if date_from:
+        clauses.append('day >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append('day <= ?')
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = conn.execute(f'''SELECT category, SUM(units) AS units,
+                                   ROUND(SUM(revenue), 2) AS revenue
+                            FROM sales_daily {where}
+                            GROUP BY category ORDER BY revenue DESC''', params)
+    return [dict(row) for row in rows]
+
+
+def verify(conn):
+    """
+    Compare the rollups with a fresh aggregate of the order tables.
+    Returns a list of mismatch descriptions, empty when they agree.
+    """
+    problems = []
+    live = conn.execute('''SELECT COUNT(*), COALESCE(SUM(total_amount), 0),
+                                  (SELECT COALESCE(SUM(quantity), 0) FROM order_items)
+                           FROM orders''').fetchone()
+    rolled = conn.execute('''SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0),
+                                    COALESCE(SUM(units), 0) FROM orders_daily''').fetchone()
+    for label, expected, actual in zip(('orders', 'revenue', 'units'), live, rolled):
+        if abs(expected - actual) > 0.005:
+            problems.append(f'{label}: orders tables say {expected}, rollups say {actual}')
+
+    hourly = conn.execute('SELECT COALESCE(SUM(orders), 0) FROM orders_hourly').fetchone()[0]
+    if hourly != live[0]:
+        problems.append(f'orders_hourly orders: expected {live[0]}, found {hourly}')
+
+    for table in ('sales_hourly', 'sales_daily'):
+        units = conn.execute(f'SELECT COALESCE(SUM(units), 0) FROM {table}').fetchone()[0]
+        if units != live[2]:
+            problems.append(f'{table} units: expected {live[2]}, found {units}')
+    return problems
+
+
+# bucket -> (product rollup, order rollup, stored column, bucket expression)
+BUCKETS = {
+    'hour': ('sales_hourly', 'orders_hourly', 'hour', 'r.hour'),
+    'day': ('sales_daily', 'orders_daily', 'day', 'r.day'),
+    # Weeks start on Monday and are labelled with that date
+    'week': ('sales_daily', 'orders_daily', 'day', "date(r.day, '-6 days', 'weekday 1')"),
+}
+
+# group -> (group key, display label); brand and name come from the
+# product row, so a deleted product reports as unknown
+GROUPS = {
+    'category': ("COALESCE(r.category, 'Unknown')", "COALESCE(r.category, 'Unknown')"),
+    'brand': ("COALESCE(p.brand, 'Unknown')", "COALESCE(p.brand, 'Unknown')"),
+    'product': ('r.product_id', "COALESCE(p.name, 'Unknown')"),
+}
+
+METRICS = ('revenue', 'units', 'orders')
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+
+def analytics(conn, bucket='day', start=None, end=None, group_by=None,
+              metric='revenue', top=DEFAULT_TOP):
+    """
+    Revenue, units and orders per time bucket between start (inclusive)
+    and end (exclusive) timestamps, optionally split by category, brand
+    or product. Grouped results keep the top groups by metric over the
+    whole range, picked with a heap rather than a full sort.
+
+    Reads rollup rows through their (bucket, product) primary keys, so
+    the cost follows the number of buckets, not the number of orders.
+    In grouped results orders counts the orders containing the group.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket} (expected {', '.join(BUCKETS)})")
+    if group_by and group_by not in GROUPS:
+        raise ValueError(f"Unknown group_by: {group_by} (expected {', '.join(GROUPS)})")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric} (expected {', '.join(METRICS)})")
+    top = max(1, min(int(top or DEFAULT_TOP), MAX_TOP))
+
+    product_table, order_table, column, bucket_expr = BUCKETS[bucket]
+    clauses, params = [], []
+    # Bounds are midnight timestamps; day tables store bare dates
+    if start:
+        clauses.append(f'r.{column} >= ?')
+        params.append(start if column == 'hour' else start[:10])
+    if end:
+        clauses.append(f'r.{column} < ?')
+        params.append(end if column == 'hour' else end[:10])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    if not group_by:
+        rows = conn.execute(f'''SELECT {bucket_expr} AS bucket, SUM(r.orders) AS orders,
+                                       SUM(r.units) AS units, ROUND(SUM(r.revenue), 2) AS revenue
+                                FROM {order_table} r {where}
+                                GROUP BY 1 ORDER BY 1''', params)
+        return {'series': [dict(row) for row in rows], 'top': []}
+
+    key_expr, label_expr = GROUPS[group_by]
+    rows = conn.execute(f'''SELECT {bucket_expr} AS bucket, {key_expr} AS group_key,
+                                   MAX({label_expr}) AS label, SUM(r.orders) AS orders,
+                                   SUM(r.units) AS units, SUM(r.revenue) AS revenue
+                            FROM {product_table} r
+                            LEFT JOIN products p ON p.id = r.product_id
+                            {where}
+                            GROUP BY 1, 2 ORDER BY 1''', params).fetchall()
+
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['group_key'], {
+            'group': row['group_key'], 'label': row['label'],
+            'orders': 0, 'units': 0, 'revenue': 0.0})
+        total['orders'] += row['orders']
+        total['units'] += row['units']
+        total['revenue'] += row['revenue']
+
+    ranked = heapq.nlargest(top, totals.values(), key=lambda total: total[metric])
+    for total in ranked:
+        total['revenue'] = round(total['revenue'], 2)
+    keep = {total['group'] for total in ranked}
+
+    series = [{'bucket': row['bucket'], 'group': row['group_key'], 'label': row['label'],
+               'orders': row['orders'], 'units': row['units'],
+               'revenue': round(row['revenue'], 2)}
+              for row in rows if row['group_key'] in keep]
+    return {'series': series, 'top': ranked}
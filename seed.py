@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Sample Data Seeding
+Creates the admin account and the sample catalog. Idempotent: products
+are matched on their natural key (brand, name), so running it again
+never adds duplicates.
+"""
+
+import time
+
+import db
+import migrate_db
+import passwords
+
+ADMIN_USERNAME = 'admin'
+ADMIN_EMAIL = 'admin@musicstore.com'
+ADMIN_PASSWORD = 'admin123'
+
+# (name, category, brand, price, description, specifications, image_url, rating, stock)
+SAMPLE_PRODUCTS = [
+    ('Fender Stratocaster Electric Guitar', 'Guitars', 'Fender', 1299.99, 
+     'Iconic electric guitar with versatile tone', 'Alder body, Maple neck, 3 single-coil pickups', 
+     'https://images.unsplash.com/photo-1564186763535-ebb21ef5277f?w=500', 4.8, 15),
+    ('Yamaha P-125 Digital Piano', 'Pianos & Keyboards', 'Yamaha', 649.99,
+     'Portable digital piano with authentic piano touch', '88 weighted keys, 24 voices, USB connectivity',
+     'https://images.unsplash.com/photo-1520523839897-bd0b52f945a0?w=500', 4.7, 8),
+    ('Pearl Export Drum Kit', 'Drums', 'Pearl', 899.99,
+     'Complete 5-piece drum set for beginners and pros', '5 drums, hardware included, birch shells',
+     'https://images.unsplash.com/photo-1519892300165-cb5542fb47c7?w=500', 4.6, 5),
+    ('Stentor Violin Student II', 'Violins', 'Stentor', 299.99,
+     'Quality student violin with bow and case', 'Solid carved top, ebony fittings, includes case',
+     'https://images.unsplash.com/photo-1612225330812-0e9e10f03a83?w=500', 4.5, 12),
+    ('Yamaha YFL-222 Flute', 'Flutes', 'Yamaha', 549.99,
+     'Professional student flute with excellent tone', 'Nickel silver, offset G, E mechanism',
+     'https://images.unsplash.com/photo-1598030886674-c92be74e237b?w=500', 4.9, 7),
+    ('Pioneer DJ DDJ-400', 'DJ Equipment', 'Pioneer', 249.99,
+     '2-channel DJ controller for beginners', 'Rekordbox compatible, built-in sound card',
+     'https://images.unsplash.com/photo-1598653222000-6b7b7a552625?w=500', 4.7, 10),
+    ('Shure SM58 Microphone', 'Accessories', 'Shure', 99.99,
+     'Legendary vocal microphone', 'Dynamic, cardioid, rugged construction',
+     'https://images.unsplash.com/photo-1590602847861-f357a9332bbc?w=500', 5.0, 25),
+    ('Boss Katana-50 Amplifier', 'Accessories', 'Boss', 229.99,
+     '50-watt guitar amplifier with effects', '5 amp characters, built-in effects, USB',
+     'https://images.unsplash.com/photo-1514320291840-2e0a9bf2a9ae?w=500', 4.8, 6),
+    ('Gibson Les Paul Standard', 'Guitars', 'Gibson', 2499.99,
+     'Legendary electric guitar with premium tone', 'Mahogany body, AAA maple top, humbuckers',
+     'https://images.unsplash.com/photo-1516924962500-2b4b3b99ea02?w=500', 4.9, 3),
+    ('Roland TD-17KVX V-Drums', 'Drums', 'Roland', 1699.99,
+     'Electronic drum kit with mesh heads', 'Premium sound module, bluetooth audio',
+     'https://images.unsplash.com/photo-1571327073757-71d13c24de30?w=500', 4.8, 4),
+    ('Korg SV-2 Stage Piano', 'Pianos & Keyboards', 'Korg', 1999.99,
+     '88-key stage piano with vintage sounds', 'Weighted hammer action, tube-driven preamp',
+     'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=500', 4.7, 5),
+    ('D\'Addario Guitar Strings Pack', 'Accessories', 'D\'Addario', 19.99,
+     '3-pack of premium guitar strings', 'Nickel wound, 10-46 gauge, long life',
+     'https://images.unsplash.com/photo-1556449895-a33c9dba33dd?w=500', 4.6, 50)
+]
+
+
+def seed(conn):
+    """
+    Insert whatever admin and sample rows are missing, in one transaction.
+    Returns (users added, products added).
+    """
+    # Hashing costs tens of milliseconds, so skip it when the admin exists
+    admin_exists = conn.execute('SELECT 1 FROM users WHERE username = ? OR email = ?',
+                                (ADMIN_USERNAME, ADMIN_EMAIL)).fetchone()
+    admin_password = None if admin_exists else passwords.hash_password(ADMIN_PASSWORD)
+    with conn:
+        users = 0
+        if admin_password is not None:
+            users = conn.execute('''INSERT INTO users (username, email, password, is_admin)
+                                    VALUES (?, ?, ?, 1)
+                                    ON CONFLICT DO NOTHING''',
+                                 (ADMIN_USERNAME, ADMIN_EMAIL, admin_password)).rowcount
+        # rowcount, unlike total_changes, leaves out the search index trigger's writes
+        products = conn.executemany('''INSERT INTO products
+                                       (name, category, brand, price, description, specifications,
+                                        image_url, rating, stock)
+                                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                       ON CONFLICT (brand, name) DO NOTHING''',
+                                    SAMPLE_PRODUCTS).rowcount
+    return users, products
+
+def seed_database():
+    """Migrate if needed, then seed"""
+    conn = db.connect()
+    try:
+        started = time.perf_counter()
+        migrate_db.migrate(conn)
+        users, products = seed(conn)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    print(f"✓ Admin account: {'created' if users else 'already present'}")
+    print(f"✓ Sample products: {products} added, "
+          f"{len(SAMPLE_PRODUCTS) - products} already present")
+    print(f"✓ Done in {elapsed * 1000:.1f} ms")
+    return True
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("SAMPLE DATA SEED")
+    print("=" * 50)
+    print()
+
+    if seed_database():
+        print(f"\n✅ Login with: {ADMIN_USERNAME} / {ADMIN_PASSWORD}")
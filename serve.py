@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Production Server
+Preforking multi-process launcher: the master loads the app and
+initialises the database once, then forks workers that share the
+listening socket and the preloaded app through copy-on-write
+
+    python serve.py --workers 4 --bind 0.0.0.0:5000
+
+Signals to the master:
+    TERM / INT   stop accepting, let in-flight requests finish, exit
+    HUP          graceful reload: re-exec with new code on the same
+                 socket and PID, then retire the old workers
+    TTIN / TTOU  one worker more / less
+
+Workers exit after --max-requests requests (plus jitter) and are
+replaced, which bounds memory growth. With gunicorn installed,
+gunicorn.conf.py gives the same setup: gunicorn -c gunicorn.conf.py
+"""
+
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+import passwords
+import write_behind
+
+WORKERS = int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 1))
+BIND = os.environ.get('SERVE_BIND', '127.0.0.1:5000')
+MAX_REQUESTS = int(os.environ.get('SERVE_MAX_REQUESTS', 10000))
+MAX_REQUESTS_JITTER = int(os.environ.get('SERVE_MAX_REQUESTS_JITTER', 1000))
+GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+BACKLOG = 2048
+
+# Set across a reload re-exec: the inherited socket and the old workers
+LISTEN_FD_ENV = 'SERVE_LISTEN_FD'
+OLD_WORKERS_ENV = 'SERVE_OLD_WORKERS'
+
+
+def log(message):
+    print(f"[{os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def listen(bind):
+    """The shared listening socket: inherited across a reload, else bound here"""
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is not None:
+        sock = socket.socket(fileno=int(fd))
+    else:
+        host, port = parse_bind(bind)
+        sock = socket.create_server((host, port), backlog=BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Worker:
+    """One forked worker: a threaded WSGI server on the shared socket"""
+
+    def __init__(self, app, sock, bind, max_requests, graceful_timeout):
+        self.app = app
+        self.sock = sock
+        self.bind = bind
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.server = None
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.requests += 1
+            recycle = self.max_requests and self.requests >= self.max_requests
+        if recycle:
+            self.stop(f'recycling after {self.requests} requests')
+        return self.app(environ, start_response)
+
+    def stop(self, reason):
+        with self.lock:
+            if self.stopping:
+                return
+            self.stopping = True
+        log(f"worker stopping: {reason}")
+        # shutdown() waits for serve_forever, so it can't run on its thread
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def run(self):
+        host, port = parse_bind(self.bind)
+        self.server = make_server(host, port, self, threaded=True, fd=self.sock.fileno())
+        # Non-daemon handler threads are joined by server_close(), so every
+        # connection this worker accepted is answered before it exits
+        self.server.daemon_threads = False
+        signal.signal(signal.SIGTERM, lambda *_: self.stop('SIGTERM'))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        # Fork the password hashing processes before any server thread exists
+        passwords.pool.start()
+        self.server.serve_forever()
+
+        # Accepting has stopped; give in-flight requests the graceful
+        # timeout to finish, then exit regardless
+        watchdog = threading.Timer(self.graceful_timeout, os._exit, (1,))
+        watchdog.daemon = True
+        watchdog.start()
+        self.server.server_close()
+        write_behind.queue.stop()
+        passwords.pool.shutdown()
+
+
+class Master:
+    """Forks and supervises the workers"""
+
+    def __init__(self, app, sock, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.target = args.workers
+        self.workers = {}
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self):
+        # Jitter keeps workers from all recycling at the same moment
+        max_requests = self.args.max_requests
+        if max_requests and self.args.max_requests_jitter:
+            max_requests += random.randint(0, self.args.max_requests_jitter)
+
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+
+        for sig in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        code = 0
+        try:
+            Worker(self.app, self.sock, self.args.bind, max_requests,
+                   self.args.graceful_timeout).run()
+        except Exception as e:
+            log(f"worker crashed: {e}")
+            code = 1
+            passwords.pool.shutdown()
+        finally:
+            os._exit(code)
+
+    def reap(self):
+        """Collect exited workers; returns how many went"""
+        exited = 0
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return exited
+            if not pid:
+                return exited
+            if self.workers.pop(pid, None) is not None:
+                exited += 1
+                if os.WIFSIGNALED(status):
+                    log(f"worker {pid} killed by signal {os.WTERMSIG(status)}")
+
+    def retire(self, pids):
+        """Gracefully stop the given workers, killing any that overrun the timeout"""
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    remaining.discard(pid)
+                    self.workers.pop(pid, None)
+            time.sleep(0.05)
+        for pid in remaining:
+            log(f"worker {pid} overran the graceful timeout, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.workers.pop(pid, None)
+
+    def reload(self):
+        """
+        Re-exec the master in place with the same PID and listening
+        socket; the new image starts its workers before retiring these,
+        so the socket never stops accepting.
+        """
+        log("reloading")
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(str(pid) for pid in self.workers)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def handle(self, signum, frame):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stopping = True
+        elif signum == signal.SIGHUP:
+            self.reloading = True
+        elif signum == signal.SIGTTIN:
+            self.target += 1
+        elif signum == signal.SIGTTOU:
+            self.target = max(1, self.target - 1)
+
+    def run(self):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                    signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, self.handle)
+
+        # Objects loaded so far are never collected, so the collector
+        # doesn't touch (and copy) their pages in the workers
+        gc.freeze()
+
+        for _ in range(self.target):
+            self.spawn()
+
+        old = [int(pid) for pid in os.environ.pop(OLD_WORKERS_ENV, '').split(',') if pid]
+        if old:
+            log(f"retiring {len(old)} workers from before the reload")
+            self.retire(old)
+
+        log(f"serving on {self.args.bind} with {self.target} workers")
+        while not self.stopping:
+            if self.reloading:
+                self.reload()
+            self.reap()
+            while len(self.workers) < self.target and not self.stopping:
+                self.spawn()
+            if len(self.workers) > self.target:
+                newest = max(self.workers, key=self.workers.get)
+                self.retire([newest])
+            time.sleep(0.1)
+
+        log("shutting down")
+        self.retire(list(self.workers))
+        self.sock.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the store with preforked workers')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help=f'worker processes (default: {WORKERS})')
+    parser.add_argument('--bind', default=BIND, help=f'host:port (default: {BIND})')
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS,
+                        help=f'recycle a worker after this many requests, 0 for never '
+                             f'(default: {MAX_REQUESTS})')
+    parser.add_argument('--max-requests-jitter', type=int, default=MAX_REQUESTS_JITTER,
+                        help=f'random extra requests per worker (default: {MAX_REQUESTS_JITTER})')
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT,
+                        help=f'seconds a stopping worker gets to finish (default: {GRACEFUL_TIMEOUT:g})')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sock = listen(args.bind)
+
+    # Preload once in the master: database init runs here, and workers
+    # share the loaded app through copy-on-write
+    from app import app
+
+    Master(app, sock, args).run()
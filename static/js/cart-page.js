@@ -2,6 +2,14 @@
 
 document.addEventListener('DOMContentLoaded', () => {
     loadCart();
+    
+    // Prices and stock in the cart may be stale; refresh them in one request
+    revalidateCart().then(changed => {
+        if (changed) {
+            loadCart();
+            showNotification('Your cart was updated with current prices and stock');
+        }
+    }).catch(error => console.error('Error:', error));
 });
 
 function loadCart() {
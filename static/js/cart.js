@@ -82,6 +82,41 @@ function getCartTotal() {
   return cart.reduce((sum, item) => sum + item.price * item.quantity, 0);
 }
 
+// Refresh cart prices and stock from the server in one request.
+// Items no longer sold or out of stock are dropped and quantities are
+// capped at the stock left. Resolves to true if the cart changed.
+async function revalidateCart() {
+  const cart = getCart();
+  if (cart.length === 0) return false;
+
+  const response = await fetch("/api/products/batch", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ ids: cart.map((item) => item.id) }),
+  });
+  if (!response.ok) return false;
+  const data = await response.json();
+  const current = new Map(data.products.map((product) => [product.id, product]));
+
+  let changed = false;
+  const updated = [];
+  cart.forEach((item) => {
+    const product = current.get(item.id);
+    if (!product || !product.available) {
+      changed = true;
+      return;
+    }
+    const quantity = Math.min(item.quantity, product.stock);
+    if (product.price !== item.price || product.name !== item.name || quantity !== item.quantity) {
+      changed = true;
+    }
+    updated.push({ ...item, name: product.name, price: product.price, quantity: quantity });
+  });
+
+  if (changed) saveCart(updated);
+  return changed;
+}
+
 // Show notification
 function showNotification(message) {
   // Create notification element
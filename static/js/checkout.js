@@ -170,6 +170,19 @@ async function handleCheckout(e) {
   submitBtn.disabled = true;
   submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Processing...';
 
+  // Recheck prices and stock first so the order matches what was shown
+  try {
+    if (await revalidateCart()) {
+      loadOrderItems();
+      showError("Some prices or stock changed. Please review your order.");
+      submitBtn.disabled = false;
+      submitBtn.innerHTML = '<i class="fas fa-lock"></i> Place Order';
+      return;
+    }
+  } catch (error) {
+    console.error("Error:", error);
+  }
+
   const cart = getCart();
   const paymentMethod = document.querySelector(
     'input[name="payment_method"]:checked'
@@ -226,6 +239,12 @@ document.addEventListener("DOMContentLoaded", function () {
   loadOrderItems();
   setupPaymentMethodToggle();
 
+  revalidateCart()
+    .then((changed) => {
+      if (changed) loadOrderItems();
+    })
+    .catch((error) => console.error("Error:", error));
+
   document
     .getElementById("checkoutForm")
     .addEventListener("submit", handleCheckout);
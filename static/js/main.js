@@ -10,12 +10,14 @@ document.addEventListener('DOMContentLoaded', async () => {
 // Load featured products
 async function loadFeaturedProducts() {
     try {
-        const response = await fetch('/api/products');
-        const products = await response.json();
-        
-        // Get first 6 products for featured section
-        const featured = products.slice(0, 6);
-        displayProducts(featured);
+        // Only the 6 featured cards, with just the fields a card shows
+        const params = new URLSearchParams({
+            limit: 6,
+            fields: 'id,name,brand,price,rating,image_url'
+        });
+        const response = await fetch(`/api/products?${params.toString()}`);
+        const data = await response.json();
+        displayProducts(data.products);
     } catch (error) {
         console.error('Error loading products:', error);
     }
@@ -43,14 +43,23 @@ function getStatusBadge(status) {
   return `<span class="order-status ${badgeClass}">${statusText}</span>`;
 }
 
-async function loadOrders() {
+// Cursor for the next page of order history, null when all are shown
+let ordersCursor = null;
+
+async function loadOrders(append = false) {
   try {
-    const response = await fetch("/api/user/orders");
-    const orders = await response.json();
+    // Orders arrive with their items embedded, one request per page
+    const params = new URLSearchParams({ limit: 20 });
+    if (append && ordersCursor) params.append("cursor", ordersCursor);
+    const response = await fetch(`/api/user/orders/history?${params}`);
+    const data = await response.json();
+    const orders = data.orders;
+    ordersCursor = data.next_cursor;
 
     const container = document.getElementById("ordersContainer");
+    document.getElementById("loadMoreOrders")?.remove();
 
-    if (!Array.isArray(orders) || orders.length === 0) {
+    if (!append && (!Array.isArray(orders) || orders.length === 0)) {
       container.innerHTML = `
                 <div class="empty-state">
                     <i class="fas fa-inbox"></i>
@@ -61,16 +70,7 @@ async function loadOrders() {
       return;
     }
 
-    // Load items for each order
-    const ordersWithItems = await Promise.all(
-      orders.map(async (order) => {
-        const itemsResponse = await fetch(`/api/user/orders/${order.id}/items`);
-        const items = await itemsResponse.json();
-        return { ...order, items };
-      })
-    );
-
-    container.innerHTML = ordersWithItems
+    const html = orders
       .map(
         (order) => `
             <div class="order-card">
@@ -120,6 +120,21 @@ async function loadOrders() {
         `
       )
       .join("");
+
+    if (append) {
+      container.insertAdjacentHTML("beforeend", html);
+    } else {
+      container.innerHTML = html;
+    }
+
+    if (ordersCursor) {
+      container.insertAdjacentHTML(
+        "beforeend",
+        `<button id="loadMoreOrders" class="order-details-btn" onclick="loadOrders(true)">
+            Load More Orders
+        </button>`
+      );
+    }
   } catch (error) {
     console.error("Error loading orders:", error);
     const container = document.getElementById("ordersContainer");
@@ -1,15 +1,21 @@
 // Shop Page JavaScript
 
+const PAGE_SIZE = 24;
+const CARD_FIELDS = 'id,name,brand,price,rating,image_url,description,stock';
+
+// Query and cursor for the listing currently shown in the grid
+let currentQuery = new URLSearchParams();
+let nextCursor = null;
+
+// Facet values ticked in the category and brand lists
+const selected = { category: new Set(), brand: new Set() };
+
 document.addEventListener('DOMContentLoaded', () => {
-    loadProducts();
-    
     // Get category from URL if present
     const urlParams = new URLSearchParams(window.location.search);
     const category = urlParams.get('category');
-    if (category) {
-        document.getElementById('categoryFilter').value = category;
-        applyFilters();
-    }
+    if (category) selected.category.add(category);
+    applyFilters();
     
     // Add enter key listener for search
     document.getElementById('searchInput').addEventListener('keypress', (e) => {
@@ -19,48 +25,121 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 });
 
-// Load all products
-async function loadProducts() {
+// Fetch one page for the current query, replacing or appending to the grid
+async function fetchPage(append) {
+    const params = new URLSearchParams(currentQuery);
+    params.append('limit', PAGE_SIZE);
+    params.append('fields', CARD_FIELDS);
+    if (append && nextCursor) params.append('cursor', nextCursor);
+    // Facet counts cover the whole result, so the first page is enough
+    if (!append) params.append('facets', '1');
+    
     try {
-        const response = await fetch('/api/products');
-        const products = await response.json();
-        displayProducts(products);
+        const response = await fetch(`/api/products?${params.toString()}`);
+        const data = await response.json();
+        nextCursor = data.next_cursor;
+        displayProducts(data.products, append);
+        if (data.facets) renderFacets(data.facets);
     } catch (error) {
         console.error('Error loading products:', error);
     }
 }
 
+// Load the next page below the current one
+function loadMore() {
+    if (nextCursor) fetchPage(true);
+}
+
 // Apply filters
 async function applyFilters() {
-    const category = document.getElementById('categoryFilter').value;
     const minPrice = document.getElementById('minPrice').value;
     const maxPrice = document.getElementById('maxPrice').value;
+    const minRating = document.getElementById('ratingFilter').value;
+    const inStock = document.getElementById('inStockFilter').checked;
     const search = document.getElementById('searchInput').value;
+    const sort = document.getElementById('sortFilter').value;
     
-    // Build query string
+    // Build query string; each ticked category or brand is its own param
     const params = new URLSearchParams();
-    if (category && category !== 'all') params.append('category', category);
+    selected.category.forEach(category => params.append('category', category));
+    selected.brand.forEach(brand => params.append('brand', brand));
     if (minPrice) params.append('min_price', minPrice);
     if (maxPrice) params.append('max_price', maxPrice);
+    if (minRating) params.append('min_rating', minRating);
+    if (inStock) params.append('in_stock', '1');
     if (search) params.append('search', search);
+    if (sort) params.append('sort', sort);
     
-    try {
-        const response = await fetch(`/api/products?${params.toString()}`);
-        const products = await response.json();
-        displayProducts(products);
-    } catch (error) {
-        console.error('Error filtering products:', error);
-    }
+    currentQuery = params;
+    await fetchPage(false);
+}
+
+// Render facet counts; each facet is counted as if its own filter were off
+function renderFacets(facets) {
+    renderFacetList('categoryFacets', 'category', facets.categories);
+    renderFacetList('brandFacets', 'brand', facets.brands);
+    
+    const prices = document.getElementById('priceFacets');
+    prices.innerHTML = '';
+    facets.price.forEach(bucket => {
+        if (!bucket.count) return;
+        const label = document.createElement('label');
+        label.className = 'facet-item';
+        const radio = document.createElement('input');
+        radio.type = 'radio';
+        radio.name = 'priceBucket';
+        radio.checked = document.getElementById('minPrice').value == (bucket.min || '') &&
+            document.getElementById('maxPrice').value == (bucket.max ?? '');
+        radio.onchange = () => {
+            document.getElementById('minPrice').value = bucket.min || '';
+            document.getElementById('maxPrice').value = bucket.max ?? '';
+            applyFilters();
+        };
+        const range = bucket.max === null ? `$${bucket.min}+` : `$${bucket.min} - $${bucket.max}`;
+        label.append(radio, ` ${range} `, facetCount(bucket.count));
+        prices.appendChild(label);
+    });
+    
+    document.getElementById('inStockCount').textContent = `(${facets.in_stock})`;
+}
+
+// Checkbox list for one facet; ticking a value adds it to the filter
+function renderFacetList(containerId, name, counts) {
+    const container = document.getElementById(containerId);
+    container.innerHTML = '';
+    Object.entries(counts).forEach(([value, count]) => {
+        const label = document.createElement('label');
+        label.className = 'facet-item';
+        const box = document.createElement('input');
+        box.type = 'checkbox';
+        box.checked = selected[name].has(value);
+        box.onchange = () => {
+            if (box.checked) selected[name].add(value);
+            else selected[name].delete(value);
+            applyFilters();
+        };
+        label.append(box, ` ${value} `, facetCount(count));
+        container.appendChild(label);
+    });
+}
+
+function facetCount(count) {
+    const span = document.createElement('span');
+    span.className = 'facet-count';
+    span.textContent = `(${count})`;
+    return span;
 }
 
 // Display products
-function displayProducts(products) {
+function displayProducts(products, append = false) {
     const grid = document.getElementById('productsGrid');
     const noProducts = document.getElementById('noProducts');
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
     
-    grid.innerHTML = '';
+    if (!append) grid.innerHTML = '';
+    loadMoreBtn.style.display = nextCursor ? 'inline-block' : 'none';
     
-    if (products.length === 0) {
+    if (!append && products.length === 0) {
         grid.style.display = 'none';
         noProducts.style.display = 'block';
         return;
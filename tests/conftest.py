@@ -0,0 +1,67 @@
+"""
+Shared fixtures. The store reads its settings from the environment when
+its modules are first imported, so they are pointed at a scratch
+database here, before any test imports app.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_DATA_DIR = tempfile.mkdtemp(prefix='music_store_tests_')
+atexit.register(shutil.rmtree, _DATA_DIR, True)
+
+os.environ.update({
+    'MUSIC_STORE_DB': os.path.join(_DATA_DIR, 'music_store.db'),
+    'MUSIC_STORE_REPLICA': os.path.join(_DATA_DIR, 'music_store_replica.db'),
+    'SECRET_KEY': 'tests',
+    # Hash on the calling thread, cheaply
+    'MUSIC_STORE_HASH_WORKERS': '0',
+    'MUSIC_STORE_SCRYPT_N': '1024',
+    'MUSIC_STORE_AUTH_IP_PER_MINUTE': '0',
+    'MUSIC_STORE_LOGIN_USERNAME_PER_MINUTE': '0',
+})
+
+
+@pytest.fixture(scope='session')
+def store():
+    """The app module on a migrated and seeded scratch database"""
+    import app
+    import db
+    import seed
+
+    conn = db.connect()
+    try:
+        seed.seed(conn)
+    finally:
+        conn.close()
+    app.app.testing = True
+    return app
+
+
+@pytest.fixture
+def conn(store):
+    import db
+
+    conn = db.connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(store):
+    return store.app.test_client()
+
+
+@pytest.fixture
+def admin(client):
+    """A test client logged in as the seeded admin"""
+    import seed
+
+    response = client.post('/api/auth/login', json={'username': seed.ADMIN_USERNAME,
+                                                    'password': seed.ADMIN_PASSWORD})
+    assert response.status_code == 200
+    return client
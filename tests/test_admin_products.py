@@ -0,0 +1,27 @@
+PRODUCT = {
+    'name': 'Test Strat', 'category': 'Guitars', 'brand': 'TestCo', 'price': 499.0,
+    'description': 'A test guitar', 'image_url': '/static/images/test.jpg',
+}
+
+
+def test_add_duplicate_product_conflicts(admin):
+    assert admin.post('/api/admin/products', json=PRODUCT).status_code == 201
+
+    response = admin.post('/api/admin/products', json=PRODUCT)
+    assert response.status_code == 409
+    assert response.get_json() == {'error': 'A product with this brand and name already exists'}
+
+
+def test_rename_onto_existing_product_conflicts(admin, conn):
+    first = dict(PRODUCT, name='Test Tele')
+    second = dict(PRODUCT, name='Test Jazzmaster')
+    for product in (first, second):
+        assert admin.post('/api/admin/products', json=product).status_code == 201
+    second_id = conn.execute('SELECT id FROM products WHERE brand = ? AND name = ?',
+                             (second['brand'], second['name'])).fetchone()[0]
+
+    response = admin.put(f'/api/admin/products/{second_id}', json=first)
+    assert response.status_code == 409
+    assert response.get_json() == {'error': 'A product with this brand and name already exists'}
+    assert conn.execute('SELECT name FROM products WHERE id = ?',
+                        (second_id,)).fetchone()[0] == second['name']
@@ -0,0 +1,54 @@
+import hashlib
+import threading
+
+import passwords
+import rate_limit
+import seed
+
+
+def _login(client, username, password, ip='10.0.0.1'):
+    return client.post('/api/auth/login', json={'username': username, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_legacy_hash_is_replaced_on_login(client, conn):
+    legacy = hashlib.sha256(b'old-secret').hexdigest()
+    conn.execute('INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+                 ('legacy_user', 'legacy@example.com', legacy))
+    conn.commit()
+
+    assert _login(client, 'legacy_user', 'old-secret').status_code == 200
+
+    stored = conn.execute("SELECT password FROM users WHERE username = 'legacy_user'").fetchone()[0]
+    assert stored.startswith(passwords.SCRYPT_METHOD + '$')
+    assert not passwords.needs_rehash(stored)
+    assert _login(client, 'legacy_user', 'old-secret').status_code == 200
+    assert _login(client, 'legacy_user', 'wrong').status_code == 401
+
+
+def test_password_spraying_does_not_lock_the_owner_out(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, 'login_by_username', rate_limit.TokenBucketLimiter(1, 2))
+
+    for _ in range(2):
+        assert _login(client, seed.ADMIN_USERNAME, 'guess', '203.0.113.9').status_code == 401
+    refused = _login(client, seed.ADMIN_USERNAME, 'guess', '203.0.113.9')
+    assert refused.status_code == 429
+    assert int(refused.headers['Retry-After']) > 0
+
+    owner = _login(client, seed.ADMIN_USERNAME, seed.ADMIN_PASSWORD, '198.51.100.7')
+    assert owner.status_code == 200
+
+
+def test_hash_pool_counts_every_job():
+    pool = passwords.HashPool(workers=0, max_pending=64)
+
+    def hash_many():
+        for _ in range(500):
+            pool.run(int)
+    threads = [threading.Thread(target=hash_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool.stats()['jobs'] == 4000
@@ -0,0 +1,29 @@
+import columnar
+
+COLUMNS = ['id', 'price', 'category', 'note']
+ROWS = [
+    (1, 9.99, 'Guitars', 'first'),
+    (70000, None, 'Drums', None),
+    (-5, 1234.5, 'Guitars', 'ünïcode'),
+]
+
+
+def _round_trip(path):
+    with open(path, 'wb') as f:
+        writer = columnar.ColumnarWriter(f, COLUMNS, chunk_rows=2)
+        for row in ROWS:
+            writer.write(row)
+        writer.close()
+    with columnar.ColumnarFile(path) as reader:
+        return [tuple(row[name] for name in COLUMNS) for row in reader.to_rows()]
+
+
+def test_round_trip(tmp_path):
+    assert _round_trip(str(tmp_path / 'rows.col')) == ROWS
+
+
+def test_round_trip_through_byteswapping(tmp_path, monkeypatch):
+    # Swapping on both sides is what a big-endian host does; on this
+    # host it stores the buffers big-endian and reads them back the same way
+    monkeypatch.setattr(columnar, '_SWAP', True)
+    assert _round_trip(str(tmp_path / 'rows.col')) == ROWS
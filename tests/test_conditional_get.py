@@ -0,0 +1,42 @@
+import gzip
+
+PRODUCT = {
+    'name': 'ETag Test Cajon', 'category': 'Drums', 'brand': 'ETagCo', 'price': 120.0,
+    'description': 'For the ETag tests', 'image_url': '/static/images/test.jpg',
+}
+
+
+def test_unchanged_product_answers_304(client):
+    first = client.get('/api/products/1')
+    etag = first.headers['ETag']
+
+    again = client.get('/api/products/1', headers={'If-None-Match': etag})
+
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+
+def test_admin_edit_changes_the_etag(admin, conn):
+    assert admin.post('/api/admin/products', json=PRODUCT).status_code == 201
+    product_id = conn.execute('SELECT id FROM products WHERE name = ?',
+                              (PRODUCT['name'],)).fetchone()[0]
+    url = f'/api/products/{product_id}'
+    etag = admin.get(url).headers['ETag']
+
+    admin.put(url.replace('/api/', '/api/admin/'), json=dict(PRODUCT, price=99.0))
+    response = admin.get(url, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['price'] == 99.0
+
+
+def test_listing_is_gzipped_on_request(client):
+    plain = client.get('/api/products')
+    zipped = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers['ETag'] != plain.headers['ETag']
@@ -0,0 +1,80 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import export_data
+
+
+@pytest.fixture
+def exports(tmp_path, monkeypatch, store):
+    monkeypatch.setattr(export_data, 'EXPORT_DIR', str(tmp_path))
+    monkeypatch.setattr(export_data, 'STATE_FILE', str(tmp_path / 'export_state.json'))
+    return tmp_path
+
+
+def _run(**options):
+    assert export_data.export_to_csv_and_json(formats=('csv',), **options)
+    with open(export_data.STATE_FILE) as f:
+        return json.load(f)
+
+
+def _dataset_files(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith('.csv') and not name.startswith('summary'))
+
+
+def test_incremental_exports_write_only_changed_rows(exports, conn):
+    _run()
+    full_files = _dataset_files(exports)
+
+    # Nothing changed: no delta files, and compaction comes no closer
+    state = _run(incremental=True)
+    assert _dataset_files(exports) == full_files
+    assert all(entry['deltas'] == [] for entry in state.values())
+
+    product_id = conn.execute('SELECT MIN(id) FROM products').fetchone()[0]
+    conn.execute('''INSERT INTO sales_tracking (product_id, quantity_sold, total_revenue, last_updated)
+                    VALUES (?, 1, 10, datetime('now', '+1 hour'))
+                    ON CONFLICT (product_id) DO UPDATE SET
+                    quantity_sold = quantity_sold + 1, last_updated = excluded.last_updated''',
+                 (product_id,))
+    conn.commit()
+
+    state = _run(incremental=True)
+    for name in ('inventory_stock', 'sales_summary'):
+        (delta,) = state[name]['deltas']
+        with open(delta[0]) as f:
+            rows = f.read().splitlines()
+        # Header plus the one product sold since the last export
+        assert len(rows) == 2 and rows[1].startswith(f'{product_id},')
+    for name in ('sales_data', 'customer_purchases'):
+        assert state[name]['deltas'] == []
+
+    # The watermark is exclusive: the same row is not exported again
+    state = _run(incremental=True)
+    assert all(len(entry['deltas']) <= 1 for entry in state.values())
+
+
+class _Clock:
+    """Stands in for datetime so each run gets a timestamp of the test's choosing"""
+    current = None
+
+    @classmethod
+    def now(cls):
+        return cls.current
+
+
+def test_full_exports_replace_earlier_ones(exports, monkeypatch):
+    monkeypatch.setattr(export_data, 'datetime', _Clock)
+
+    _Clock.current = datetime(2030, 1, 1, 0, 0, 0)
+    _run()
+    _Clock.current = datetime(2030, 1, 1, 0, 0, 1)
+    state = _run(force_full=True)
+
+    files = _dataset_files(exports)
+    assert len(files) == len(export_data.DATASETS)
+    assert all('20300101_000001' in name for name in files)
+    assert all(os.path.exists(path) for entry in state.values() for path in entry['full_files'])
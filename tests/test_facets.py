@@ -0,0 +1,86 @@
+import threading
+
+import facets
+
+THEREMIN = {
+    'name': 'Facet Test Theremin', 'category': 'Theremins', 'brand': 'FacetCo', 'price': 320.0,
+    'description': 'For the facet tests', 'image_url': '/static/images/test.jpg', 'stock': 3,
+}
+
+
+def _sql_counts(conn, column):
+    return dict(conn.execute(f'SELECT {column}, COUNT(*) FROM products GROUP BY {column}'))
+
+
+def test_counts_match_group_by(conn):
+    counts = facets.FacetIndex().counts(conn, {})
+
+    assert counts['total'] == conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+    assert counts['categories'] == _sql_counts(conn, 'category')
+    assert counts['brands'] == _sql_counts(conn, 'brand')
+
+
+def test_bitmaps_are_sized_by_row_count(conn):
+    index = facets.FacetIndex()
+    index.counts(conn, {})
+    products = index.stats()['products']
+    assert index.stats()['bits'] == products
+
+    # A deleted product's bit is reused by the next one added
+    product_id = conn.execute('SELECT MAX(id) FROM products').fetchone()[0]
+    index.product_deleted(product_id)
+    index.product_added(conn, product_id)
+    assert index.stats()['bits'] == products
+
+
+def test_admin_hooks_keep_the_index_current(admin, conn):
+    facets.index.counts(conn, {})
+    assert 'Theremins' not in facets.index.counts(conn, {})['categories']
+
+    assert admin.post('/api/admin/products', json=THEREMIN).status_code == 201
+    product_id = conn.execute('SELECT id FROM products WHERE name = ?',
+                              (THEREMIN['name'],)).fetchone()[0]
+    assert facets.index.counts(conn, {})['categories']['Theremins'] == 1
+
+    admin.put(f'/api/admin/products/{product_id}', json=dict(THEREMIN, stock=0))
+    assert facets.index.counts(conn, {'category': 'Theremins', 'in_stock': True})['total'] == 0
+
+    admin.delete(f'/api/admin/products/{product_id}')
+    assert 'Theremins' not in facets.index.counts(conn, {})['categories']
+
+
+def test_stale_index_rebuilds_in_the_background(conn, monkeypatch):
+    index = facets.FacetIndex(ttl=0)
+    total = index.counts(conn, {})['total']
+
+    scanned = threading.Event()
+    release = threading.Event()
+    scan = facets._scan
+
+    def slow_scan(scan_conn):
+        data = scan(scan_conn)
+        scanned.set()
+        release.wait(5)
+        return data
+    monkeypatch.setattr(facets, '_scan', slow_scan)
+
+    # Stale: this request starts the rebuild and still answers from the old bitmaps
+    assert index.counts(conn, {})['total'] == total
+    assert scanned.wait(5)
+
+    # A write that lands after the rebuild's scan is replayed onto its result
+    cursor = conn.execute('''INSERT INTO products (name, category, brand, price)
+                             VALUES ('Facet Test Kazoo', 'Kazoos', 'FacetCo', 5)''')
+    conn.commit()
+    index.product_added(conn, cursor.lastrowid)
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'facet-rebuild':
+            thread.join(5)
+
+    stats = index.stats()
+    assert stats['rebuilds'] == 2 and not stats['rebuilding']
+    assert index._data.rows[cursor.lastrowid][0] == 'Kazoos'
+
+    conn.execute('DELETE FROM products WHERE id = ?', (cursor.lastrowid,))
+    conn.commit()
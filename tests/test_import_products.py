@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+import import_products
+
+ROW = {'name': 'Import Test Bass', 'category': 'Bass', 'brand': 'ImportCo', 'price': '799'}
+
+
+@pytest.mark.parametrize('stock, expected', [('3', 3), (3, 3), ('3.0', 3), ('', None)])
+def test_stock_accepts_whole_numbers(stock, expected):
+    assert import_products.validate(dict(ROW, stock=stock))[-1] == expected
+
+
+@pytest.mark.parametrize('stock', ['3.7', 3.7, 'lots', '-1'])
+def test_stock_rejects_anything_else(stock):
+    with pytest.raises(ValueError):
+        import_products.validate(dict(ROW, stock=stock))
+
+
+CSV = ('name,category,brand,price,stock\n'
+       'Import Test Bass,Bass,ImportCo,799,2\n'
+       'Import Test Bass,Bass,ImportCo,749,3.7\n')
+
+
+def _import(conn):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        report = import_products.import_stream(conn, io.StringIO(CSV), 'csv')
+    finally:
+        conn.set_trace_callback(None)
+        conn.execute("DELETE FROM products WHERE brand = 'ImportCo'")
+        conn.commit()
+    return report, any("'optimize'" in sql for sql in statements)
+
+
+def test_small_import_leaves_the_search_index_alone(conn):
+    report, optimized = _import(conn)
+
+    assert (report.inserted, report.failed) == (1, 1)
+    assert report.errors[0]['line'] == 3
+    assert not optimized
+
+
+def test_large_import_merges_the_search_index(conn, monkeypatch):
+    monkeypatch.setattr(import_products, 'OPTIMIZE_ROWS', 1)
+
+    assert _import(conn)[1]
@@ -0,0 +1,28 @@
+import os
+import re
+
+import db
+import instrumentation
+import replica
+
+
+def _gauge(text, name):
+    match = re.search(rf'^{name} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_replica_lag_is_exported(store):
+    if os.path.exists(db.REPLICA_PATH):
+        os.remove(db.REPLICA_PATH)
+    text = instrumentation.metrics.render()
+    assert _gauge(text, 'music_store_replica_available') == 0
+    assert _gauge(text, 'music_store_replica_lag_seconds') is None
+
+    replica.refresh()
+    try:
+        text = instrumentation.metrics.render()
+    finally:
+        os.remove(db.REPLICA_PATH)
+    assert '# TYPE music_store_replica_lag_seconds gauge' in text
+    assert _gauge(text, 'music_store_replica_available') == 1
+    assert 0 <= _gauge(text, 'music_store_replica_lag_seconds') < 60
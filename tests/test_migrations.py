@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+
+import db
+import migrate_db
+import rollups
+
+# The database as the store shipped before versioned migrations
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'music_store.db')
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    shutil.copy(BASELINE_DB, path)
+    conn = db.connect(path)
+    yield conn
+    conn.close()
+
+
+def _rollup_rows(conn):
+    return {table: conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall()
+            for table in rollups.ROLLUP_TABLES}
+
+
+def test_baseline_migrates_to_latest(baseline):
+    assert migrate_db.current_version(baseline) == 0
+
+    applied = migrate_db.migrate(baseline)
+
+    assert applied == [version for version, _, _ in migrate_db.MIGRATIONS]
+    assert migrate_db.current_version(baseline) == migrate_db.LATEST_VERSION
+    assert rollups.verify(baseline) == []
+    assert baseline.execute('''SELECT COUNT(*) FROM (SELECT 1 FROM products
+                               GROUP BY brand, name HAVING COUNT(*) > 1)''').fetchone()[0] == 0
+    # Nothing left to do on a second run
+    assert migrate_db.migrate(baseline) == []
+
+
+def test_migrated_rollups_match_a_rebuild(baseline):
+    migrate_db.migrate(baseline)
+    migrated = _rollup_rows(baseline)
+
+    rollups.rebuild(baseline)
+
+    assert _rollup_rows(baseline) == migrated
+
+
+def test_hourly_order_rollup_refills_an_existing_table(baseline):
+    # Before migration 6 was frozen, migration 5 created and filled
+    # orders_hourly too
+    steps = migrate_db.MIGRATIONS
+    migrate_db.MIGRATIONS = steps[:5]
+    try:
+        migrate_db.migrate(baseline)
+    finally:
+        migrate_db.MIGRATIONS = steps
+    rollups.rebuild(baseline)
+    baseline.commit()
+
+    migrate_db.migrate(baseline)
+
+    assert rollups.verify(baseline) == []
@@ -0,0 +1,49 @@
+import pytest
+
+import rollups
+
+
+@pytest.fixture
+def product(conn, request):
+    """A product with two in stock, named after the test using it"""
+    cursor = conn.execute('''INSERT INTO products (name, category, brand, price, stock)
+                             VALUES (?, 'Drums', 'OrderCo', 150.0, 2)''', (request.node.name,))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def _order(client, product_id, quantity, price=1):
+    return client.post('/api/orders', json={
+        'items': [{'id': product_id, 'quantity': quantity, 'price': price}],
+        'payment_method': 'card', 'delivery_address': '1 Test Street'})
+
+
+def _stock(conn, product_id):
+    return conn.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+
+
+def test_insufficient_stock_conflicts_and_changes_nothing(admin, conn, product):
+    orders_before = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    response = _order(admin, product, 3)
+
+    assert response.status_code == 409
+    body = response.get_json()
+    assert body['error'] == 'Insufficient stock'
+    (line,) = body['items']
+    assert (line['id'], line['requested'], line['available']) == (product, 3, 2)
+    assert _stock(conn, product) == 2
+    assert conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == orders_before
+
+
+def test_order_is_priced_on_the_server_and_rolled_up(admin, conn, product):
+    response = _order(admin, product, 2, price=0.01)
+
+    assert response.status_code == 201
+    assert response.get_json()['total_amount'] == 300.0
+    assert _stock(conn, product) == 0
+    assert rollups.verify(conn) == []
+
+    # Sold out: gone from in-stock listings straight away
+    listing = admin.get('/api/products', query_string={'brand': 'OrderCo', 'in_stock': 1})
+    assert product not in [item['id'] for item in listing.get_json()]
@@ -0,0 +1,49 @@
+import base64
+import json
+
+import pytest
+
+
+def _pages(client, **params):
+    """Every page of a paginated listing, following next_cursor"""
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/products', query_string=query)
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append(body['products'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('sort', ['default', 'price_asc', 'price_desc', 'rating', 'newest'])
+def test_cursor_pages_cover_the_listing_once(client, sort):
+    everything = client.get('/api/products', query_string={'sort': sort}).get_json()
+
+    pages = _pages(client, sort=sort, limit=7, fields='name,price')
+
+    ids = [product['id'] for page in pages for product in page]
+    assert ids == [product['id'] for product in everything]
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert set(pages[0][0]) == {'id', 'name', 'price'}
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('query', [
+    {'limit': 5, 'cursor': 'not-a-cursor!'},
+    {'limit': 5, 'cursor': _cursor([10])},
+    {'limit': 5, 'cursor': _cursor([10, 'x'])},
+    {'limit': 5, 'cursor': _cursor([{'price': 1}, 3])},
+    {'sort': 'cheapest'},
+    {'fields': 'name,password'},
+])
+def test_bad_listing_parameters_are_rejected(client, query):
+    response = client.get('/api/products', query_string=query)
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,25 @@
+import os
+import sqlite3
+
+import reset_db
+
+
+def test_reset_backs_up_uncheckpointed_wal(tmp_path):
+    path = str(tmp_path / 'store.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA wal_autocheckpoint = 0')
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.execute('INSERT INTO t VALUES (1)')
+    conn.commit()
+    # The commit is only in the -wal file while this connection is open
+    assert os.path.getsize(path + '-wal') > 0
+
+    reset_db.reset_database(path)
+    conn.close()
+
+    for suffix in ('', '-wal', '-shm'):
+        assert not os.path.exists(path + suffix)
+    backup = sqlite3.connect(path + '.backup')
+    assert backup.execute('SELECT x FROM t').fetchall() == [(1,)]
+    backup.close()
@@ -4,10 +4,12 @@ Database Viewer Script
 Display database data in readable table format in terminal
 """
 
-import sqlite3
 import os
 from tabulate import tabulate
 
+import db
+import rollups
+
 def print_section(title):
     """Print a formatted section header"""
     print("\n" + "="*100)
@@ -16,14 +18,14 @@ def print_section(title):
 
 def view_orders():
     """Display all orders"""
-    db_path = 'music_store.db'
+    # The reporting replica when MUSIC_STORE_REPORTING=replica, else the primary
+    db_path = db.reporting_path()
     
     if not os.path.exists(db_path):
         print("❌ Database not found!")
         return
     
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = db.connect_reporting()
     cursor = conn.cursor()
     
     # ===== ORDERS VIEW =====
@@ -137,14 +139,26 @@ def view_orders():
     else:
         print("No sales recorded yet")
     
+    # ===== DAILY SALES =====
+    print_section("📅 DAILY SALES - LAST 14 DAYS")
+    
+    if rollups.has_rollups(conn):
+        since = cursor.execute("SELECT date('now', '-13 days')").fetchone()[0]
+        daily = rollups.daily_series(conn, date_from=since)
+        if daily:
+            print(tabulate(daily, headers="keys", tablefmt="grid"))
+        else:
+            print("No sales in the last 14 days")
+    else:
+        print("Sales rollups not built yet - run: python migrate_db.py")
+    
     # ===== SUMMARY STATISTICS =====
     print_section("📈 SUMMARY STATISTICS")
     
-    cursor.execute('SELECT COUNT(*) as total_orders FROM orders')
-    total_orders = cursor.fetchone()['total_orders']
-    
-    cursor.execute('SELECT SUM(total_amount) as total_revenue FROM orders')
-    total_revenue = cursor.fetchone()['total_revenue'] or 0
+    # Order totals come from the daily rollups rather than the order history
+    totals = rollups.totals(conn)
+    total_orders = totals['total_orders']
+    total_revenue = totals['total_revenue']
     
     cursor.execute('SELECT COUNT(*) as total_customers FROM users WHERE is_admin = 0')
     total_customers = cursor.fetchone()['total_customers']
@@ -152,8 +166,7 @@ def view_orders():
     cursor.execute('SELECT COUNT(*) as total_products FROM products')
     total_products = cursor.fetchone()['total_products']
     
-    cursor.execute('SELECT SUM(quantity_sold) as total_units FROM sales_tracking')
-    total_units = cursor.fetchone()['total_units'] or 0
+    total_units = totals['total_units']
     
     cursor.execute('SELECT SUM(stock) as total_stock FROM products')
     total_stock = cursor.fetchone()['total_stock'] or 0
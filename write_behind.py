@@ -0,0 +1,221 @@
+"""
+Write-Behind Sales Bookkeeping
+Optional mode where checkout skips the sales_tracking and rollup updates
+and a background worker folds committed orders in, in batches
+
+The worker never trusts its in-memory queue for data. Each flush reads
+the orders committed since a watermark stored in the database, coalesces
+their lines per product in SQL and advances the watermark in the same
+transaction. Events only decide when to flush, so orders whose events
+died with a crashed process are replayed from order_items on the next
+flush or at startup.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import db
+import rollups
+
+ENABLED = os.environ.get('SALES_WRITE_BEHIND', '0') == '1'
+# Flush at least this often while events are pending, or as soon as
+# this many orders are waiting
+FLUSH_INTERVAL_MS = int(os.environ.get('SALES_WRITE_BEHIND_INTERVAL_MS', 200))
+FLUSH_MAX_EVENTS = int(os.environ.get('SALES_WRITE_BEHIND_MAX_EVENTS', 500))
+
+WATERMARK = 'sales_write_behind'
+
+_FOLD_SALES = '''
+    INSERT INTO sales_tracking (product_id, quantity_sold, total_revenue)
+    SELECT product_id, SUM(quantity), SUM(quantity * price)
+    FROM order_items
+    WHERE order_id > ? AND order_id <= ?
+    GROUP BY product_id
+    ON CONFLICT(product_id) DO UPDATE SET
+    quantity_sold = quantity_sold + excluded.quantity_sold,
+    total_revenue = total_revenue + excluded.total_revenue,
+    last_updated = CURRENT_TIMESTAMP
+'''
+
+
+def _watermark(conn):
+    try:
+        row = conn.execute('SELECT applied_order_id FROM bookkeeping_watermarks WHERE name = ?',
+                           (WATERMARK,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return None if row is None else row[0]
+
+
+def fold_orders(conn, after_id, upto_id):
+    """Add orders with after_id < id <= upto_id to sales_tracking and the rollups"""
+    conn.execute(_FOLD_SALES, (after_id, upto_id))
+    rollups.record_orders(conn, after_id, upto_id)
+
+
+def apply_pending(conn):
+    """
+    Fold every order committed since the watermark into sales_tracking
+    and the rollups, inside the caller's write transaction. Returns the
+    number of orders applied; 0 when nothing is pending or write-behind
+    is off.
+    """
+    applied = _watermark(conn)
+    latest = conn.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]
+    if applied is None or latest <= applied:
+        return 0
+
+    fold_orders(conn, applied, latest)
+    count = conn.execute('SELECT COUNT(*) FROM orders WHERE id > ? AND id <= ?',
+                         (applied, latest)).fetchone()[0]
+    conn.execute('UPDATE bookkeeping_watermarks SET applied_order_id = ? WHERE name = ?',
+                 (latest, WATERMARK))
+    return count
+
+
+def flush(conn):
+    """apply_pending in its own write transaction, skipped when nothing is pending"""
+    applied = _watermark(conn)
+    if applied is None:
+        return 0
+    latest = conn.execute('SELECT COALESCE(MAX(id), 0) FROM orders').fetchone()[0]
+    if latest <= applied:
+        return 0
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        count = apply_pending(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def catch_up(conn, enabled=None):
+    """
+    Startup reconciliation, run before serving. Replays orders a crashed
+    write-behind worker never applied. Turning write-behind on records
+    that everything so far was applied at checkout; turning it off
+    applies what is left and drops the watermark.
+    Returns the number of orders replayed.
+    """
+    enabled = ENABLED if enabled is None else enabled
+    replayed = flush(conn)
+    if enabled == (_watermark(conn) is not None):
+        return replayed
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if enabled:
+            conn.execute('''INSERT OR IGNORE INTO bookkeeping_watermarks (name, applied_order_id)
+                            SELECT ?, COALESCE(MAX(id), 0) FROM orders''', (WATERMARK,))
+        else:
+            conn.execute('DELETE FROM bookkeeping_watermarks WHERE name = ?', (WATERMARK,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return replayed
+
+
+class WriteBehindQueue:
+    """Counts committed orders and wakes the flush worker; one per process"""
+
+    def __init__(self, interval_ms=FLUSH_INTERVAL_MS, max_events=FLUSH_MAX_EVENTS):
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self._lock = threading.Condition()
+        self._pid = None
+        self._pending = 0
+        self._stopping = False
+        self._thread = None
+        self.generation = 0
+        self.flushes = 0
+        self.orders_applied = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    def _ensure_worker(self):
+        # A forked worker inherits no threads; each process runs its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = 0
+            self._thread = threading.Thread(target=self._run, name='sales-write-behind',
+                                            daemon=True)
+            self._thread.start()
+
+    def notify(self, order_id):
+        """Record that an order committed; flushes early once max_events are pending"""
+        with self._lock:
+            self._ensure_worker()
+            self._pending += 1
+            self._lock.notify()
+
+    def _run(self):
+        conn = db.connect()
+        try:
+            while True:
+                with self._lock:
+                    while not self._pending and not self._stopping:
+                        self._lock.wait()
+                    # Let events from concurrent checkouts gather for up to
+                    # one interval, or until a full batch is waiting
+                    deadline = time.monotonic() + self.interval
+                    while self._pending < self.max_events and not self._stopping:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._lock.wait(remaining)
+                    pending, self._pending = self._pending, 0
+                    stopping = self._stopping
+                if pending:
+                    self._flush(conn)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _flush(self, conn):
+        started = time.perf_counter()
+        try:
+            applied = flush(conn)
+        except Exception:
+            # Nothing is lost: the orders stay past the watermark and the
+            # next flush picks them up
+            with self._lock:
+                self.errors += 1
+                self._pending += 1
+            return
+        with self._lock:
+            self.flushes += 1
+            self.orders_applied += applied
+            self.generation += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def stop(self, timeout=5.0):
+        """Flush what is pending and stop the worker"""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            self._stopping = True
+            self._lock.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': ENABLED,
+                'pending': self._pending,
+                'flushes': self.flushes,
+                'orders_applied': self.orders_applied,
+                'errors': self.errors,
+                'last_flush_ms': self.last_flush_ms,
+                'interval_ms': round(self.interval * 1000),
+                'max_events': self.max_events,
+            }
+
+
+queue = WriteBehindQueue()